@@ -0,0 +1,722 @@
+"""Treemap benchmarks
+
+=== Module Description ===
+This module contains timing benchmarks for the treemap visualiser, run on
+synthetic data so the results can be reproduced on any computer.
+
+Run every benchmark with:
+    python benchmarks.py
+or only some of them by name, e.g.:
+    python benchmarks.py scan
+"""
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from random import paretovariate, randint, sample, seed
+
+import vector_layout
+from compact_tree import CompactTree
+from scan_cache import ScanCache
+from tree_data import AbstractTree, FileSystemTree, diff, squarify
+
+
+class SyntheticTree(AbstractTree):
+    """A tree of generated data, used to benchmark trees of any size."""
+    __slots__ = ()
+
+    def get_separator(self):
+        """Return the names from the root down to this node, separated by
+        slashes.
+
+        @type self: SyntheticTree
+        @rtype: str
+        """
+        names = []
+        node = self
+        while node is not None:
+            names.append(str(node.get_root()))
+            node = node._parent_tree
+        return '/'.join(reversed(names))
+
+
+def make_tree(leaves, fanout, cls=SyntheticTree):
+    """Return a tree of class <cls> with the given number of <leaves>, in
+    which every interior node has at most <fanout> children.
+
+    The leaves have random sizes between 1 and 1000.
+
+    @type leaves: int
+    @type fanout: int
+    @type cls: type
+    @rtype: AbstractTree
+    """
+    level = [cls('f{}'.format(i), [], randint(1, 1000))
+             for i in range(leaves)]
+    depth = 0
+    while len(level) > 1:
+        depth += 1
+        level = [cls('d{}_{}'.format(depth, i), level[i:i + fanout])
+                 for i in range(0, len(level), fanout)]
+    return level[0]
+
+
+def make_skewed_tree(leaves, fanout):
+    """Return a SyntheticTree like make_tree(leaves, fanout), but whose leaf
+    sizes follow a Pareto distribution, so that a few leaves are much
+    larger than the others.
+
+    @type leaves: int
+    @type fanout: int
+    @rtype: SyntheticTree
+    """
+    tree = make_tree(leaves, fanout)
+    for leaf in tree.generate_leafmap((0, 0, 1, 1)):
+        leaf.update_data_size(int(100 * paretovariate(1.16)) -
+                              leaf.data_size)
+    return tree
+
+
+def make_deep_tree(depth, leaves_per_level):
+    """Return a SyntheticTree shaped like a chain of <depth> folders, each
+    holding <leaves_per_level> files and the next folder.
+
+    @type depth: int
+    @type leaves_per_level: int
+    @rtype: SyntheticTree
+    """
+    tree = SyntheticTree('d{}'.format(depth), [
+        SyntheticTree('f', [], randint(1, 1000))
+        for _ in range(leaves_per_level)])
+    for level in range(depth - 1, 0, -1):
+        subtrees = [SyntheticTree('f', [], randint(1, 1000))
+                    for _ in range(leaves_per_level)]
+        subtrees.append(tree)
+        tree = SyntheticTree('d{}'.format(level), subtrees)
+    return tree
+
+
+def make_flat_tree(leaves, fanout):
+    """Return the parent indices, sizes and names of a tree shaped like
+    make_tree(leaves, fanout), numbered in breadth-first order.
+
+    @type leaves: int
+    @type fanout: int
+    @rtype: (list[int], list[int], list[str])
+    """
+    # the number of nodes on each level, from the leaves up
+    widths = [leaves]
+    while widths[-1] > 1:
+        widths.append((widths[-1] + fanout - 1) // fanout)
+    widths.reverse()
+    parent = [-1]
+    first = 0
+    for depth in range(1, len(widths)):
+        parent.extend(first + i // fanout for i in range(widths[depth]))
+        first += widths[depth - 1]
+    n = len(parent)
+    sizes = [0] * (n - leaves) + [randint(1, 1000) for _ in range(leaves)]
+    names = ['n{}'.format(i) for i in range(n)]
+    return parent, sizes, names
+
+
+def make_directory_tree(top, depth, fanout, files_per_dir):
+    """Create a synthetic folder structure under the existing folder <top>.
+
+    Every folder above the given <depth> contains <fanout> sub-folders, and
+    every folder contains <files_per_dir> small files of varying sizes.
+
+    @type top: str
+    @type depth: int
+    @type fanout: int
+    @type files_per_dir: int
+    @rtype: int
+        The number of files created.
+    """
+    count = 0
+    stack = [(top, depth)]
+    while stack:
+        folder, level = stack.pop()
+        for i in range(files_per_dir):
+            with open(os.path.join(folder, 'f{}.dat'.format(i)), 'wb') as f:
+                f.write(b'x' * (1 + (count * 37) % 200))
+            count += 1
+        if level > 0:
+            for i in range(fanout):
+                sub = os.path.join(folder, 'd{}'.format(i))
+                os.mkdir(sub)
+                stack.append((sub, level - 1))
+    return count
+
+
+def _best_of(repeat, func, *args):
+    """Return the fastest of <repeat> timed calls of func(*args), in seconds.
+
+    @type repeat: int
+    @type func: callable
+    @rtype: float
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def _time_full_layout(tree, rect, engine=None, min_area=0, repeat=3):
+    """Return the fastest of <repeat> layouts of <tree> in <rect>, in
+    seconds. The layout caches are cleared before each of them, so that
+    every subtree is laid out again.
+
+    @type tree: AbstractTree
+    @type rect: (int, int, int, int)
+    @type engine: function | None
+    @type min_area: int
+    @type repeat: int
+    @rtype: float
+    """
+    nodes = [tree]
+    for node in nodes:
+        nodes.extend(node._subtrees)
+    best = None
+    for _ in range(repeat):
+        for node in nodes:
+            node._layout_cache = None
+        start = time.perf_counter()
+        tree.generate_layout(rect, engine, min_area)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def _time_changes(rect, count, spread, batched):
+    """Return the time taken to apply <count> random size changes to a run
+    of <spread> neighbouring leaves of a new 300k-leaf tree laid out in
+    <rect>, with apply_changes if <batched>, or else with one
+    update_data_size call per change.
+
+    @type rect: (int, int, int, int)
+    @type count: int
+    @type spread: int
+    @type batched: bool
+    @rtype: float
+    """
+    tree = make_tree(300000, 5)
+    leaves = tree.generate_leafmap(rect)
+    first = randint(0, len(leaves) - spread)
+    changes = [(leaves[first + randint(0, spread - 1)], randint(1, 9))
+               for _ in range(count)]
+    gc.collect()
+    start = time.perf_counter()
+    if batched:
+        tree.apply_changes(changes)
+    else:
+        for leaf, size_increment in changes:
+            leaf.update_data_size(size_increment)
+    return time.perf_counter() - start
+
+
+def bench_scan():
+    """Compare the FileSystemTree constructor with the scandir builder,
+    serially and with thread pools of several sizes.
+
+    @rtype: None
+    """
+    top = tempfile.mkdtemp()
+    try:
+        files = make_directory_tree(top, 4, 6, 20)
+        print('scan: {} files in {}'.format(files, top))
+        print('  {:<28}{:>10.3f} s'.format(
+            'FileSystemTree(path)', _best_of(3, FileSystemTree, top)))
+        for workers in (1, 2, 4, 8, 16):
+            label = 'from_path(workers={})'.format(workers)
+            print('  {:<28}{:>10.3f} s'.format(
+                label, _best_of(3, FileSystemTree.from_path, top, workers)))
+    finally:
+        shutil.rmtree(top)
+
+
+def bench_scan_cache():
+    """Time a cold scan and a warm rescan through a ScanCache, after
+    adding one file.
+
+    @rtype: None
+    """
+    top = tempfile.mkdtemp()
+    cache_path = os.path.join(tempfile.mkdtemp(), 'cache.json')
+    try:
+        files = make_directory_tree(top, 4, 6, 20)
+        # let the folder mtimes settle so the cache trusts them
+        past = time.time_ns() - 60 * 10 ** 9
+        for folder, _, _ in os.walk(top):
+            os.utime(folder, ns=(past, past))
+        print('scan_cache: {} files in {}'.format(files, top))
+        for label in ('cold', 'warm'):
+            cache = ScanCache(cache_path)
+            start = time.perf_counter()
+            FileSystemTree.from_path(top, cache=cache)
+            elapsed = time.perf_counter() - start
+            cache.save()
+            print('  {:<6}{:>8.3f} s  {}'.format(label, elapsed,
+                                                 cache.stats()))
+            with open(os.path.join(top, 'd0', 'new.dat'), 'wb') as f:
+                f.write(b'new')
+    finally:
+        shutil.rmtree(top)
+        shutil.rmtree(os.path.dirname(cache_path))
+
+
+def bench_compact():
+    """Compare the memory used by a 1M-node tree of AbstractTree objects
+    with the same tree stored as a CompactTree.
+
+    @rtype: None
+    """
+    leaves, fanout = 950000, 20
+    tracemalloc.start()
+    tree = make_tree(leaves, fanout)
+    objects = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del tree
+
+    parent, sizes, names = make_flat_tree(leaves, fanout)
+    tracemalloc.start()
+    compact = CompactTree.from_arrays(parent, sizes, names)
+    arrays = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    nodes = len(parent)
+    print('compact: {} nodes'.format(nodes))
+    print('  {:<16}{:>10.1f} MB {:>8.1f} bytes/node'.format(
+        'AbstractTree', objects / 2 ** 20, objects / nodes))
+    print('  {:<16}{:>10.1f} MB {:>8.1f} bytes/node'.format(
+        'CompactTree', arrays / 2 ** 20, arrays / nodes))
+    start = time.perf_counter()
+    compact.generate_treemap((0, 0, 1024, 738))
+    print('  CompactTree.generate_treemap {:.3f} s'.format(
+        time.perf_counter() - start))
+
+
+def scale_example_data(copies):
+    """Return a FileSystemTree holding <copies> copies of the example-data
+    folder 'B' under one root, without touching the disk again.
+
+    @type copies: int
+    @rtype: FileSystemTree
+    """
+    template = FileSystemTree.from_path(os.path.join('example-data', 'B'))
+
+    def clone(node):
+        """Return a copy of <node> and everything below it."""
+        subtrees = [clone(subtree) for subtree in node._subtrees]
+        copy = FileSystemTree.__new__(FileSystemTree)
+        AbstractTree.__init__(copy, node.get_root(), subtrees, node.data_size)
+        return copy
+
+    root = FileSystemTree.__new__(FileSystemTree)
+    AbstractTree.__init__(root, 'root', [clone(template)
+                                         for _ in range(copies)])
+    return root
+
+
+def bench_slots():
+    """Measure the memory used per node, and the time taken to build, a
+    tree of 1M FileSystemTree nodes made of copies of the example data.
+
+    @rtype: None
+    """
+    copies = 160000
+    nodes = 1 + copies * 6
+    start = time.perf_counter()
+    tree = scale_example_data(copies)
+    elapsed = time.perf_counter() - start
+    del tree
+    tracemalloc.start()
+    tree = scale_example_data(copies)
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print('slots: {} nodes'.format(nodes))
+    print('  build {:.3f} s, {:.1f} bytes/node'.format(elapsed, used / nodes))
+
+
+def bench_find_leaf():
+    """Measure clicks per second with find_leaf on a 1M-leaf tree, against
+    a linear scan of the whole layout.
+
+    @rtype: None
+    """
+    tree = make_tree(1000000, 20)
+    width, height = 1024, 738
+    points = [(randint(0, width), randint(0, height)) for _ in range(2000)]
+
+    start = time.perf_counter()
+    layout = tree.generate_layout((0, 0, width, height))
+    x, y = points[0]
+    for rect, _, _ in layout:
+        if rect[0] <= x <= rect[0] + rect[2] and \
+                rect[1] <= y <= rect[1] + rect[3]:
+            break
+    linear = time.perf_counter() - start
+    del layout
+
+    start = time.perf_counter()
+    for point in points:
+        tree.find_leaf(point, width, height)
+    indexed = time.perf_counter() - start
+
+    print('find_leaf: 1000000 leaves, {} random clicks'.format(len(points)))
+    print('  {:<22}{:>12.1f} clicks/s'.format('layout + linear scan',
+                                              1 / linear))
+    print('  {:<22}{:>12.1f} clicks/s'.format('LayoutIndex',
+                                              len(points) / indexed))
+
+
+def bench_layout_cache():
+    """Compare a full layout of a 300k-leaf tree with the relayout after
+    a single leaf has grown by 1%.
+
+    @rtype: None
+    """
+    tree = make_tree(300000, 10)
+    rect = (0, 0, 1024, 738)
+    gc.collect()
+    start = time.perf_counter()
+    tree.generate_treemap(rect)
+    full = time.perf_counter() - start
+
+    leaves = tree.generate_leafmap(rect)
+    times = []
+    for _ in range(21):
+        leaves[randint(0, len(leaves) - 1)].increase_data_size()
+        gc.collect()
+        start = time.perf_counter()
+        tree.generate_treemap(rect)
+        times.append(time.perf_counter() - start)
+    times.sort()
+
+    print('layout_cache: 300000 leaves')
+    print('  {:<34}{:>8.3f} s'.format('full layout', full))
+    print('  {:<34}{:>8.3f} s'.format('relayout after one leaf edit '
+                                      '(median)', times[len(times) // 2]))
+    print('  {:<34}{:>8.3f} s'.format('  best', times[0]))
+    print('  {:<34}{:>8.3f} s'.format('  worst', times[-1]))
+
+
+def bench_apply_changes():
+    """Compare applying a batch of leaf size changes one update_data_size
+    call at a time with applying it with apply_changes, on a tree of 300k
+    leaves that has been laid out. The changes are spread over all of the
+    leaves, or over a run of neighbouring leaves (as when the files of a
+    few folders keep changing).
+
+    @rtype: None
+    """
+    rect = (0, 0, 1024, 738)
+    print('apply_changes: 300000 leaves, 8 levels')
+    print('  {:>9}{:>11}{:>20}{:>16}'.format(
+        'changes', 'leaves', 'update_data_size', 'apply_changes'))
+    for count, spread in ((10000, 300000), (100000, 300000),
+                          (10000, 500), (100000, 5000)):
+        times = [_time_changes(rect, count, spread, batched)
+                 for batched in (False, True)]
+        print('  {:>9}{:>11}{:>18.4f} s{:>14.4f} s'.format(count, spread,
+                                                         *times))
+
+
+
+def bench_compaction():
+    """Time a full layout of a 300k-leaf tree after a random sample of its
+    leaves have been deleted, before and after compact(), and measure the
+    memory freed.
+
+    @rtype: None
+    """
+    rect = (0, 0, 1024, 738)
+
+    def deleted_tree(fraction):
+        tree = make_tree(300000, 10)
+        leaves = tree.generate_leafmap(rect)
+        for leaf in sample(leaves, int(fraction * len(leaves))):
+            leaf.delete_leaf()
+        return tree
+
+    print('compaction: 300000 leaves')
+    print('  {:>9}{:>14}{:>14}{:>12}{:>12}'.format(
+        'deleted', 'layout', 'compacted', 'compact()', 'freed'))
+    for fraction in (0.5, 0.9, 0.99):
+        tree = deleted_tree(fraction)
+        before = _time_full_layout(tree, rect)
+        start = time.perf_counter()
+        tree.compact()
+        elapsed = time.perf_counter() - start
+        after = _time_full_layout(tree, rect)
+        del tree
+
+        # the memory is measured separately, as tracing slows everything
+        tracemalloc.start()
+        tree = deleted_tree(fraction)
+        # replaces the records that still refer to the deleted leaves
+        tree.generate_treemap(rect)
+        gc.collect()
+        used = tracemalloc.get_traced_memory()[0]
+        tree.compact()
+        gc.collect()
+        freed = used - tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print('  {:>8.0%}{:>12.3f} s{:>12.3f} s{:>10.3f} s{:>9.1f} MB'
+              .format(fraction, before, after, elapsed, freed / 2 ** 20))
+
+
+def bench_diff():
+    """Time diff between two copies of a 300k-leaf tree in which some
+    random leaves of the second copy have changed size, with and without
+    signatures, and the time taken to compute the signatures in full and
+    again after the changes.
+
+    @rtype: None
+    """
+    rect = (0, 0, 1024, 738)
+
+    def copies(changes):
+        seed(1)
+        old = make_tree(300000, 10)
+        seed(1)
+        new = make_tree(300000, 10)
+        for leaf in sample(new.generate_leafmap(rect), changes):
+            leaf.update_data_size(1)
+        return old, new
+
+    print('diff: 300000 leaves')
+    print('  {:>9}{:>14}{:>14}{:>14}{:>14}'.format(
+        'changes', 'unsigned', 'sign all', 'sign again', 'signed'))
+    for changes in (1, 100, 10000):
+        old, new = copies(changes)
+        unsigned = _best_of(3, diff, old, new)
+        start = time.perf_counter()
+        old.update_signatures()
+        sign_all = time.perf_counter() - start
+        new.update_signatures()
+        # the signatures of the changed leaves and their ancestors only
+        for leaf in sample(new.generate_leafmap(rect), changes):
+            leaf.update_data_size(0)
+        start = time.perf_counter()
+        new.update_signatures()
+        sign_again = time.perf_counter() - start
+        signed = _best_of(3, diff, old, new)
+        print('  {:>9}{:>12.4f} s{:>12.4f} s{:>12.4f} s{:>12.4f} s'.format(
+            changes, unsigned, sign_all, sign_again, signed))
+
+
+def bench_vector_layout():
+    """Compare the recursive layout with the NumPy layout of
+    vector_layout, at 10k, 100k and 1M leaves.
+
+    The layout caches are cleared before each recursive layout, so that
+    every subtree is laid out again.
+
+    @rtype: None
+    """
+    rect = (0, 0, 1024, 738)
+    print('vector_layout: time per layout')
+    print('  {:>9}{:>12}{:>12}{:>14}'.format('leaves', 'recursive',
+                                             'numpy', 'arrays'))
+    for leaves in (10000, 100000, 1000000):
+        tree = make_tree(leaves, 10)
+        recursive = _time_full_layout(tree, rect)
+        vector = _best_of(3, vector_layout.generate_layout, tree, rect)
+        arrays = _best_of(3, vector_layout.treemap_arrays, tree, rect)
+        print('  {:>9}{:>10.3f} s{:>10.3f} s{:>12.3f} s'.format(
+            leaves, recursive, vector, arrays))
+
+
+def bench_squarify():
+    """Compare the layout time and the shape of the rectangles made by
+    slice_and_dice and squarify, on skewed trees of different depths.
+
+    The quality measure is the mean aspect ratio (longer side / shorter
+    side, 1 for a square) of the rectangles with a positive area; the
+    rectangles with no area are counted separately, as they are invisible.
+
+    @rtype: None
+    """
+    rect = (0, 0, 1024, 738)
+    print('squarify: skewed trees, 100000 leaves')
+    print('  {:>6}  {:<16}{:>10}{:>14}{:>12}'.format(
+        'fanout', 'engine', 'time', 'mean aspect', 'invisible'))
+    for fanout in (4, 16, 100):
+        tree = make_skewed_tree(100000, fanout)
+        for name, engine in (('slice_and_dice', None),
+                             ('squarify', squarify)):
+            elapsed = _time_full_layout(tree, rect, engine)
+            rects = [r for r, _ in tree.generate_treemap(rect, engine)]
+            ratios = [max(w, h) / min(w, h) for _, _, w, h in rects
+                      if w > 0 and h > 0]
+            print('  {:>6}  {:<16}{:>8.3f} s{:>14.1f}{:>12}'.format(
+                fanout, name, elapsed, sum(ratios) / len(ratios),
+                len(rects) - len(ratios)))
+
+
+def bench_min_area():
+    """Measure the layout time and the number of rectangles drawn at
+    1024x738 with and without level-of-detail culling, as the tree grows.
+
+    @rtype: None
+    """
+    rect = (0, 0, 1024, 738)
+    print('min_area: layout at 1024x738')
+    print('  {:>9}{:>10}{:>12}{:>12}'.format('leaves', 'min_area', 'time',
+                                             'rectangles'))
+    for leaves in (10000, 100000, 1000000):
+        tree = make_tree(leaves, 10)
+        for min_area in (0, 1, 16):
+            elapsed = _time_full_layout(tree, rect, None, min_area)
+            count = len(tree.generate_layout(rect, None, min_area))
+            print('  {:>9}{:>10}{:>10.3f} s{:>12}'.format(
+                leaves, min_area, elapsed, count))
+
+
+def bench_iter_treemap():
+    """Compare the peak memory and time of generate_treemap with those of
+    consuming iter_treemap, on a tree deeper than the recursion limit.
+
+    @rtype: None
+    """
+    tree = make_deep_tree(5000, 40)
+    rect = (0, 0, 1024, 738)
+    print('iter_treemap: chain of 5000 folders, 200000 leaves')
+    for name, func in (('generate_treemap', tree.generate_treemap),
+                       ('iter_treemap', tree.iter_treemap)):
+        # frees the previous layout, so no layout cache can be used
+        tree._layout_cache = None
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        count = 0
+        for _ in func(rect):
+            count += 1
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('  {:<18}{:>8} rects{:>8.2f} s{:>10.1f} MB peak'.format(
+            name, count, elapsed, peak / 2 ** 20))
+
+
+def bench_render():
+    """Measure the frame time of the visualiser (on SDL's dummy video
+    driver) for a full redraw, a selection change and a colour change,
+    as the tree grows.
+
+    @rtype: None
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    import treemap_visualiser as vis
+    pygame.init()
+    screen = pygame.display.set_mode((vis.WIDTH, vis.HEIGHT))
+    rect = (0, 0, vis.WIDTH, vis.TREEMAP_HEIGHT)
+    print('render: frame time')
+    print('  {:>9}{:>14}{:>14}{:>14}'.format('leaves', 'full redraw',
+                                             'selection', 'one colour'))
+    for leaves in (10000, 100000, 1000000):
+        tree = make_tree(leaves, 10)
+        canvas = vis.TreemapCanvas()
+        full = _best_of(1, vis.render_display, screen, tree, '', None,
+                        canvas)
+        selection = _best_of(3, vis.render_text, screen, tree, 'a/b/c (1)')
+        leaf = tree.generate_leafmap(rect)[leaves // 2]
+        colour = _best_of(3, lambda: (setattr(leaf, 'colour', (
+            randint(0, 255), 0, 0)), vis.render_display(
+                screen, tree, '', None, canvas)))
+        print('  {:>9}{:>12.4f} s{:>12.4f} s{:>12.4f} s'.format(
+            leaves, full, selection, colour))
+
+
+def bench_raster():
+    """Compare drawing a treemap with one pygame.draw.rect call per
+    rectangle with the bulk rasteriser, fed either with the list from
+    generate_treemap or with the arrays from vector_layout.
+
+    @rtype: None
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    import raster
+    pygame.init()
+    rect = (0, 0, 1024, 738)
+    surface = pygame.Surface(rect[2:])
+
+    def draw_each(treemap):
+        for leaf_rect, colour in treemap:
+            pygame.draw.rect(surface, colour, leaf_rect)
+
+    print('raster: draw time (vector_layout time in brackets)')
+    print('  {:>9}{:>14}{:>14}{:>22}'.format(
+        'leaves', 'draw.rect', 'bulk, list', 'bulk, arrays'))
+    for leaves in (10000, 100000, 1000000):
+        tree = make_tree(leaves, 10)
+        treemap = tree.generate_treemap(rect)
+        each = _best_of(3, draw_each, treemap)
+        bulk = _best_of(3, raster.draw_treemap, surface, treemap)
+        del treemap
+        start = time.perf_counter()
+        arrays = vector_layout.treemap_arrays(tree, rect)
+        layout = time.perf_counter() - start
+        from_arrays = _best_of(3, raster.fill_arrays, surface, *arrays)
+        print('  {:>9}{:>12.4f} s{:>12.4f} s{:>12.4f} s ({:.3f} s)'.format(
+            leaves, each, bulk, from_arrays, layout))
+
+
+def bench_render_farm():
+    """Time a batch of snapshots of several folders at three sizes with
+    pools of one and more worker processes.
+
+    @rtype: None
+    """
+    import render_farm
+    tops = [tempfile.mkdtemp() for _ in range(8)]
+    out_dir = tempfile.mkdtemp()
+    sizes = [(320, 200), (1920, 1080), (3840, 2160)]
+    try:
+        files = sum(make_directory_tree(top, 3, 6, 20) for top in tops)
+        print('render_farm: {} roots, {} files, {} sizes, {} processors'
+              .format(len(tops), files, len(sizes), os.cpu_count()))
+        for workers in (1, 2, 4, 8):
+            start = time.perf_counter()
+            render_farm.render_batch(tops, sizes, out_dir, workers)
+            elapsed = time.perf_counter() - start
+            print('  {:>2} workers{:>10.3f} s{:>10.2f} images/s'.format(
+                workers, elapsed, len(tops) * len(sizes) / elapsed))
+    finally:
+        for top in tops + [out_dir]:
+            shutil.rmtree(top)
+
+
+BENCHMARKS = {
+    'apply_changes': bench_apply_changes,
+    'find_leaf': bench_find_leaf,
+    'iter_treemap': bench_iter_treemap,
+    'layout_cache': bench_layout_cache,
+    'min_area': bench_min_area,
+    'raster': bench_raster,
+    'render': bench_render,
+    'render_farm': bench_render_farm,
+    'compact': bench_compact,
+    'compaction': bench_compaction,
+    'diff': bench_diff,
+    'scan': bench_scan,
+    'scan_cache': bench_scan_cache,
+    'slots': bench_slots,
+    'squarify': bench_squarify,
+    'vector_layout': bench_vector_layout,
+}
+
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or sorted(BENCHMARKS):
+        BENCHMARKS[name]()
@@ -0,0 +1,564 @@
+"""Array-backed trees for the treemap visualiser
+
+=== Module Description ===
+This module contains CompactTree, a tree compatible with the treemap
+visualiser that keeps all of its nodes in a handful of flat arrays from the
+standard library array module, instead of one Python object per node.
+
+Nodes are numbered in breadth-first order, so the children of a node are
+stored next to each other and can be described by the index of the first
+child and the number of children. The names of all nodes are joined into
+a single string, and each node records where its name starts.
+
+A CompactTree object is only a view of one node of the shared arrays; new
+views are created on demand (e.g. by find_leaf), and two views of the same
+node compare equal.
+"""
+import math
+import os
+from array import array
+from random import randint
+
+from tree_data import FileSystemTree
+
+
+class _TreeArrays:
+    """The flat storage shared by all views of one compact tree.
+
+    Node i is described by the i-th element of each array.
+
+    === Public Attributes ===
+    @type parent: array[int]
+        The index of each node's parent, or -1 for the root.
+    @type first_child: array[int]
+        The index of each node's first child (meaningless if it has none).
+    @type child_count: array[int]
+        The number of children of each node.
+    @type size: array[int]
+        The data size of each node.
+    @type colour: array[int]
+        The colour of each node, packed as 0xRRGGBB.
+    @type alive: array[int]
+        1 for each node that has not been deleted, 0 otherwise.
+    @type name_offset: array[int]
+        Where each node's name starts in names; the name of node i ends
+        where the name of node i + 1 starts.
+    @type names: str
+        The names of all nodes, concatenated in index order.
+    @type separator: str
+        The string placed between names by get_separator.
+    """
+    def __init__(self, separator):
+        """Initialize a new, empty _TreeArrays.
+
+        @type self: _TreeArrays
+        @type separator: str
+        @rtype: None
+        """
+        self.parent = array('q')
+        self.first_child = array('q')
+        self.child_count = array('q')
+        self.size = array('q')
+        self.colour = array('I')
+        self.alive = array('b')
+        self.name_offset = array('q', [0])
+        self.names = ''
+        self.separator = separator
+
+    def __len__(self):
+        """Return the number of nodes stored.
+
+        @type self: _TreeArrays
+        @rtype: int
+        """
+        return len(self.size)
+
+    def name(self, i):
+        """Return the name of node <i>.
+
+        @type self: _TreeArrays
+        @type i: int
+        @rtype: str
+        """
+        return self.names[self.name_offset[i]:self.name_offset[i + 1]]
+
+
+class CompactTree:
+    """A view of one node of an array-backed tree.
+
+    It offers the public interface of AbstractTree used by the treemap
+    visualiser, so a CompactTree can be shown with run_visualisation.
+
+    === Private Attributes ===
+    @type _arrays: _TreeArrays
+        The storage holding every node of the tree.
+    @type _index: int
+        The index of this node in _arrays.
+    """
+    def __init__(self, arrays, index=0):
+        """Initialize a view of node <index> in <arrays>.
+
+        @type self: CompactTree
+        @type arrays: _TreeArrays
+        @type index: int
+        @rtype: None
+        """
+        self._arrays = arrays
+        self._index = index
+
+    @classmethod
+    def from_tree(cls, tree, separator=None):
+        """Return a CompactTree holding a copy of <tree>.
+
+        Empty subtrees are not copied. The colours are kept. If no
+        <separator> is given, the one used by tree.get_separator() is
+        guessed: os.sep for a FileSystemTree and '/' otherwise.
+
+        @type cls: type
+        @type tree: AbstractTree
+        @type separator: str | None
+        @rtype: CompactTree
+        """
+        if separator is None:
+            separator = os.sep if isinstance(tree, FileSystemTree) else '/'
+        arrays = _TreeArrays(separator)
+        names = []
+        name_end = 0
+        # Breadth-first: the queue holds (node, parent index)
+        queue = [(tree, -1)]
+        head = 0
+        while head < len(queue):
+            node, parent = queue[head]
+            children = [subtree for subtree in node.get_subtrees()
+                        if not subtree.is_empty()]
+            arrays.parent.append(parent)
+            arrays.first_child.append(len(queue))
+            arrays.child_count.append(len(children))
+            arrays.size.append(node.data_size)
+            r, g, b = node.colour
+            arrays.colour.append((r << 16) | (g << 8) | b)
+            arrays.alive.append(0 if node.is_empty() else 1)
+            name = '' if node.is_empty() else str(node.get_root())
+            names.append(name)
+            name_end += len(name)
+            arrays.name_offset.append(name_end)
+            for child in children:
+                queue.append((child, head))
+            queue[head] = None
+            head += 1
+        arrays.names = ''.join(names)
+        return cls(arrays)
+
+    @classmethod
+    def from_arrays(cls, parent, sizes, names, separator='/'):
+        """Return a CompactTree built directly from flat data.
+
+        Node 0 is the root, and <parent> gives the index of the parent of
+        every other node. Parents must come before their children, and the
+        children of each node must have consecutive indices. Leaves take
+        their size from <sizes>; the sizes of interior nodes are computed.
+        Each node is given a random colour.
+
+        @type cls: type
+        @type parent: list[int]
+        @type sizes: list[int]
+        @type names: list[str]
+        @type separator: str
+        @rtype: CompactTree
+        """
+        n = len(parent)
+        arrays = _TreeArrays(separator)
+        arrays.parent = array('q', parent)
+        arrays.first_child = array('q', [0]) * n
+        arrays.child_count = array('q', [0]) * n
+        for i in range(n - 1, 0, -1):
+            arrays.first_child[parent[i]] = i
+            arrays.child_count[parent[i]] += 1
+        arrays.size = array('q', sizes)
+        # children come after their parents, so go backwards
+        for i in range(n - 1, -1, -1):
+            if arrays.child_count[i] > 0:
+                start = arrays.first_child[i]
+                arrays.size[i] = sum(arrays.size[start:start +
+                                                 arrays.child_count[i]])
+        arrays.colour = array('I', [randint(0, 0xFFFFFF) for _ in range(n)])
+        arrays.alive = array('b', [1]) * n
+        offsets = [0]
+        for name in names:
+            offsets.append(offsets[-1] + len(name))
+        arrays.name_offset = array('q', offsets)
+        arrays.names = ''.join(names)
+        return cls(arrays)
+
+    # Attributes shared with AbstractTree =====================================
+    @property
+    def data_size(self):
+        """The total size of all leaves of this tree.
+
+        @type self: CompactTree
+        @rtype: int
+        """
+        return self._arrays.size[self._index]
+
+    @property
+    def colour(self):
+        """The RGB colour value of the root of this tree.
+
+        @type self: CompactTree
+        @rtype: (int, int, int)
+        """
+        packed = self._arrays.colour[self._index]
+        return packed >> 16, (packed >> 8) & 0xFF, packed & 0xFF
+
+    @property
+    def packed_colour(self):
+        """The colour of the root of this tree, packed as 0xRRGGBB.
+
+        @type self: CompactTree
+        @rtype: int
+        """
+        return self._arrays.colour[self._index]
+
+    def is_empty(self):
+        """Return True if this tree is empty (i.e. it has been deleted).
+
+        @type self: CompactTree
+        @rtype: bool
+        """
+        return not self._arrays.alive[self._index]
+
+    def get_root(self):
+        """Return the name stored at the root of this tree, or None if it
+        is empty.
+
+        @type self: CompactTree
+        @rtype: str | None
+        """
+        if self.is_empty():
+            return None
+        return self._arrays.name(self._index)
+
+    def get_parent(self):
+        """Return the tree this one is a subtree of, or None if it is the
+        root of the whole tree or has been deleted.
+
+        @type self: CompactTree
+        @rtype: CompactTree | None
+        """
+        parent = self._arrays.parent[self._index]
+        if parent == -1 or self.is_empty():
+            return None
+        return CompactTree(self._arrays, parent)
+
+    def get_subtrees(self):
+        """Return the subtrees of this tree, including the deleted ones, or
+        an empty list if it has been deleted.
+
+        @type self: CompactTree
+        @rtype: list[CompactTree]
+        """
+        if self.is_empty():
+            return []
+        start = self._arrays.first_child[self._index]
+        return [CompactTree(self._arrays, c) for c in
+                range(start, start + self._arrays.child_count[self._index])]
+
+    def get_non_empty_leaves(self):
+        """Return the subtrees of this tree that are neither deleted nor of
+        size 0, like AbstractTree.get_non_empty_leaves.
+
+        @type self: CompactTree
+        @rtype: list[CompactTree]
+        """
+        return [CompactTree(self._arrays, c)
+                for c in self._live_children(self._index)]
+
+    def get_separator(self):
+        """Return the names from the root of the whole tree down to this
+        node, separated by the tree's separator.
+
+        @type self: CompactTree
+        @rtype: str
+        """
+        arrays = self._arrays
+        names = []
+        i = self._index
+        while i != -1:
+            names.append(arrays.name(i))
+            i = arrays.parent[i]
+        names.reverse()
+        return arrays.separator.join(names)
+
+    def __eq__(self, other):
+        """Return True if <other> is a view of the same node.
+
+        @type self: CompactTree
+        @type other: object
+        @rtype: bool
+        """
+        return isinstance(other, CompactTree) and \
+            self._arrays is other._arrays and self._index == other._index
+
+    def __hash__(self):
+        """Return a hash consistent with __eq__.
+
+        @type self: CompactTree
+        @rtype: int
+        """
+        return hash((id(self._arrays), self._index))
+
+    # Treemap ================================================================
+    def generate_treemap(self, rect, engine=None, min_area=0):
+        """Run the treemap algorithm on this tree and return the rectangles.
+
+        The result is the same as AbstractTree.generate_treemap, with the
+        same <engine> and <min_area>, on the tree this one was copied from.
+
+        @type self: CompactTree
+        @type rect: (int, int, int, int)
+        @type engine: ((CompactTree, (int, int, int, int)) ->
+                       list[(CompactTree, (int, int, int, int))]) | None
+            The layout engine, slice_and_dice if None
+        @type min_area: int
+            The smallest area (in pixels) of a subtree that is divided
+        @rtype: list[((int, int, int, int), (int, int, int))]
+        """
+        return list(self.iter_treemap(rect, engine, min_area))
+
+    def iter_treemap(self, rect, engine=None, min_area=0):
+        """Yield the rectangles and colours of generate_treemap one at a
+        time, in the same order.
+
+        @type self: CompactTree
+        @type rect: (int, int, int, int)
+        @type engine: ((CompactTree, (int, int, int, int)) ->
+                       list[(CompactTree, (int, int, int, int))]) | None
+        @type min_area: int
+        @rtype: collections.Iterable[((int, int, int, int), (int, int, int))]
+        """
+        colour = self._arrays.colour
+        for leaf_rect, i in self._layout(rect, engine, min_area):
+            yield leaf_rect, (colour[i] >> 16, (colour[i] >> 8) & 0xFF,
+                              colour[i] & 0xFF)
+
+    def generate_leafmap(self, rect, engine=None, min_area=0):
+        """Run the treemap algorithm on this tree and return the leaves (or
+        aggregates), in the same order as the rectangles of
+        generate_treemap.
+
+        @type self: CompactTree
+        @type rect: (int, int, int, int)
+        @type engine: ((CompactTree, (int, int, int, int)) ->
+                       list[(CompactTree, (int, int, int, int))]) | None
+        @type min_area: int
+        @rtype: list[CompactTree]
+        """
+        return [CompactTree(self._arrays, i)
+                for _, i in self._layout(rect, engine, min_area)]
+
+    def find_leaf(self, coordinates, width, height, engine=None,
+                  min_area=0):
+        """Return the leaf whose rectangle contains <coordinates> when the
+        tree is drawn in a display of the given size, or None.
+
+        Like AbstractTree.find_leaf, the subtree drawn as an aggregate is
+        returned for a point inside it. Only the nodes on the way from the
+        root to the leaf are laid out.
+
+        @type self: CompactTree
+        @type coordinates: (int, int)
+        @type width: int
+        @type height: int
+        @type engine: ((CompactTree, (int, int, int, int)) ->
+                       list[(CompactTree, (int, int, int, int))]) | None
+        @type min_area: int
+        @rtype: CompactTree | None
+        """
+        x, y = coordinates
+        if not (0 <= x <= width and 0 <= y <= height):
+            return None
+        arrays = self._arrays
+        i = self._index
+        rect = (0, 0, width, height)
+        if not arrays.alive[i] or arrays.size[i] == 0:
+            return None
+        while i is not None:
+            if rect[2] * rect[3] < min_area:
+                if rect[2] <= 0 or rect[3] <= 0:
+                    return None
+                return CompactTree(arrays, i)
+            if arrays.child_count[i] == 0:
+                return CompactTree(arrays, i)
+            i, rect = self._child_at(i, rect, coordinates, engine, min_area)
+        return None
+
+    def _child_at(self, i, rect, coordinates, engine, min_area):
+        """Return the index and rectangle of the first drawn child of node
+        <i>, laid out in <rect>, whose rectangle contains <coordinates>, or
+        (None, None) if there is none.
+
+        @type self: CompactTree
+        @type i: int
+        @type rect: (int, int, int, int)
+        @type coordinates: (int, int)
+        @type engine: function | None
+        @type min_area: int
+        @rtype: (int | None, (int, int, int, int) | None)
+        """
+        x, y = coordinates
+        for child, (cx, cy, cw, ch) in self._children(i, rect, engine):
+            if min_area > 0 and (cw <= 0 or ch <= 0):
+                # not drawn
+                continue
+            if cx <= x <= cx + cw and cy <= y <= cy + ch:
+                return child, (cx, cy, cw, ch)
+        return None, None
+
+    def _layout(self, rect, engine=None, min_area=0):
+        """Yield (rect, node index) for every leaf (or aggregate) drawn, in
+        the order of AbstractTree.generate_treemap.
+
+        @type self: CompactTree
+        @type rect: (int, int, int, int)
+        @type engine: function | None
+        @type min_area: int
+        @rtype: collections.Iterable[((int, int, int, int), int)]
+        """
+        arrays = self._arrays
+        stack = [(self._index, tuple(rect))]
+        while stack:
+            i, rect = stack.pop()
+            if not arrays.alive[i] or arrays.size[i] == 0:
+                continue
+            if rect[2] * rect[3] < min_area:
+                # too small to be divided: one aggregate, if it has pixels
+                if rect[2] > 0 and rect[3] > 0 and arrays.size[i] > 0:
+                    yield rect, i
+            elif arrays.child_count[i] == 0:
+                if arrays.size[i] > 0:
+                    yield rect, i
+            else:
+                stack.extend(reversed(self._children(i, rect, engine)))
+
+    def _children(self, i, rect, engine):
+        """Divide <rect> among the non-empty children of node <i> with
+        <engine>, or slice and dice if it is None.
+
+        @type self: CompactTree
+        @type i: int
+        @type rect: (int, int, int, int)
+        @type engine: function | None
+        @rtype: list[(int, (int, int, int, int))]
+        """
+        if engine is None:
+            return self._split(i, rect)
+        # the engine works on views; find the index of each one it returns
+        indices = {CompactTree(self._arrays, c): c
+                   for c in self._live_children(i)}
+        return [(indices[child], child_rect) for child, child_rect
+                in engine(CompactTree(self._arrays, i), rect)]
+
+    def _live_children(self, i):
+        """Return the indices of the children of node <i> that are neither
+        deleted nor of size 0.
+
+        @type self: CompactTree
+        @type i: int
+        @rtype: list[int]
+        """
+        arrays = self._arrays
+        start = arrays.first_child[i]
+        return [c for c in range(start, start + arrays.child_count[i])
+                if arrays.alive[c] and arrays.size[c] != 0]
+
+    def _split(self, i, rect):
+        """Divide <rect> among the non-empty children of node <i>, in
+        proportion to their sizes. The last child covers the remainder.
+
+        @type self: CompactTree
+        @type i: int
+        @type rect: (int, int, int, int)
+        @rtype: list[(int, (int, int, int, int))]
+        """
+        size = self._arrays.size
+        children = self._live_children(i)
+        total = size[i]
+        x, y, width, height = rect
+        result = []
+        offset = 0
+        last = len(children) - 1
+        for k, c in enumerate(children):
+            if width > height:
+                if k == last:
+                    adj_width = width - offset
+                else:
+                    adj_width = int(math.floor(size[c] / total * width))
+                result.append((c, (x + offset, y, adj_width, height)))
+                offset += adj_width
+            else:
+                if k == last:
+                    adj_height = height - offset
+                else:
+                    adj_height = int(math.floor(size[c] / total * height))
+                result.append((c, (x, y + offset, width, adj_height)))
+                offset += adj_height
+        return result
+
+    # Mutation ===============================================================
+    def update_data_size(self, size_increment):
+        """Add <size_increment> to the data size of this node and all of its
+        ancestors.
+
+        @type self: CompactTree
+        @type size_increment: int
+        @rtype: None
+        """
+        arrays = self._arrays
+        if not arrays.alive[self._index]:
+            return
+        i = self._index
+        while i != -1:
+            arrays.size[i] += size_increment
+            i = arrays.parent[i]
+
+    def delete_leaf(self):
+        """Delete this leaf from the tree, updating the data sizes of its
+        ancestors.
+
+        === Preconditions: ===
+        self is a leaf
+
+        @type self: CompactTree
+        @rtype: None
+        """
+        self.update_data_size(0 - self.data_size)
+        self._arrays.alive[self._index] = 0
+
+    def delete_subtree(self):
+        """Delete this tree and everything in it from the tree it is part
+        of, updating the data sizes of its ancestors.
+
+        @type self: CompactTree
+        @rtype: None
+        """
+        self.delete_leaf()
+
+    def increase_data_size(self):
+        """Increase the data size of this leaf by 1%, and update the data
+        sizes of its ancestors.
+
+        @type self: CompactTree
+        @rtype: None
+        """
+        self.update_data_size(int(math.ceil(self.data_size * 0.01)))
+
+    def decrease_data_size(self):
+        """Decrease the data size of this leaf by 1% to a minimum of 1, and
+        update the data sizes of its ancestors.
+
+        @type self: CompactTree
+        @rtype: None
+        """
+        decrement = int(math.ceil(self.data_size * 0.01))
+        if self.data_size - decrement >= 1:
+            self.update_data_size(0 - decrement)
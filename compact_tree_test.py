@@ -0,0 +1,130 @@
+"""Tests for compact_tree.
+
+=== Module Description ===
+These tests check that a CompactTree copied from an AbstractTree draws the
+same treemap, and that its mutating methods keep the data sizes consistent.
+"""
+import os
+
+import unittest
+from hypothesis import given
+from hypothesis.strategies import integers, sampled_from
+
+from compact_tree import CompactTree
+from tree_data import FileSystemTree, squarify
+from tree_fixtures import make_tree
+
+
+EXAMPLE_PATH = os.path.join('example-data', 'B')
+
+
+class FromTreeTest(unittest.TestCase):
+    def test_example_data(self):
+        tree = FileSystemTree(EXAMPLE_PATH)
+        compact = CompactTree.from_tree(tree)
+        self.assertEqual(compact.data_size, 40)
+        self.assertEqual(compact.get_root(), 'B')
+        self.assertEqual(compact.generate_treemap((0, 0, 800, 1000)),
+                         tree.generate_treemap((0, 0, 800, 1000)))
+
+    @given(integers(min_value=1, max_value=60),
+           integers(min_value=0, max_value=1000),
+           integers(min_value=0, max_value=1000))
+    def test_same_rectangles(self, seed, width, height):
+        tree = make_tree(seed)
+        compact = CompactTree.from_tree(tree)
+        rect = (3, 7, width, height)
+        self.assertEqual(compact.generate_treemap(rect),
+                         tree.generate_treemap(rect))
+
+    @given(integers(min_value=1, max_value=60),
+           integers(min_value=0, max_value=300),
+           integers(min_value=0, max_value=300),
+           sampled_from([None, squarify]),
+           sampled_from([0, 16, 400]))
+    def test_same_rectangles_with_engine_and_min_area(self, seed, width,
+                                                      height, engine,
+                                                      min_area):
+        tree = make_tree(seed)
+        compact = CompactTree.from_tree(tree)
+        rect = (3, 7, width, height)
+        self.assertEqual(compact.generate_treemap(rect, engine, min_area),
+                         tree.generate_treemap(rect, engine, min_area))
+
+    def test_separator(self):
+        tree = make_tree(5)
+        compact = CompactTree.from_tree(tree)
+        leaf = compact.generate_leafmap((0, 0, 100, 100))[0]
+        self.assertEqual(leaf.get_separator(), 'World/r0/c0')
+
+
+class FindLeafTest(unittest.TestCase):
+    def test_leaf_contains_point(self):
+        compact = CompactTree.from_tree(make_tree(40))
+        rects = compact.generate_treemap((0, 0, 300, 200))
+        leaves = compact.generate_leafmap((0, 0, 300, 200))
+        for (x, y, w, h), _ in rects:
+            if w > 1 and h > 1:
+                centre = (x + w // 2, y + h // 2)
+                leaf = compact.find_leaf(centre, 300, 200)
+                self.assertEqual(leaf, leaves[rects.index(((x, y, w, h),
+                                                           leaf.colour))])
+
+    @given(integers(min_value=1, max_value=60),
+           sampled_from([None, squarify]),
+           sampled_from([0, 16, 400]))
+    def test_same_as_tree(self, seed, engine, min_area):
+        tree = make_tree(seed)
+        compact = CompactTree.from_tree(tree)
+        for x in range(0, 301, 23):
+            for y in range(0, 201, 19):
+                expected = tree.find_leaf((x, y), 300, 200, engine, min_area)
+                leaf = compact.find_leaf((x, y), 300, 200, engine, min_area)
+                if expected is None:
+                    self.assertIsNone(leaf)
+                else:
+                    self.assertEqual(leaf.get_separator(),
+                                     expected.get_separator())
+
+    def test_outside(self):
+        compact = CompactTree.from_tree(make_tree(4))
+        self.assertIsNone(compact.find_leaf((301, 5), 300, 200))
+
+
+class MutationTest(unittest.TestCase):
+    def test_delete_leaf(self):
+        compact = CompactTree.from_tree(make_tree(10))
+        total = compact.data_size
+        leaf = compact.find_leaf((0, 0), 300, 200)
+        size = leaf.data_size
+        leaf.delete_leaf()
+        self.assertTrue(leaf.is_empty())
+        self.assertEqual(compact.data_size, total - size)
+        self.assertNotEqual(compact.find_leaf((0, 0), 300, 200), leaf)
+
+    def test_delete_subtree(self):
+        compact = CompactTree.from_tree(make_tree(10))
+        total = compact.data_size
+        leaf = compact.find_leaf((0, 0), 300, 200)
+        region = leaf.get_parent()
+        size = region.data_size
+        region.delete_subtree()
+        self.assertTrue(region.is_empty())
+        self.assertIsNone(region.get_parent())
+        self.assertEqual(region.get_subtrees(), [])
+        self.assertEqual(compact.data_size, total - size)
+        self.assertNotIn(region, compact.get_non_empty_leaves())
+
+    def test_increase_and_decrease(self):
+        compact = CompactTree.from_tree(make_tree(10))
+        total = compact.data_size
+        leaf = compact.find_leaf((0, 0), 300, 200)
+        size = leaf.data_size
+        leaf.increase_data_size()
+        self.assertEqual(compact.data_size - total, leaf.data_size - size)
+        leaf.decrease_data_size()
+        self.assertEqual(compact.data_size - total, leaf.data_size - size)
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
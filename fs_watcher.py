@@ -0,0 +1,242 @@
+"""File system change tracking
+
+=== Module Description ===
+This module contains PollingWatcher, which keeps an existing FileSystemTree
+in step with the files and folders it was built from.
+
+Each call to poll() compares the modification time of every folder under
+the scanned root with the one seen last time. Only folders whose mtime has
+changed are listed again, to find the entries that were created or
+deleted. Writing to a file does not change the mtime of its folder, so
+size changes are found by checking the size of each known file.
+
+The changes are returned as a batch of events, and apply() patches them
+into the tree node by node, so the cost of an update depends on the number
+of changes rather than the size of the tree.
+"""
+import os
+import stat
+
+from tree_data import PathIndex, scan_dir
+
+
+# Event kinds returned by PollingWatcher.poll
+CREATED = 'created'
+DELETED = 'deleted'
+RESIZED = 'resized'
+
+
+class PollingWatcher:
+    """Detects changes under the root of a FileSystemTree by polling.
+
+    === Private Attributes ===
+    @type _tree: FileSystemTree
+        The tree being kept up to date.
+    @type _index: PathIndex
+        Finds the node of every file and folder in the tree by its path.
+    @type _folders: dict[str, (int, dict[str, bool])]
+        Maps the path of every folder to its last seen mtime (in
+        nanoseconds), and the name of each of its entries to whether that
+        entry is a folder.
+    @type _files: dict[str, int]
+        Maps the path of every file to its last seen size on disk.
+    @type _mtimes: dict[str, int]
+        The new mtimes of the folders listed by the last poll(), recorded by
+        apply() once their changes are in the tree.
+    """
+    def __init__(self, tree, path, index=None):
+        """Initialize a new PollingWatcher for <tree>, which was built from
+        the file or folder at <path>, finding its nodes with <index>, or with
+        a new PathIndex if it is None.
+
+        @type self: PollingWatcher
+        @type tree: FileSystemTree
+        @type path: str
+        @type index: PathIndex | None
+        @rtype: None
+        """
+        self._tree = tree
+        self._index = PathIndex(tree, path) if index is None else index
+        self._folders = {}
+        self._files = {}
+        self._mtimes = {}
+        self._track(path, tree)
+
+    def poll(self):
+        """Return the changes made on disk since the last call.
+
+        Each change is a tuple (kind, path, size), where kind is CREATED,
+        DELETED or RESIZED, and size is the new size of a file (None for
+        folders and deleted entries). A file replaced by a folder of the
+        same name, or the other way around, is reported as DELETED and then
+        CREATED. The tree is not modified.
+
+        @type self: PollingWatcher
+        @rtype: list[(str, str, int | None)]
+        """
+        events = []
+        for folder, (mtime, names) in self._folders.items():
+            try:
+                new_mtime = os.stat(folder).st_mtime_ns
+            except OSError:
+                # the folder is gone; its parent's mtime reports that
+                continue
+            if new_mtime == mtime:
+                continue
+            try:
+                entries = scan_dir(folder)
+            except OSError:
+                # removed, or replaced by a file, since the stat; its
+                # parent's listing reports that
+                continue
+            self._mtimes[folder] = new_mtime
+            listing = {name: (entry_path, is_dir, size)
+                       for entry_path, name, is_dir, size in entries}
+            for name, is_dir in names.items():
+                if name not in listing or listing[name][1] != is_dir:
+                    events.append((DELETED, os.path.join(folder, name), None))
+            for name, (entry_path, is_dir, size) in listing.items():
+                if names.get(name) != is_dir:
+                    events.append((CREATED, entry_path,
+                                   None if is_dir else size))
+
+        for file_path, size in self._files.items():
+            try:
+                status = os.stat(file_path)
+            except OSError:
+                # reported as deleted by its folder
+                continue
+            if not stat.S_ISREG(status.st_mode):
+                # replaced by a folder, also reported by its folder
+                continue
+            if status.st_size != size:
+                events.append((RESIZED, file_path, status.st_size))
+        return events
+
+    def apply(self, events):
+        """Patch the changes in <events>, as returned by poll(), into the
+        tree.
+
+        @type self: PollingWatcher
+        @type events: list[(str, str, int | None)]
+        @rtype: None
+        """
+        # resized and deleted files, applied to the tree together, except
+        # for files replaced by a folder, which must be gone before the
+        # folder is added
+        changes = []
+        created = {path for kind, path, _ in events if kind == CREATED}
+        for kind, path, size in events:
+            node = self._index.find(path)
+            if kind == RESIZED and node is not None and path in self._files:
+                changes.append((node, size - self._files[path]))
+                self._files[path] = size
+            elif kind == DELETED and node is not None and \
+                    path in self._files and path not in created:
+                changes.append((node, None))
+                self._forget(path)
+            elif kind == DELETED and node is not None:
+                self._delete(path, node)
+            elif kind == CREATED and node is None:
+                self._create(path)
+        self._tree.apply_changes(changes)
+        for folder, mtime in self._mtimes.items():
+            if folder in self._folders:
+                self._folders[folder] = (mtime, self._folders[folder][1])
+        self._mtimes = {}
+
+    def update(self):
+        """Poll for changes and apply them to the tree.
+
+        Return the changes that were applied.
+
+        @type self: PollingWatcher
+        @rtype: list[(str, str, int | None)]
+        """
+        events = self.poll()
+        self.apply(events)
+        return events
+
+    def _track(self, path, node):
+        """Start tracking the file or folder at <path>, and everything in
+        it, as represented by <node>.
+
+        @type self: PollingWatcher
+        @type path: str
+        @type node: FileSystemTree
+        @rtype: None
+        """
+        stack = [(path, node)]
+        while stack:
+            path, node = stack.pop()
+            if not os.path.isdir(path):
+                self._files[path] = node.data_size
+                continue
+            # read the mtime first, so a change made while the folder is
+            # being listed is seen by the next poll
+            mtime = os.stat(path).st_mtime_ns
+            children = {}
+            for subtree in node.get_subtrees():
+                if not subtree.is_empty():
+                    children[subtree.get_root()] = subtree
+            names = {}
+            for entry_path, name, is_dir, _ in scan_dir(path):
+                if name in children:
+                    names[name] = is_dir
+                    stack.append((entry_path, children[name]))
+                else:
+                    # not in the tree yet: make the next poll report it
+                    mtime = None
+            self._folders[path] = (mtime, names)
+
+    def _forget(self, path):
+        """Stop tracking the file or folder at <path> and everything in it,
+        and remove it from the entries of its folder.
+
+        @type self: PollingWatcher
+        @type path: str
+        @rtype: None
+        """
+        parent_path = os.path.dirname(path)
+        if parent_path in self._folders:
+            self._folders[parent_path][1].pop(os.path.basename(path), None)
+        stack = [path]
+        while stack:
+            path = stack.pop()
+            self._files.pop(path, None)
+            if path in self._folders:
+                _, names = self._folders.pop(path)
+                stack.extend(os.path.join(path, name) for name in names)
+
+    def _delete(self, path, node):
+        """Remove the file or folder at <path>, represented by <node>, from
+        the tree.
+
+        @type self: PollingWatcher
+        @type path: str
+        @type node: FileSystemTree
+        @rtype: None
+        """
+        node.delete_subtree()
+        self._forget(path)
+
+    def _create(self, path):
+        """Add the new file or folder at <path> to the tree.
+
+        @type self: PollingWatcher
+        @type path: str
+        @rtype: None
+        """
+        parent_path = os.path.dirname(path)
+        parent = self._index.find(parent_path)
+        if parent is None or parent.is_empty():
+            return
+        try:
+            node = type(self._tree).from_path(path)
+        except OSError:
+            # already removed again
+            return
+        parent.add_subtree(node)
+        self._track(path, node)
+        self._folders[parent_path][1][os.path.basename(path)] = \
+            os.path.isdir(path)
@@ -0,0 +1,436 @@
+"""Tests for the treemap layout of AbstractTree.
+
+=== Module Description ===
+These tests check that the different views of the layout (rectangles,
+leaves and hit-testing) agree with each other.
+"""
+import unittest
+from hypothesis import given
+from hypothesis.strategies import integers, lists, none, one_of, tuples
+
+import vector_layout
+from population import PopulationTree
+from tree_data import squarify
+from tree_fixtures import make_tree
+
+
+class GenerateLayoutTest(unittest.TestCase):
+    def test_views_agree(self):
+        tree = make_tree(12)
+        rect = (0, 0, 200, 900)
+        layout = tree.generate_layout(rect)
+        self.assertEqual([(r, c) for r, c, _ in layout],
+                         tree.generate_treemap(rect))
+        self.assertEqual([leaf for _, _, leaf in layout],
+                         tree.generate_leafmap(rect))
+
+    def test_leaves_line_up_after_deletion(self):
+        # A deleted first subtree used to shift the horizontal strips of
+        # generate_leafmap relative to generate_treemap
+        tree = make_tree(3)
+        tree._subtrees[0]._subtrees[0].delete_leaf()
+        rect = (0, 0, 100, 700)
+        for leaf_rect, colour, leaf in tree.generate_layout(rect):
+            self.assertEqual(colour, leaf.colour)
+        for (leaf_rect, colour), leaf in zip(tree.generate_treemap(rect),
+                                             tree.generate_leafmap(rect)):
+            self.assertEqual(colour, leaf.colour)
+
+    @given(integers(min_value=1, max_value=60),
+           integers(min_value=0, max_value=299),
+           integers(min_value=0, max_value=199))
+    def test_find_leaf_contains_point(self, seed, x, y):
+        tree = make_tree(seed)
+        leaf = tree.find_leaf((x, y), 300, 200)
+        for (rx, ry, rw, rh), _, candidate in \
+                tree.generate_layout((0, 0, 300, 200)):
+            if rx <= x <= rx + rw and ry <= y <= ry + rh:
+                self.assertIs(leaf, candidate)
+                break
+        else:
+            self.assertIsNone(leaf)
+
+
+class LayoutIndexTest(unittest.TestCase):
+    def test_index_is_reused(self):
+        tree = make_tree(20)
+        tree.find_leaf((10, 10), 300, 200)
+        index = tree._hit_index
+        tree.find_leaf((250, 150), 300, 200)
+        self.assertIs(tree._hit_index, index)
+        tree.find_leaf((10, 10), 301, 200)
+        self.assertIsNot(tree._hit_index, index)
+
+    def test_index_follows_deletion(self):
+        tree = make_tree(20)
+        leaf = tree.find_leaf((0, 0), 300, 200)
+        leaf.delete_leaf()
+        self.assertIsNot(tree.find_leaf((0, 0), 300, 200), leaf)
+        self.assertIs(tree.find_leaf((0, 0), 300, 200),
+                      tree.generate_leafmap((0, 0, 300, 200))[0])
+
+    def test_index_follows_resize(self):
+        tree = make_tree(20)
+        leaf = tree.find_leaf((0, 0), 300, 200)
+        for _ in range(100):
+            leaf.increase_data_size()
+        for (x, y, w, h), _, expected in tree.generate_layout((0, 0, 300,
+                                                              200)):
+            if w > 1 and h > 1:
+                self.assertIs(tree.find_leaf((x + w // 2, y + h // 2),
+                                             300, 200), expected)
+
+
+class LayoutCacheTest(unittest.TestCase):
+    @given(integers(min_value=1, max_value=60),
+           integers(min_value=0, max_value=200))
+    def test_cached_layout_matches_fresh(self, seed, pick):
+        tree = make_tree(seed)
+        rect = (0, 0, 300, 200)
+        leaves = tree.generate_leafmap(rect)
+        leaf = leaves[pick % len(leaves)]
+        for _ in range(20):
+            leaf.increase_data_size()
+        leaves[0].colour = (1, 2, 3)
+        fresh = make_tree(seed)
+        fresh_leaves = fresh.generate_leafmap(rect)
+        for _ in range(20):
+            fresh_leaves[pick % len(leaves)].increase_data_size()
+        self.assertEqual([r for r, _ in tree.generate_treemap(rect)],
+                         [r for r, _ in fresh.generate_treemap(rect)])
+        self.assertEqual(tree.generate_treemap(rect)[0][1], (1, 2, 3))
+        self.assertEqual(tree.generate_leafmap(rect),
+                         [leaf for _, _, leaf in tree.generate_layout(rect)])
+
+    def test_moved_rectangle(self):
+        tree = make_tree(33)
+        tree.generate_treemap((0, 0, 300, 200))
+        moved = tree.generate_treemap((10, 20, 300, 200))
+        tree._drop_layout()
+        for subtree in tree._subtrees:
+            subtree._drop_layout()
+        self.assertEqual(moved, tree.generate_treemap((10, 20, 300, 200)))
+
+
+class VectorLayoutTest(unittest.TestCase):
+    @given(integers(min_value=1, max_value=60),
+           integers(min_value=0, max_value=1000),
+           integers(min_value=0, max_value=1000))
+    def test_same_as_recursive(self, seed, width, height):
+        tree = make_tree(seed)
+        tree._subtrees[-1]._subtrees[0].delete_leaf()
+        rect = (3, 7, width, height)
+        self.assertEqual(vector_layout.generate_layout(tree, rect),
+                         tree.generate_layout(rect))
+
+    @given(integers(min_value=1, max_value=60),
+           integers(min_value=0, max_value=400),
+           integers(min_value=0, max_value=300),
+           integers(min_value=1, max_value=500))
+    def test_same_as_recursive_with_min_area(self, seed, width, height,
+                                             min_area):
+        tree = make_tree(seed)
+        rect = (3, 7, width, height)
+        self.assertEqual(vector_layout.generate_layout(tree, rect, min_area),
+                         tree.generate_layout(rect, None, min_area))
+
+    def test_single_leaf(self):
+        leaf = PopulationTree(False, 'c', None, 5)
+        self.assertEqual(vector_layout.generate_treemap(leaf, (0, 0, 4, 2)),
+                         [((0, 0, 4, 2), leaf.colour)])
+
+
+class SquarifyTest(unittest.TestCase):
+    @given(integers(min_value=1, max_value=60),
+           integers(min_value=0, max_value=1000),
+           integers(min_value=0, max_value=1000))
+    def test_fills_rectangle(self, seed, width, height):
+        tree = make_tree(seed)
+        rects = [r for r, _ in tree.generate_treemap((3, 7, width, height),
+                                                     squarify)]
+        self.assertEqual(len(rects), len(tree.generate_leafmap((0, 0, 1, 1))))
+        self.assertEqual(sum(w * h for _, _, w, h in rects), width * height)
+        for x, y, w, h in rects:
+            self.assertTrue(w >= 0 and h >= 0)
+            self.assertTrue(3 <= x and x + w <= 3 + width)
+            self.assertTrue(7 <= y and y + h <= 7 + height)
+
+    def test_squarer_than_slices(self):
+        tree = PopulationTree(False, 'World', [
+            PopulationTree(False, 'c{}'.format(c), None, 1) for c in
+            range(16)])
+        rects = [r for r, _ in tree.generate_treemap((0, 0, 400, 400),
+                                                     squarify)]
+        self.assertEqual(set((w, h) for _, _, w, h in rects), {(100, 100)})
+
+    @given(integers(min_value=1, max_value=60),
+           integers(min_value=0, max_value=299),
+           integers(min_value=0, max_value=199))
+    def test_find_leaf_contains_point(self, seed, x, y):
+        tree = make_tree(seed)
+        tree.find_leaf((x, y), 300, 200)
+        leaf = tree.find_leaf((x, y), 300, 200, squarify)
+        for (rx, ry, rw, rh), _, candidate in \
+                tree.generate_layout((0, 0, 300, 200), squarify):
+            if rx <= x <= rx + rw and ry <= y <= ry + rh:
+                self.assertIs(leaf, candidate)
+                break
+        else:
+            self.assertIsNone(leaf)
+
+    def test_engines_cached_separately(self):
+        tree = make_tree(45)
+        rect = (0, 0, 300, 200)
+        sliced = tree.generate_treemap(rect)
+        squares = tree.generate_treemap(rect, squarify)
+        self.assertNotEqual(sliced, squares)
+        self.assertEqual(tree.generate_treemap(rect), sliced)
+        self.assertEqual(tree.generate_treemap(rect, squarify), squares)
+
+
+class MinAreaTest(unittest.TestCase):
+    @given(integers(min_value=1, max_value=60),
+           integers(min_value=1, max_value=400))
+    def test_small_subtrees_aggregated(self, seed, min_area):
+        tree = make_tree(seed)
+        rect = (0, 0, 60, 40)
+        leaves = tree.generate_leafmap(rect)
+        for (x, y, w, h), colour, node in tree.generate_layout(rect, None,
+                                                               min_area):
+            self.assertEqual(colour, node.colour)
+            self.assertTrue(w > 0 and h > 0)
+            if node.get_non_empty_leaves() != []:
+                self.assertLess(w * h, min_area)
+            else:
+                self.assertIn(node, leaves)
+
+    def test_zero_is_unchanged(self):
+        tree = make_tree(17)
+        rect = (0, 0, 300, 200)
+        self.assertEqual(tree.generate_treemap(rect, None, 0),
+                         tree.generate_treemap(rect))
+
+    @given(integers(min_value=1, max_value=60),
+           integers(min_value=0, max_value=59),
+           integers(min_value=0, max_value=39))
+    def test_find_leaf_reports_aggregate(self, seed, x, y):
+        tree = make_tree(seed)
+        leaf = tree.find_leaf((x, y), 60, 40, None, 300)
+        for (rx, ry, rw, rh), _, candidate in \
+                tree.generate_layout((0, 0, 60, 40), None, 300):
+            if rx <= x <= rx + rw and ry <= y <= ry + rh:
+                self.assertIs(leaf, candidate)
+                break
+        else:
+            self.assertIsNone(leaf)
+
+    def test_aggregate_separator(self):
+        tree = make_tree(6)
+        region = tree.find_leaf((0, 0), 60, 40, None, 60 * 40 + 1)
+        self.assertIs(region, tree)
+        region = tree.find_leaf((0, 0), 60, 40, None, 60 * 40 // 2)
+        self.assertEqual(region.get_separator(), 'World/r0')
+
+
+class IterTreemapTest(unittest.TestCase):
+    @given(integers(min_value=1, max_value=60),
+           integers(min_value=0, max_value=50))
+    def test_same_as_list(self, seed, min_area):
+        tree = make_tree(seed)
+        rect = (3, 7, 300, 200)
+        self.assertEqual(list(tree.iter_treemap(rect, None, min_area)),
+                         tree.generate_treemap(rect, None, min_area))
+        self.assertEqual(list(tree.iter_treemap(rect, squarify)),
+                         tree.generate_treemap(rect, squarify))
+
+    def test_deeper_than_recursion_limit(self):
+        tree = PopulationTree(False, 'f', None, 1)
+        for level in range(3000):
+            tree = PopulationTree(False, 'd{}'.format(level), [
+                PopulationTree(False, 'f', None, 1), tree])
+        rects = list(tree.iter_treemap((0, 0, 100, 100)))
+        self.assertEqual(len(rects), 3001)
+        self.assertEqual(rects, tree.generate_treemap((0, 0, 100, 100)))
+
+
+class ApplyChangesTest(unittest.TestCase):
+    @given(integers(min_value=1, max_value=60),
+           lists(tuples(integers(min_value=0, max_value=1000),
+                        one_of(none(), integers(min_value=-5,
+                                                max_value=50)))))
+    def test_same_as_one_at_a_time(self, seed, changes):
+        batched = make_tree(seed)
+        single = make_tree(seed)
+        batched_leaves = _leaves(batched)
+        single_leaves = _leaves(single)
+        rect = (0, 0, 300, 200)
+        batched.generate_treemap(rect)
+        for pick, size_increment in changes:
+            leaf = single_leaves[pick % len(single_leaves)]
+            if size_increment is None:
+                if not leaf.is_empty():
+                    leaf.delete_leaf()
+            else:
+                leaf.update_data_size(size_increment)
+        batched.apply_changes([(batched_leaves[pick % len(batched_leaves)],
+                                size_increment)
+                               for pick, size_increment in changes])
+        # apply_changes may already have removed some of the deleted leaves
+        batched.compact()
+        single.compact()
+        self.assertEqual(_sizes(batched), _sizes(single))
+        self.assertEqual([leaf.is_empty() for leaf in batched_leaves],
+                         [leaf.is_empty() for leaf in single_leaves])
+        self.assertEqual([r for r, _ in batched.generate_treemap(rect)],
+                         [r for r, _ in single.generate_treemap(rect)])
+
+    def test_ancestors_updated_once(self):
+        tree = make_tree(12)
+        leaves = _leaves(tree)
+        tree.apply_changes([(leaf, 1) for leaf in leaves])
+        self.assertEqual(tree.data_size, sum(leaf.data_size
+                                             for leaf in leaves))
+        for region in tree._subtrees:
+            self.assertEqual(region.data_size,
+                             sum(c.data_size for c in region._subtrees))
+
+    def test_deeper_than_recursion_limit(self):
+        leaf = PopulationTree(False, 'f', None, 1)
+        tree = leaf
+        for level in range(3000):
+            tree = PopulationTree(False, 'd{}'.format(level), [tree])
+        leaf.update_data_size(2)
+        self.assertEqual(tree.data_size, 3)
+        tree.apply_changes([(leaf, 4), (leaf, None)])
+        self.assertEqual(tree.data_size, 0)
+        self.assertTrue(leaf.is_empty())
+
+
+class DeleteSubtreeTest(unittest.TestCase):
+    @given(integers(min_value=1, max_value=60),
+           integers(min_value=0, max_value=100))
+    def test_same_as_deleting_every_leaf(self, seed, pick):
+        subtree_deleted = make_tree(seed)
+        leaves_deleted = make_tree(seed)
+        rect = (0, 0, 300, 200)
+        subtree_deleted.generate_treemap(rect)
+        k = pick % len(subtree_deleted._subtrees)
+        region = subtree_deleted._subtrees[k]
+        region.delete_subtree()
+        for leaf in leaves_deleted._subtrees[k]._subtrees:
+            leaf.delete_leaf()
+        self.assertTrue(region.is_empty())
+        self.assertEqual(subtree_deleted.data_size,
+                         leaves_deleted.data_size)
+        self.assertEqual(
+            [r for r, _ in subtree_deleted.generate_treemap(rect)],
+            [r for r, _ in leaves_deleted.generate_treemap(rect)])
+
+    def test_deep_subtree(self):
+        leaf = PopulationTree(False, 'f', None, 5)
+        tree = leaf
+        for level in range(3000):
+            tree = PopulationTree(False, 'd{}'.format(level), [tree])
+        tree = PopulationTree(False, 'top', [
+            tree, PopulationTree(False, 'g', None, 3)])
+        tree._subtrees[0].delete_subtree()
+        self.assertEqual(tree.data_size, 3)
+        self.assertIsNone(tree._subtrees[0].get_parent())
+        self.assertEqual(tree.compact(), 1)
+
+
+class CompactTest(unittest.TestCase):
+    @given(integers(min_value=1, max_value=60),
+           lists(integers(min_value=0, max_value=1000)))
+    def test_layout_unchanged(self, seed, picks):
+        tree = make_tree(seed)
+        leaves = _leaves(tree)
+        for pick in picks:
+            leaf = leaves[pick % len(leaves)]
+            if not leaf.is_empty():
+                leaf.delete_leaf()
+        rect = (0, 0, 300, 200)
+        before = tree.generate_layout(rect)
+        hits = [tree.find_leaf((x, y), 300, 200)
+                for x in range(0, 300, 37) for y in range(0, 200, 23)]
+        dead = sum(1 for leaf in leaves if leaf.is_empty())
+        emptied = sum(1 for region in tree._subtrees
+                      if all(leaf.is_empty() for leaf in region._subtrees))
+        self.assertEqual(tree.compact(), dead + emptied)
+        self.assertEqual(tree.generate_layout(rect), before)
+        for subtree in _nodes(tree)[1:]:
+            self.assertFalse(subtree.is_empty())
+            self.assertIn(subtree, subtree._parent_tree._subtrees)
+        for node in _nodes(tree):
+            node._layout_cache = None
+        self.assertEqual(tree.generate_layout(rect), before)
+        self.assertEqual([tree.find_leaf((x, y), 300, 200)
+                          for x in range(0, 300, 37)
+                          for y in range(0, 200, 23)], hits)
+
+    def test_emptied_subtrees_removed(self):
+        tree = make_tree(12)
+        region = tree._subtrees[0]
+        for leaf in region._subtrees:
+            leaf.delete_leaf()
+        count = len(tree._subtrees)
+        leaves = len(region._subtrees)
+        self.assertEqual(tree.compact(), leaves + 1)
+        self.assertEqual(len(tree._subtrees), count - 1)
+        self.assertTrue(region.is_empty())
+        self.assertEqual(tree.compact(), 0)
+
+    def test_zero_size_leaves_kept(self):
+        leaf = PopulationTree(False, 'c', None, 0)
+        tree = PopulationTree(False, 'World', [
+            PopulationTree(False, 'r', [leaf])])
+        self.assertEqual(tree.compact(), 0)
+        self.assertIs(tree._subtrees[0]._subtrees[0], leaf)
+
+    def test_apply_changes_compacts(self):
+        tree = make_tree(12)
+        region = max(tree._subtrees, key=lambda r: len(r._subtrees))
+        countries = list(region._subtrees)
+        half = len(countries) // 2
+        tree.apply_changes([(leaf, None) for leaf in countries[:half]])
+        # not more than half deleted: left in place
+        self.assertEqual(region._subtrees, countries)
+        tree.apply_changes([(countries[half], None)])
+        self.assertEqual(region._subtrees, countries[half + 1:])
+
+
+##############################################################################
+# Helpers
+##############################################################################
+def _leaves(tree):
+    """Return the leaves of <tree>, in order.
+
+    @type tree: AbstractTree
+    @rtype: list[AbstractTree]
+    """
+    if tree._subtrees == []:
+        return [tree]
+    return [leaf for subtree in tree._subtrees for leaf in _leaves(subtree)]
+
+
+def _nodes(tree):
+    """Return the nodes of <tree>, parents first.
+
+    @type tree: AbstractTree
+    @rtype: list[AbstractTree]
+    """
+    return [tree] + [node for subtree in tree._subtrees
+                     for node in _nodes(subtree)]
+
+
+def _sizes(tree):
+    """Return the data sizes of <tree> and its subtrees as nested tuples.
+
+    @type tree: AbstractTree
+    @rtype: tuple
+    """
+    return (tree.data_size, [_sizes(subtree) for subtree in tree._subtrees])
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
@@ -14,24 +14,55 @@ AbstractTree subclass, we can then run it through our treemap visualisation
 tool to get a nice interactive graphical representation of this data.
 
 NOTE: You'll need an Internet connection to access the World Bank API
-to get started working on this assignment.
-
+to get started working on this assignment. The responses are kept in a
+ResponseCache (by default in CACHE_FOLDER), so later runs start from the
+cache, and still work without a connection.
+
+The API splits its responses into pages. iter_indicator and get_countries
+read the number of pages from the first one and fetch the others a few at
+a time, in parallel, decoding the rows of each page only as they are
+used, so that indicators with many rows (e.g. every year since 1960) can
+be read without holding all of them in memory.
 """
+import collections
+import concurrent.futures
 import json
-import urllib.request as request
+import os
+import re
 
+from response_cache import ResponseCache
 from tree_data import AbstractTree
 
 
-# Constants for the World Bank API urls.
+# Constants for the World Bank API urls. The paginated urls are appended to
+# WORLD_BANK_BASE, and followed by the page number.
 WORLD_BANK_BASE = 'http://api.worldbank.org/countries'
-WORLD_BANK_POPULATIONS = (
-    WORLD_BANK_BASE +
-    '/all/indicators/SP.POP.TOTL?format=json&date=2014:2014&per_page=270'
-)
-WORLD_BANK_REGIONS = (
-    WORLD_BANK_BASE + '?format=json&date=2014:2014&per_page=310'
+WORLD_BANK_INDICATOR = (
+    '/all/indicators/{indicator}?format=json&date={date}&per_page={per_page}'
+    '&page='
 )
+WORLD_BANK_COUNTRIES = '?format=json&per_page={per_page}&page='
+
+# The indicator and the years shown by PopulationTree.
+POPULATION_INDICATOR = 'SP.POP.TOTL'
+POPULATION_DATE = '2014:2014'
+
+# The number of rows asked for in each page, and the greatest number of
+# pages fetched at once.
+PER_PAGE = 1000
+PAGE_WORKERS = 4
+
+# The region the World Bank puts its aggregates (e.g. 'World' or 'Euro
+# area') in, rather than a region of countries.
+AGGREGATES = 'Aggregates'
+
+# The whitespace allowed between JSON values.
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# The folder the World Bank responses are cached in, unless another cache
+# is given to PopulationTree.
+CACHE_FOLDER = os.path.join(os.path.expanduser('~'), '.cache', 'treemap',
+                            'worldbank')
 
 
 class PopulationTree(AbstractTree):
@@ -47,11 +78,15 @@ class PopulationTree(AbstractTree):
 
     See https://datahelpdesk.worldbank.org/ for details about this API.
     """
-    def __init__(self, world, root=None, subtrees=None, data_size=0):
+    __slots__ = ()
+
+    def __init__(self, world, root=None, subtrees=None, data_size=0,
+                 cache=None):
         """Initialize a new PopulationTree.
 
         If <world> is True, then this tree is the root of the population tree,
-        and it should load data from the World Bank API.
+        and it should load data from the World Bank API, through <cache> (by
+        default, a ResponseCache in CACHE_FOLDER).
         In this case, none of the other parameters are used.
 
         If <world> is False, pass the other arguments directly to the superclass
@@ -67,9 +102,11 @@ class PopulationTree(AbstractTree):
             The regions or countries
         @type data_size: int
             The population of the region or country
+        @type cache: ResponseCache | None
+            The cache the World Bank data is fetched through
         """
         if world:
-            region_trees = _load_data()
+            region_trees = _load_data(cache)
             AbstractTree.__init__(self, 'World', region_trees)
         else:
             if subtrees is None:
@@ -86,128 +123,228 @@ class PopulationTree(AbstractTree):
         s = ''
         if self.is_empty():
             s = ''
-        elif self._parent_tree is None and self._subtrees == []:
+        elif self._parent_tree is None:
             s = self._root
-        elif self._parent_tree is not None and self._subtrees == []:
+        elif self._subtrees == []:
             s = 'World' + '/' + self._parent_tree.get_root() + '/' + self._root
-        elif self._parent_tree is not None and self._subtrees != []:
-            s = self._parent_tree.get_root + self._root()
         else:
-            s = ''
+            # a region, e.g. shown as an aggregate by find_leaf
+            s = self._parent_tree.get_root() + '/' + self._root
         return s
 
 
-def _load_data():
+def _load_data(cache=None):
     """Create a list of trees corresponding to different world regions.
 
     Each tree consists of a root node -- the region -- attached to one or
     more leaves -- the countries in that region.
 
+    Countries without population data, or with population data that cannot
+    be read as an int, are left out, and so are regions without any
+    countries.
+
+    @type cache: ResponseCache | None
+        the cache the data is fetched through, or None for a ResponseCache
+        in CACHE_FOLDER
     @rtype: list[PopulationTree]
         List of trees that correspond to the world's regions
     """
-    # Get data from World Bank API.
-    country_populations = _get_population_data()
-    regions = _get_region_data()
-
-    # Be sure to read the docstring of the PopulationTree constructor to see
-    # how to call it.
-    # You'll want to complete the two helpers called above first (otherwise
-    # this function won't run).
-    # You can complete this function *without* using recursion.
-    # Remember that each region tree has only two levels:
-    #   - a root storing the name of the region
-    #   - zero or more leaves, each representing a country in the region
-
-    regions_list = []
-    for r in regions:
-        countries_list = []
-        for c in regions[r]:
-            if c in country_populations:
-                countries_list += [PopulationTree(False, c, None,
-                                                  country_populations[c])]
-        regions_list += [PopulationTree(False, r, countries_list)]
-    # for i in regions_list:
-    #     print(i._root + ',' + str(i.data_size))
-    #     for j in i._subtrees:
-    #         print('     ' + str(j._root) + ' ' + str(j.data_size))
-    return regions_list
-
-
-def _get_population_data():
-    """Return country population data from the World Bank.
-
-    The return value is a dictionary, where the keys are country names,
-    and the values are the corresponding populations of those countries.
-
-    Ignore all countries that do not have any population data,
-    or population data that cannot be read as an int.
-
-    @rtype: dict[str, int]
-        The countries with their respective populations
-    """
-    # The first element returned is ignored because it's just metadata.
-    # The second element's first 47 elements are ignored because they aren't
-    # countries.
-    _, population_data = _get_json_data(WORLD_BANK_POPULATIONS)
-    population_data = population_data[47:]
-
-    countries = {}
-
-    for i in range(0, len(population_data)):
-        # find countries
-        # find populations
-        country = population_data[i]['country']['value']
-        population = population_data[i]['value']
+    regions = {}
+    for country, region, _, population in iter_indicator(
+            POPULATION_INDICATOR, POPULATION_DATE, cache):
         try:
             population = int(population)
-            countries[country] = population
-        except TypeError:
-            # when it's None
-            pass
-
+        except (TypeError, ValueError):
+            continue
+        if region is not None:
+            regions.setdefault(region, []).append(
+                PopulationTree(False, country, None, population))
+    return [PopulationTree(False, region, countries)
+            for region, countries in regions.items()]
+
+
+def iter_indicator(indicator, date, cache=None, base=None,
+                   per_page=PER_PAGE, workers=PAGE_WORKERS):
+    """Yield the country, region, date and value of every row of the World
+    Bank <indicator> (e.g. 'SP.POP.TOTL') for <date> (a year, or a range of
+    years like '1960:2014'), in the order the API gives them.
+
+    Rows without a value are skipped, and so are the aggregates: the rows
+    whose country is in the AGGREGATES region of the country metadata,
+    which is fetched at the same time as the first page. A row whose
+    country is not in the metadata has None as its region.
+
+    The pages are fetched through <cache> (by default, a ResponseCache in
+    CACHE_FOLDER), at most <workers> at a time, and only a few pages ahead
+    of the row being yielded.
+
+    @type indicator: str
+    @type date: str
+    @type cache: ResponseCache | None
+    @type base: str | None
+        the url of the API, or None for WORLD_BANK_BASE
+    @type per_page: int
+    @type workers: int
+    @rtype: collections.Iterable[(str, str | None, str, object)]
+    """
+    cache, base = _defaults(cache, base)
+    url = base + WORLD_BANK_INDICATOR.format(indicator=indicator, date=date,
+                                             per_page=per_page)
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        metadata = executor.submit(get_countries, cache, base, per_page,
+                                   workers)
+        countries = None
+        for row in _iter_pages(url, cache, executor, workers):
+            if countries is None:
+                countries = metadata.result()
+            if row.get('value') is None:
+                continue
+            country = row.get('country') or {}
+            record = countries.get(row.get('countryiso3code')) or \
+                countries.get(country.get('id'))
+            region = None if record is None else record[1]
+            if region != AGGREGATES:
+                yield country.get('value'), region, row.get('date'), \
+                    row['value']
+
+
+def get_countries(cache=None, base=None, per_page=PER_PAGE,
+                  workers=PAGE_WORKERS):
+    """Return the name and region of every country (and aggregate) in the
+    World Bank country metadata, by both its three-letter and its
+    two-letter code.
+
+    The regions are stripped of surrounding spaces; aggregates are in the
+    AGGREGATES region.
+
+    @type cache: ResponseCache | None
+    @type base: str | None
+    @type per_page: int
+    @type workers: int
+    @rtype: dict[str, (str, str)]
+    """
+    cache, base = _defaults(cache, base)
+    url = base + WORLD_BANK_COUNTRIES.format(per_page=per_page)
+    countries = {}
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        for row in _iter_pages(url, cache, executor, workers):
+            region = ((row.get('region') or {}).get('value') or '').strip()
+            for code in (row.get('id'), row.get('iso2Code')):
+                if code:
+                    countries[code] = (row.get('name'), region)
     return countries
 
 
-def _get_region_data():
-    """Return country region data from the World Bank.
-
-    The return value is a dictionary, where the keys are region names,
-    and the values a list of country names contained in that region.
-
-    Ignore all regions that do not contain any countries.
+def _defaults(cache, base):
+    """Return <cache> and <base>, or their defaults if they are None.
 
-    @rtype: dict[str, list[str]]
-        The world's region with its contained countries
+    @type cache: ResponseCache | None
+    @type base: str | None
+    @rtype: (ResponseCache, str)
     """
-    # We ignore the first component of the returned JSON, which is metadata.
-    _, country_data = _get_json_data(WORLD_BANK_REGIONS)
-
-    regions = {}
-
-    for i in range(0, len(country_data)):
-        region = country_data[i]['region']['value']
-        country = country_data[i]['name']
-        if country is not None:
-            if region not in regions:
-                # create the dictionary key
-                regions[region] = []
-            # add the country to the list of countries of that region
-            regions[region].append(country)
-
-    return regions
+    if cache is None:
+        cache = ResponseCache(CACHE_FOLDER)
+    if base is None:
+        base = WORLD_BANK_BASE
+    return cache, base
 
 
-def _get_json_data(url):
-    """Return a dictionary representing the JSON response from the given url.
+def _iter_pages(url, cache, executor, workers):
+    """Yield the rows of every page of the paginated response at <url>,
+    which is followed by the page number, in order.
 
-    You should not modify this function.
+    The first page is fetched at once, in this thread, to find the number
+    of pages; the others are fetched by <executor>, keeping at most
+    <workers> of them waiting to be read.
 
     @type url: str
-    @rtype: Dict
+    @type cache: ResponseCache
+    @type executor: concurrent.futures.Executor
+    @type workers: int
+    @rtype: collections.Iterable[dict]
+    """
+    metadata, rows = _parse_page(cache.fetch(url + '1'))
+    pages = int(metadata.get('pages') or 1)
+    pending = collections.deque()
+    next_page = 2
+    while next_page <= pages and len(pending) < workers:
+        pending.append(executor.submit(cache.fetch, url + str(next_page)))
+        next_page += 1
+    yield from rows
+    while pending:
+        body = pending.popleft().result()
+        if next_page <= pages:
+            pending.append(executor.submit(cache.fetch,
+                                           url + str(next_page)))
+            next_page += 1
+        yield from _parse_page(body)[1]
+
+
+def _parse_page(body):
+    """Return the metadata of the World Bank response page <body> and an
+    iterator over its rows, each of which is only decoded when it is
+    reached.
+
+    Raise ValueError if <body> is not a page, e.g. if it is an error
+    message from the API.
+
+    @type body: bytes
+    @rtype: (dict, collections.Iterator[dict])
+    """
+    text = body.decode('utf-8')
+    decoder = json.JSONDecoder()
+    index = _skip(text, 0, '[')
+    metadata, index = decoder.raw_decode(text, index)
+    if not isinstance(metadata, dict) or 'message' in metadata:
+        raise ValueError('not a World Bank page: {!r}'.format(metadata))
+    return metadata, _iter_rows(text, index, decoder)
+
+
+def _iter_rows(text, index, decoder):
+    """Yield the rows of the World Bank page <text>, whose metadata ends at
+    <index>.
+
+    @type text: str
+    @type index: int
+    @type decoder: json.JSONDecoder
+    @rtype: collections.Iterator[dict]
+    """
+    index = _WHITESPACE.match(text, index).end()
+    if text.startswith(']', index):
+        # no rows at all
+        return
+    index = _skip(text, index, ',')
+    if text.startswith('null', index):
+        return
+    index = _skip(text, index, '[')
+    if text.startswith(']', index):
+        return
+    while True:
+        row, index = decoder.raw_decode(text, index)
+        yield row
+        index = _WHITESPACE.match(text, index).end()
+        if text.startswith(']', index):
+            return
+        index = _skip(text, index, ',')
+
+
+def _skip(text, index, expected):
+    """Return the index of the next value in <text> after the character
+    <expected>, which must be the first one at or after <index> that is not
+    whitespace.
+
+    Raise ValueError if another character is found.
+
+    @type text: str
+    @type index: int
+    @type expected: str
+    @rtype: int
     """
-    response = request.urlopen(url)
-    return json.loads(response.read().decode())
+    index = _WHITESPACE.match(text, index).end()
+    if not text.startswith(expected, index):
+        raise ValueError('expected {!r} at {} of a World Bank page'.format(
+            expected, index))
+    return _WHITESPACE.match(text, index + 1).end()
 
 # Helpers for AbstractTree ===================================================
 
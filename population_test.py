@@ -0,0 +1,421 @@
+"""Tests for the World Bank loader and ResponseCache.
+
+=== Module Description ===
+These tests build PopulationTree from a local stand-in for the World Bank
+API, served by http.server on this computer, and check when the responses
+are downloaded, revalidated, taken from the cache or replayed offline, and
+that paginated indicators are read page by page, without the aggregates.
+"""
+import hashlib
+import http.server
+import json
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+
+import unittest
+from unittest import mock
+
+import population
+from population import PopulationTree
+from response_cache import ResponseCache
+
+
+# The countries of the stand-in API, by region, with their populations,
+# and its aggregates, which are listed among the countries.
+REGIONS = {'Europe': {'France': 66, 'Spain': 46},
+           'South Asia': {'India': 1295, 'Nepal': None}}
+AGGREGATES = ['World', 'Euro area']
+
+
+class StandInServer:
+    """A local stand-in for the paginated World Bank API.
+
+    The country metadata is served at /countries and the rows of each
+    indicator at /countries/all/indicators/<indicator>, in pages of the
+    size asked for.
+
+    === Public Attributes ===
+    @type url: str
+        The url of the server.
+    @type countries: list[dict]
+        The rows of the country metadata.
+    @type indicators: dict[str, list[dict]]
+        The rows of each indicator.
+    @type etags: dict[str, str]
+        The ETag last sent for each path (with its query).
+    @type requests: list[(str, str | None)]
+        The path and If-None-Match header of every request received.
+    @type failures: int
+        The number of requests still to be answered with an error 500.
+    @type barrier: threading.Barrier | None
+        A barrier every request waits at before being answered, if any.
+    @type in_flight: int
+        The number of requests being answered.
+    @type most_in_flight: int
+        The greatest number of requests answered at once.
+    @type delay: float
+        The time, in seconds, taken to answer each request.
+    """
+    def __init__(self, regions=None, aggregates=None):
+        """Start a new server with the countries of <regions> and the
+        aggregates named in <aggregates>, by default REGIONS and
+        AGGREGATES, and their populations in 2014.
+
+        @type self: StandInServer
+        @type regions: dict[str, dict[str, int | None]] | None
+        @type aggregates: list[str] | None
+        @rtype: None
+        """
+        self.countries, rows = _country_rows(
+            REGIONS if regions is None else regions,
+            AGGREGATES if aggregates is None else aggregates)
+        self.indicators = {'SP.POP.TOTL': rows}
+        self.etags = {}
+        self.requests = []
+        self.failures = 0
+        self.barrier = None
+        self.in_flight = 0
+        self.most_in_flight = 0
+        self.delay = 0
+        lock = threading.Lock()
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                etag = self.headers.get('If-None-Match')
+                with lock:
+                    server.requests.append((self.path, etag))
+                    server.in_flight += 1
+                    server.most_in_flight = max(server.most_in_flight,
+                                                server.in_flight)
+                try:
+                    if server.barrier is not None:
+                        server.barrier.wait()
+                    time.sleep(server.delay)
+                    self._answer(etag)
+                finally:
+                    with lock:
+                        server.in_flight -= 1
+
+            def _answer(self, etag):
+                with lock:
+                    fail = server.failures > 0
+                    server.failures -= fail
+                body = server.page(self.path)
+                if fail:
+                    self.send_error(500)
+                elif body is None:
+                    self.send_error(404)
+                elif etag == _etag(body):
+                    self.send_response(304)
+                    self.end_headers()
+                else:
+                    server.etags[self.path] = _etag(body)
+                    self.send_response(200)
+                    self.send_header('ETag', _etag(body))
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                      Handler)
+        self.url = 'http://127.0.0.1:{}'.format(self._httpd.server_port)
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+
+    def page(self, path):
+        """Return the body of the page at <path>, or None if there is no
+        such page.
+
+        @type self: StandInServer
+        @type path: str
+        @rtype: bytes | None
+        """
+        parts = urllib.parse.urlsplit(path)
+        query = urllib.parse.parse_qs(parts.query)
+        prefix = '/countries/all/indicators/'
+        if parts.path == '/countries':
+            rows = self.countries
+        elif parts.path.startswith(prefix) and \
+                parts.path[len(prefix):] in self.indicators:
+            rows = self.indicators[parts.path[len(prefix):]]
+        else:
+            return None
+        per_page = int(query.get('per_page', ['50'])[0])
+        page = int(query.get('page', ['1'])[0])
+        pages = max(1, -(-len(rows) // per_page))
+        metadata = {'page': page, 'pages': pages, 'per_page': per_page,
+                    'total': len(rows)}
+        selected = rows[(page - 1) * per_page:page * per_page]
+        return json.dumps([metadata, selected or None]).encode()
+
+    def stop(self):
+        """Stop the server; requests to it are then refused.
+
+        @type self: StandInServer
+        @rtype: None
+        """
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+
+
+class PopulationTreeTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer()
+        self.folder = tempfile.mkdtemp()
+        patch = mock.patch.object(population, 'WORLD_BANK_BASE',
+                                  self.server.url + '/countries')
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.folder)
+
+    def _load(self, **kwargs):
+        cache = ResponseCache(self.folder, **kwargs)
+        tree = PopulationTree(True, cache=cache)
+        return tree, cache
+
+    def test_tree(self):
+        tree, cache = self._load()
+        self.assertEqual(_shape(tree), ('World', 1407, [
+            ('Europe', 112, [('France', 66), ('Spain', 46)]),
+            ('South Asia', 1295, [('India', 1295)])]))
+        self.assertEqual(cache.downloads, 2)
+
+    def test_endpoints_fetched_in_parallel(self):
+        # each request is only answered once both have arrived
+        self.server.barrier = threading.Barrier(2, timeout=5)
+        tree, _ = self._load()
+        self.assertEqual(tree.data_size, 1407)
+
+    def test_fresh_responses_are_not_requested(self):
+        self._load()
+        tree, cache = self._load()
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual((cache.hits, cache.downloads), (2, 0))
+        self.assertEqual(tree.data_size, 1407)
+
+    def test_revalidated(self):
+        self._load()
+        tree, cache = self._load(ttl=0)
+        for path, etag in self.server.requests[2:]:
+            self.assertEqual(etag, self.server.etags[path])
+        self.assertEqual((cache.revalidated, cache.downloads), (2, 0))
+        self.assertEqual(tree.data_size, 1407)
+
+    def test_changed_response_is_downloaded(self):
+        self._load()
+        rows = self.server.indicators['SP.POP.TOTL']
+        france = next(row for row in rows
+                      if row['country']['value'] == 'France')
+        france['value'] = 67
+        tree, cache = self._load(ttl=0)
+        self.assertEqual((cache.revalidated, cache.downloads), (1, 1))
+        self.assertEqual(tree.data_size, 1408)
+
+    def test_stale_responses_used_without_network(self):
+        self._load()
+        self.server.stop()
+        tree, cache = self._load(ttl=0, retries=0)
+        self.assertEqual(cache.stale, 2)
+        self.assertEqual(tree.data_size, 1407)
+
+    def test_stale_responses_used_after_server_errors(self):
+        self._load()
+        self.server.failures = 4
+        tree, cache = self._load(ttl=0, retries=1)
+        self.assertEqual(len(self.server.requests), 6)
+        self.assertEqual(cache.stale, 2)
+        self.assertEqual(tree.data_size, 1407)
+
+    def test_offline_replay(self):
+        self._load()
+        tree, cache = self._load(offline=True, ttl=0)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(cache.stale, 2)
+        self.assertEqual(tree.data_size, 1407)
+        with self.assertRaises(FileNotFoundError):
+            cache.fetch(self.server.url + '/other')
+
+    def test_retry_server_error(self):
+        self.server.failures = 2
+        tree, cache = self._load()
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(cache.downloads, 2)
+        self.assertEqual(tree.data_size, 1407)
+
+    def test_errors(self):
+        cache = ResponseCache(self.folder, retries=1)
+        with self.assertRaises(urllib.error.HTTPError):
+            cache.fetch(self.server.url + '/other')
+        # a missing page is not requested again
+        self.assertEqual(len(self.server.requests), 1)
+        self.server.failures = 2
+        with self.assertRaises(urllib.error.HTTPError):
+            cache.fetch(self.server.url + '/countries?page=1')
+        self.assertEqual(len(self.server.requests), 3)
+
+
+class IterIndicatorTest(unittest.TestCase):
+    def setUp(self):
+        regions = {'Region {}'.format(r): {'Country {}-{}'.format(r, c): 0
+                                           for c in range(30)}
+                   for r in range(7)}
+        aggregates = ['Aggregate {}'.format(a) for a in range(40)]
+        self.server = StandInServer(regions, aggregates)
+        self.folder = tempfile.mkdtemp()
+        self.cache = ResponseCache(self.folder)
+        self.base = self.server.url + '/countries'
+
+        # 55 years of every country and aggregate, and of a country that is
+        # not in the metadata, with a few missing values
+        rows = []
+        self.expected = []
+        for year in range(1960, 2015):
+            for metadata in self.server.countries + [
+                    {'id': 'XXX', 'iso2Code': 'XX', 'name': 'Unknown',
+                     'region': None}]:
+                value = None if (year + len(rows)) % 11 == 0 else len(rows)
+                rows.append({'country': {'id': metadata['iso2Code'],
+                                         'value': metadata['name']},
+                             'countryiso3code': metadata['id'],
+                             'date': str(year), 'value': value})
+                region = None if metadata['region'] is None else \
+                    metadata['region']['value'].strip()
+                if value is not None and region != 'Aggregates':
+                    self.expected.append((metadata['name'], region,
+                                          str(year), value))
+        self.server.indicators['X'] = rows
+        self.server.indicators['EMPTY'] = []
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.folder)
+
+    def _rows(self, indicator='X', **kwargs):
+        return population.iter_indicator(indicator, '1960:2014', self.cache,
+                                         self.base, **kwargs)
+
+    def _indicator_pages(self):
+        return [urllib.parse.parse_qs(urllib.parse.urlsplit(path).query)
+                ['page'][0] for path, _ in self.server.requests
+                if '/indicators/' in path]
+
+    def test_every_row(self):
+        self.assertEqual(list(self._rows(per_page=500, workers=3)),
+                         self.expected)
+        # 13,805 rows in 28 pages, each fetched once
+        self.assertEqual(len(self.server.indicators['X']), 13805)
+        self.assertEqual(sorted(self._indicator_pages(), key=int),
+                         [str(page) for page in range(1, 29)])
+
+    def test_pages_fetched_concurrently(self):
+        self.server.delay = 0.02
+        self.assertEqual(list(self._rows(per_page=500, workers=3)),
+                         self.expected)
+        self.assertGreater(self.server.most_in_flight, 1)
+        self.assertLessEqual(self.server.most_in_flight, 4)
+
+    def test_pages_fetched_as_rows_are_used(self):
+        rows = self._rows(per_page=500, workers=2)
+        self.assertEqual(next(rows), self.expected[0])
+        # the first page, and at most two more
+        self.assertLessEqual(len(self._indicator_pages()), 3)
+        rows.close()
+
+    def test_cached_pages(self):
+        list(self._rows(per_page=2000))
+        requests = len(self.server.requests)
+        self.assertEqual(list(self._rows(per_page=2000)), self.expected)
+        self.assertEqual(len(self.server.requests), requests)
+
+    def test_no_rows(self):
+        self.assertEqual(list(self._rows('EMPTY')), [])
+
+    def test_get_countries(self):
+        countries = population.get_countries(self.cache, self.base, 50, 3)
+        self.assertEqual(len(countries), 2 * (7 * 30 + 40))
+        self.assertEqual(countries['C00'], ('Aggregate 0', 'Aggregates'))
+        self.assertEqual(countries['C01'], ('Country 0-0', 'Region 0'))
+        self.assertEqual(countries['01'], ('Country 0-0', 'Region 0'))
+
+    def test_parse_page(self):
+        page = [{'page': 1, 'pages': 1}, [{'a': [1, ']']}, {'b': None}]]
+        for text in [json.dumps(page), json.dumps(page, indent=2),
+                     json.dumps(page, separators=(',', ':'))]:
+            metadata, rows = population._parse_page(text.encode())
+            self.assertEqual(metadata, page[0])
+            self.assertEqual(list(rows), page[1])
+        message = [{'message': [{'id': '120', 'key': 'Invalid value'}]}]
+        for body in [json.dumps(message), '', '{}', '[[]]']:
+            with self.assertRaises(ValueError):
+                population._parse_page(body.encode())
+        with self.assertRaises(ValueError):
+            list(population._parse_page(b'[{}, [{}; {}]]')[1])
+
+
+##############################################################################
+# Helpers
+##############################################################################
+def _country_rows(regions, aggregates):
+    """Return the country metadata and the 2014 population rows of the
+    countries in <regions> and the aggregates named in <aggregates>, with
+    the aggregates spread among the countries.
+
+    @type regions: dict[str, dict[str, int | None]]
+    @type aggregates: list[str]
+    @rtype: (list[dict], list[dict])
+    """
+    countries = [(name, region, population)
+                 for region, populations in regions.items()
+                 for name, population in populations.items()]
+    for i, name in enumerate(aggregates):
+        countries.insert(i * len(countries) // len(aggregates),
+                         (name, 'Aggregates', 10 ** 9))
+    metadata = []
+    rows = []
+    for i, (name, region, population) in enumerate(countries):
+        code = 'C{:02}'.format(i)
+        metadata.append({'id': code, 'iso2Code': code[1:],
+                         'name': name, 'region': {'value': region + ' '}})
+        rows.append({'country': {'id': code[1:], 'value': name},
+                     'countryiso3code': code, 'date': '2014',
+                     'value': population})
+    return metadata, rows
+
+
+def _etag(body):
+    """Return the ETag the stand-in API sends with <body>.
+
+    @type body: bytes
+    @rtype: str
+    """
+    return '"{}"'.format(hashlib.sha1(body).hexdigest())
+
+
+def _shape(tree):
+    """Return the names and sizes of <tree> as nested tuples, leaves as
+    pairs.
+
+    @type tree: AbstractTree
+    @rtype: tuple
+    """
+    if tree._subtrees == []:
+        return tree._root, tree.data_size
+    return (tree._root, tree.data_size,
+            [_shape(subtree) for subtree in tree._subtrees])
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
@@ -0,0 +1,115 @@
+"""Bulk rasterisation of treemaps
+
+=== Module Description ===
+This module draws many rectangles at once into a pygame Surface, through a
+NumPy view of its pixels (pygame.surfarray), instead of calling
+pygame.draw.rect once per rectangle.
+
+The rectangles are clipped to the surface and their colours converted to
+pixel values with a few array operations, then each rectangle is filled,
+in order, by assigning its colour to a slice of the pixel array. The
+result is the same as drawing the rectangles in order with
+pygame.draw.rect: each pixel gets the colour of the last rectangle covering
+it. No memory is used per pixel, and the only work done per rectangle in
+Python is one slice assignment.
+"""
+from itertools import chain
+
+import numpy as np
+import pygame
+
+
+def fill_rects(surface, rects, colours):
+    """Fill each rectangle in <rects> with the colour at the same position
+    in <colours>, on <surface>.
+
+    The parts of rectangles outside the surface, and rectangles with no
+    area, are ignored.
+
+    @type surface: pygame.Surface
+    @type rects: list[(int, int, int, int)]
+    @type colours: list[(int, int, int)]
+    @rtype: None
+    """
+    if not rects:
+        return
+    r = np.fromiter(chain.from_iterable(rects), dtype=np.int64,
+                    count=4 * len(rects)).reshape(-1, 4)
+    rgb = np.fromiter(chain.from_iterable(colours), dtype=np.int64,
+                      count=3 * len(colours)).reshape(-1, 3)
+    fill_arrays(surface, r[:, 0], r[:, 1], r[:, 2], r[:, 3],
+                (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2])
+
+
+def draw_treemap(surface, treemap):
+    """Draw the (rect, colour) pairs returned by generate_treemap on
+    <surface>, in order.
+
+    @type surface: pygame.Surface
+    @type treemap: list[((int, int, int, int), (int, int, int))]
+    @rtype: None
+    """
+    if not treemap:
+        return
+    # each pair flattens to x, y, width, height, r, g, b
+    values = np.fromiter(chain.from_iterable(chain.from_iterable(treemap)),
+                         dtype=np.int64, count=7 * len(treemap))
+    values = values.reshape(-1, 7)
+    fill_arrays(surface, values[:, 0], values[:, 1], values[:, 2],
+                values[:, 3], (values[:, 4] << 16) | (values[:, 5] << 8) |
+                values[:, 6])
+
+
+def fill_arrays(surface, x, y, width, height, colour):
+    """Fill the rectangles described by the arrays <x>, <y>, <width> and
+    <height> on <surface>, each with the colour at the same position in
+    <colour>, packed as 0xRRGGBB.
+
+    @type surface: pygame.Surface
+    @type x: numpy.ndarray
+    @type y: numpy.ndarray
+    @type width: numpy.ndarray
+    @type height: numpy.ndarray
+    @type colour: numpy.ndarray
+    @rtype: None
+    """
+    surface_width, surface_height = surface.get_size()
+    left = np.clip(x, 0, surface_width)
+    top = np.clip(y, 0, surface_height)
+    right = np.clip(x + width, 0, surface_width)
+    bottom = np.clip(y + height, 0, surface_height)
+    visible = (right > left) & (bottom > top)
+    colour = np.asarray(colour, dtype=np.int64)[visible]
+    if len(colour) == 0:
+        return
+    if surface.get_bytesize() in (2, 4):
+        pixels = pygame.surfarray.pixels2d(surface)
+        colour = _map_colours(surface, colour).tolist()
+    else:
+        pixels = pygame.surfarray.pixels3d(surface)
+        colour = [(value >> 16, (value >> 8) & 0xFF, value & 0xFF)
+                  for value in colour.tolist()]
+    # in order, so that the last rectangle covering a pixel sets its colour
+    for x1, y1, x2, y2, value in zip(left[visible].tolist(),
+                                     top[visible].tolist(),
+                                     right[visible].tolist(),
+                                     bottom[visible].tolist(), colour):
+        pixels[x1:x2, y1:y2] = value
+    # the surface stays locked as long as the pixel array exists
+    del pixels
+
+
+def _map_colours(surface, colour):
+    """Return the pixel values of <surface>'s format for the colours in
+    <colour>, packed as 0xRRGGBB, like surface.map_rgb does for one colour.
+
+    @type surface: pygame.Surface
+    @type colour: numpy.ndarray
+    @rtype: numpy.ndarray
+    """
+    red_shift, green_shift, blue_shift, _ = surface.get_shifts()
+    red_loss, green_loss, blue_loss, _ = surface.get_losses()
+    alpha_mask = surface.get_masks()[3]
+    return (((colour >> 16) >> red_loss) << red_shift) | \
+        ((((colour >> 8) & 0xFF) >> green_loss) << green_shift) | \
+        (((colour & 0xFF) >> blue_loss) << blue_shift) | alpha_mask
@@ -0,0 +1,66 @@
+"""Tests for raster.
+
+=== Module Description ===
+These tests check that the rectangles filled in bulk have exactly the same
+pixels as those drawn one at a time with pygame.draw.rect.
+"""
+import os
+
+import unittest
+from hypothesis import given, settings
+from hypothesis.strategies import integers, lists, sampled_from, tuples
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+import pygame
+
+import raster
+import vector_layout
+from tree_fixtures import make_tree
+
+RECTS = lists(tuples(integers(-30, 130), integers(-30, 100),
+                     integers(-10, 80), integers(-10, 80)), max_size=40)
+COLOURS = tuples(integers(0, 255), integers(0, 255), integers(0, 255))
+
+
+class FillRectsTest(unittest.TestCase):
+    @settings(max_examples=50)
+    @given(RECTS, lists(COLOURS, min_size=40, max_size=40),
+           sampled_from([32, 24, 16]))
+    def test_same_as_draw_rect(self, rects, colours, depth):
+        colours = colours[:len(rects)]
+        expected = pygame.Surface((100, 80), 0, depth)
+        for rect, colour in zip(rects, colours):
+            pygame.draw.rect(expected, colour, rect)
+        actual = pygame.Surface((100, 80), 0, depth)
+        raster.fill_rects(actual, rects, colours)
+        self.assertEqual(pygame.image.tostring(actual, 'RGB'),
+                         pygame.image.tostring(expected, 'RGB'))
+
+    def test_alpha_surface(self):
+        rects = [(0, 0, 10, 10), (5, 5, 10, 10)]
+        colours = [(1, 2, 3), (200, 100, 50)]
+        expected = pygame.Surface((20, 20), pygame.SRCALPHA, 32)
+        for rect, colour in zip(rects, colours):
+            pygame.draw.rect(expected, colour, rect)
+        actual = pygame.Surface((20, 20), pygame.SRCALPHA, 32)
+        raster.draw_treemap(actual, list(zip(rects, colours)))
+        self.assertEqual(pygame.image.tostring(actual, 'RGBA'),
+                         pygame.image.tostring(expected, 'RGBA'))
+
+
+class TreemapArraysTest(unittest.TestCase):
+    @given(integers(min_value=1, max_value=60))
+    def test_same_pixels_as_generate_treemap(self, seed):
+        tree = make_tree(seed)
+        rect = (0, 0, 300, 200)
+        expected = pygame.Surface((300, 200))
+        for leaf_rect, colour in tree.generate_treemap(rect):
+            pygame.draw.rect(expected, colour, leaf_rect)
+        actual = pygame.Surface((300, 200))
+        raster.fill_arrays(actual, *vector_layout.treemap_arrays(tree, rect))
+        self.assertEqual(pygame.image.tostring(actual, 'RGB'),
+                         pygame.image.tostring(expected, 'RGB'))
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
@@ -0,0 +1,525 @@
+"""Batch treemap snapshots
+
+=== Module Description ===
+This module renders the treemaps of many roots (folders, or the World Bank
+population data) at many sizes in one batch, spread over several
+processes.
+
+All the jobs run in a single pool of worker processes. The tree of each
+root is scanned once, by one job, which saves it to a temporary file; then
+each size is one job, which loads the tree and lays it out, draws it and
+saves it with snapshot.save_tree. Only the names of the files go in, and
+the timings come back. As the sizes of a root are rendered by different
+processes, the throughput grows with the number of processes even when
+there are fewer roots than processes.
+
+A job that fails does not stop the batch: the error is recorded in its
+result, for the scan or for the image that could not be written, and the
+other jobs go on. This is true even of a job whose process dies, e.g.
+killed for using too much memory: the jobs that were running with it are
+run again, one at a time, until the one that killed it is found.
+
+Run this module to render a batch from the command line, e.g.
+
+    python render_farm.py /srv/a /srv/b --out-dir snaps \\
+        --size 320x200 --size 1920x1080 --size 3840x2160
+"""
+import argparse
+import collections
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+
+import snapshot
+from tree_data import FileSystemTree
+from population import PopulationTree
+
+
+# The sizes rendered when none are given on the command line.
+DEFAULT_SIZES = [(320, 200), (1920, 1080), (3840, 2160)]
+
+
+class JobResult:
+    """The outcome of rendering one root at every size.
+
+    === Public Attributes ===
+    @type root: str
+        The folder rendered, or 'population'.
+    @type scan: float | None
+        The time taken to build the tree, in seconds, or None if it could
+        not be built.
+    @type error: str | None
+        Why the tree could not be built, or None if it was.
+    @type images: list[ImageResult]
+        The result for each size, in the order requested; empty if the
+        tree could not be built.
+    """
+    def __init__(self, root):
+        """Initialize the result of a job on <root> that has not run.
+
+        @type self: JobResult
+        @type root: str
+        @rtype: None
+        """
+        self.root = root
+        self.scan = None
+        self.error = None
+        self.images = []
+
+    def failed(self):
+        """Return whether the scan or any of the images failed.
+
+        @type self: JobResult
+        @rtype: bool
+        """
+        return self.error is not None or \
+            any(image.error is not None for image in self.images)
+
+
+class ImageResult:
+    """The outcome of rendering one root at one size.
+
+    === Public Attributes ===
+    @type output: str
+        The PNG file written.
+    @type size: (int, int)
+        The width and height of the image.
+    @type timings: dict[str, float]
+        The time taken by each phase after the scan, in seconds.
+    @type error: str | None
+        Why the image could not be written, or None if it was.
+    """
+    def __init__(self, output, size):
+        """Initialize the result of an image that has not been rendered.
+
+        @type self: ImageResult
+        @type output: str
+        @type size: (int, int)
+        @rtype: None
+        """
+        self.output = output
+        self.size = size
+        self.timings = {}
+        self.error = None
+
+
+def render_batch(roots, sizes, out_dir, workers=None, engine=None):
+    """Render the treemap of every root in <roots> at every size in
+    <sizes>, into PNG files in <out_dir>, and return the result of each
+    root's job, in the same order as <roots>.
+
+    The files are named after the last part of each root's path and the
+    size, e.g. 'logs-1920x1080.png'; roots whose names clash are told apart
+    by their position in <roots>.
+
+    @type roots: list[str]
+        folders, or 'population' for the World Bank population data
+    @type sizes: list[(int, int)]
+    @type out_dir: str
+    @type workers: int | None
+        the number of processes, or None for one per processor
+    @type engine: function | None
+        the layout engine, or None for the default slice-and-dice layout
+    @rtype: list[JobResult]
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    batch = _Batch(roots, sizes, out_dir, engine)
+    try:
+        _run_jobs(batch.first_jobs(), workers, batch.finish)
+    finally:
+        shutil.rmtree(batch.tree_dir)
+    return batch.results
+
+
+def render_root(root, outputs, sizes, engine=None):
+    """Build the tree of <root> once, then write its treemap at each size
+    in <sizes> to the file at the same position in <outputs>, in this
+    process.
+
+    Errors are recorded in the result instead of being raised.
+
+    @type root: str
+    @type outputs: list[str]
+    @type sizes: list[(int, int)]
+    @type engine: function | None
+    @rtype: JobResult
+    """
+    result = JobResult(root)
+    start = time.perf_counter()
+    try:
+        tree = _build_tree(root)
+    except Exception as error:
+        result.error = _describe(error)
+        return result
+    result.scan = time.perf_counter() - start
+    result.images = [_render_image(tree, output, size, engine)
+                     for output, size in zip(outputs, sizes)]
+    return result
+
+
+def format_results(results, elapsed):
+    """Return a report of <results>: a line per root and per image, and a
+    summary of the batch, which took <elapsed> seconds.
+
+    @type results: list[JobResult]
+    @type elapsed: float
+    @rtype: str
+    """
+    lines = []
+    written = 0
+    for result in results:
+        if result.error is not None:
+            lines.append('{}: FAILED: {}'.format(result.root, result.error))
+            continue
+        lines.append('{}: scan {:.3f} s'.format(result.root, result.scan))
+        for image in result.images:
+            if image.error is not None:
+                lines.append('  {}: FAILED: {}'.format(image.output,
+                                                       image.error))
+            else:
+                written += 1
+                lines.append('  {}: {}'.format(
+                    image.output, snapshot.format_timings(image.timings)))
+    failed = sum(1 for result in results if result.failed())
+    lines.append('{} images from {} roots in {:.3f} s ({:.2f} images/s), '
+                 '{} roots with failures'.format(
+                     written, len(results), elapsed,
+                     written / elapsed if elapsed else 0.0, failed))
+    return '\n'.join(lines)
+
+
+class _Batch:
+    """The jobs of one render_batch, and their results so far.
+
+    === Public Attributes ===
+    @type results: list[JobResult]
+        The result of each root.
+    @type tree_dir: str
+        The temporary folder the tree of each root is saved to.
+
+    === Private Attributes ===
+    @type _roots: list[str]
+        The roots rendered.
+    @type _images: list[list[(str, (int, int))]]
+        The file written and the size of each image of each root.
+    @type _engine: function | None
+        The layout engine.
+    """
+    def __init__(self, roots, sizes, out_dir, engine):
+        """Initialize a batch rendering <roots> at <sizes> into <out_dir>,
+        with nothing run yet.
+
+        @type self: _Batch
+        @type roots: list[str]
+        @type sizes: list[(int, int)]
+        @type out_dir: str
+        @type engine: function | None
+        @rtype: None
+        """
+        self._roots = roots
+        self._images = []
+        for name in _output_names(roots):
+            self._images.append([
+                (os.path.join(out_dir, '{}-{}x{}.png'.format(
+                    name, width, height)), (width, height))
+                for width, height in sizes])
+        self._engine = engine
+        self.results = [JobResult(root) for root in roots]
+        self.tree_dir = tempfile.mkdtemp()
+
+    def first_jobs(self):
+        """Return the job scanning each root.
+
+        @type self: _Batch
+        @rtype: list[(object, function, tuple)]
+        """
+        return [((i, None), _scan_to_file, (root, self._tree_file(i)))
+                for i, root in enumerate(self._roots)]
+
+    def finish(self, key, outcome):
+        """Record <outcome>, the return value of the job <key>, or the error
+        raised if its process died, and return the jobs it leads to: one
+        per size once a root has been scanned.
+
+        @type self: _Batch
+        @type key: (int, int | None)
+            the position of the root, and of the size, or None for the scan
+        @type outcome: JobResult | ImageResult | Exception
+        @rtype: list[(object, function, tuple)]
+        """
+        i, j = key
+        if j is not None:
+            if isinstance(outcome, Exception):
+                error = outcome
+                outcome = ImageResult(*self._images[i][j])
+                outcome.error = _describe(error)
+            self.results[i].images[j] = outcome
+            return []
+        if isinstance(outcome, Exception):
+            self.results[i].error = _describe(outcome)
+            return []
+        self.results[i] = outcome
+        if outcome.error is not None:
+            return []
+        outcome.images.extend([None] * len(self._images[i]))
+        return [((i, j), _render_from_file,
+                 (self._tree_file(i), output, size, self._engine))
+                for j, (output, size) in enumerate(self._images[i])]
+
+    def _tree_file(self, i):
+        """Return the file the tree of the root at position <i> is saved
+        to.
+
+        @type self: _Batch
+        @type i: int
+        @rtype: str
+        """
+        return os.path.join(self.tree_dir, str(i))
+
+
+def _run_jobs(jobs, workers, finish):
+    """Run <jobs> in a pool of <workers> processes, passing the key and the
+    return value of each job that is done (or the error raised if its
+    process died) to <finish>, which returns the jobs to run next.
+
+    Each job is a (key, function, arguments) tuple. At most <workers> jobs
+    are given to the pool at once, so when a process dies, only the jobs
+    running then are lost: the pool is replaced, and those jobs are run
+    again one at a time, so that only the job that killed it fails.
+
+    The processes are started with forkserver (or spawn where it is not
+    available), so that they never copy this process, whose pool has
+    threads of its own.
+
+    @type jobs: list[(object, function, tuple)]
+    @type workers: int
+    @type finish: function
+    @rtype: None
+    """
+    method = 'forkserver' if 'forkserver' in \
+        multiprocessing.get_all_start_methods() else 'spawn'
+    context = multiprocessing.get_context(method)
+    queue = collections.deque(jobs)
+    suspects = collections.deque()
+    # maps the future of each job given to the pool to the job, and whether
+    # it is running alone
+    running = {}
+    pool = None
+    try:
+        while queue or suspects or running:
+            if pool is None:
+                pool = concurrent.futures.ProcessPoolExecutor(
+                    workers, mp_context=context)
+            _submit(pool, workers, queue, suspects, running)
+            if _wait(running):
+                # the pool is broken: start a new one
+                pool.shutdown()
+                pool = None
+            _collect(running, queue, suspects, finish)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def _submit(pool, workers, queue, suspects, running):
+    """Give <pool> the next jobs to run: the first of <suspects> alone once
+    nothing else is running, or else jobs from <queue> until <workers> are
+    running. Record their futures in <running>.
+
+    @type pool: concurrent.futures.ProcessPoolExecutor
+    @type workers: int
+    @type queue: collections.deque
+    @type suspects: collections.deque
+    @type running: dict[concurrent.futures.Future, ((object, function,
+                                                     tuple), bool)]
+    @rtype: None
+    """
+    if suspects:
+        if not running:
+            job = suspects.popleft()
+            running[pool.submit(job[1], *job[2])] = (job, True)
+        return
+    while queue and len(running) < workers:
+        job = queue.popleft()
+        running[pool.submit(job[1], *job[2])] = (job, False)
+
+
+def _wait(running):
+    """Wait until at least one of the futures in <running> is done, and
+    return whether the pool running them is broken, in which case all of
+    them are done.
+
+    @type running: dict[concurrent.futures.Future, object]
+    @rtype: bool
+    """
+    done = concurrent.futures.wait(
+        running, return_when=concurrent.futures.FIRST_COMPLETED)[0]
+    if not any(isinstance(future.exception(), BrokenProcessPool)
+               for future in done):
+        return False
+    concurrent.futures.wait(running)
+    return True
+
+
+def _collect(running, queue, suspects, finish):
+    """Remove the jobs that are done from <running>, and pass their results
+    to <finish>, adding the jobs it returns to <queue>; a job lost with a
+    broken pool while not running alone is added to <suspects> instead.
+
+    @type running: dict[concurrent.futures.Future, ((object, function,
+                                                     tuple), bool)]
+    @type queue: collections.deque
+    @type suspects: collections.deque
+    @type finish: function
+    @rtype: None
+    """
+    for future in [future for future in running if future.done()]:
+        job, alone = running.pop(future)
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool) and not alone:
+            suspects.append(job)
+        else:
+            queue.extend(finish(job[0], error if error is not None
+                                else future.result()))
+
+
+def _scan_to_file(root, tree_file):
+    """Build the tree of <root>, and save it to <tree_file> for the jobs
+    that render it.
+
+    This is the first job of each root in render_batch. Errors are recorded
+    in the result instead of being raised.
+
+    @type root: str
+    @type tree_file: str
+    @rtype: JobResult
+    """
+    result = JobResult(root)
+    start = time.perf_counter()
+    try:
+        tree = _build_tree(root)
+    except Exception as error:
+        result.error = _describe(error)
+        return result
+    result.scan = time.perf_counter() - start
+    with open(tree_file, 'wb') as file:
+        pickle.dump(tree, file, pickle.HIGHEST_PROTOCOL)
+    return result
+
+
+def _render_from_file(tree_file, output, size, engine):
+    """Write the treemap of the tree saved in <tree_file> by _scan_to_file
+    to <output>, at <size>.
+
+    This is the job of each root and size in render_batch.
+
+    @type tree_file: str
+    @type output: str
+    @type size: (int, int)
+    @type engine: function | None
+    @rtype: ImageResult
+    """
+    with open(tree_file, 'rb') as file:
+        tree = pickle.load(file)
+    return _render_image(tree, output, size, engine)
+
+
+def _render_image(tree, output, size, engine):
+    """Write the treemap of <tree> to <output>, at <size>, and return the
+    result. Errors are recorded in the result instead of being raised.
+
+    @type tree: AbstractTree
+    @type output: str
+    @type size: (int, int)
+    @type engine: function | None
+    @rtype: ImageResult
+    """
+    image = ImageResult(output, size)
+    try:
+        snapshot.save_tree(tree, output, size[0], size[1], engine,
+                           image.timings)
+    except Exception as error:
+        image.error = _describe(error)
+    return image
+
+
+def _build_tree(root):
+    """Return the tree of <root>: a folder, or 'population'.
+
+    @type root: str
+    @rtype: AbstractTree
+    """
+    if root == 'population':
+        return PopulationTree(True)
+    if not os.path.exists(root):
+        raise FileNotFoundError('no such file or folder: {!r}'.format(root))
+    return FileSystemTree.from_path(root)
+
+
+def _output_names(roots):
+    """Return the name each root's images start with: the last part of its
+    path, followed by its position in <roots> if another root has the same
+    name.
+
+    @type roots: list[str]
+    @rtype: list[str]
+    """
+    names = [os.path.basename(os.path.normpath(root)) or 'root'
+             for root in roots]
+    return [name if names.count(name) == 1 else '{}-{}'.format(name, i)
+            for i, name in enumerate(names)]
+
+
+def _describe(error):
+    """Return a one-line description of <error>.
+
+    @type error: Exception
+    @rtype: str
+    """
+    return '{}: {}'.format(type(error).__name__, error)
+
+
+def main(argv=None):
+    """Render the batch described by the command-line arguments <argv>
+    (by default, those of this process), print the report, and return 1 if
+    anything failed, or 0 otherwise.
+
+    @type argv: list[str] | None
+    @rtype: int
+    """
+    parser = argparse.ArgumentParser(
+        description='Write the treemaps of many folders, at many sizes, to '
+                    'PNG files.')
+    parser.add_argument('roots', nargs='+',
+                        help="the folders to scan, or 'population'")
+    parser.add_argument('--out-dir', required=True,
+                        help='the folder to write the PNG files to')
+    parser.add_argument('--size', type=snapshot.parse_size, action='append',
+                        dest='sizes', help='an image size, e.g. 3840x2160; '
+                        'may be repeated (default: 320x200, 1920x1080 and '
+                        '3840x2160)')
+    parser.add_argument('--engine', choices=sorted(snapshot.ENGINES),
+                        default='slice-and-dice', help='the layout engine')
+    parser.add_argument('--workers', type=int,
+                        help='the number of processes (default: one per '
+                             'processor)')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    results = render_batch(args.roots, args.sizes or DEFAULT_SIZES,
+                           args.out_dir, args.workers,
+                           snapshot.ENGINES[args.engine])
+    print(format_results(results, time.perf_counter() - start))
+    return 1 if any(result.failed() for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
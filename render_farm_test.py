@@ -0,0 +1,114 @@
+"""Tests for render_farm.
+
+=== Module Description ===
+These tests render small batches in a pool of worker processes, and check
+that every image is written with the requested size, and that failures are
+reported without stopping the other jobs.
+"""
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+
+import unittest
+
+import pygame
+
+import render_farm
+from tree_data import squarify
+
+
+EXAMPLE_PATH = os.path.join('example-data', 'B')
+TESTING_PATH = 'Testing'
+
+
+class RenderBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_every_root_at_every_size(self):
+        sizes = [(40, 30), (64, 48), (100, 20)]
+        results = render_farm.render_batch([EXAMPLE_PATH, TESTING_PATH],
+                                           sizes, self.folder, 2)
+        self.assertEqual([result.root for result in results],
+                         [EXAMPLE_PATH, TESTING_PATH])
+        for result in results:
+            self.assertFalse(result.failed())
+            self.assertGreaterEqual(result.scan, 0)
+            self.assertEqual([image.size for image in result.images], sizes)
+            for image in result.images:
+                self.assertEqual(pygame.image.load(image.output).get_size(),
+                                 image.size)
+                self.assertEqual(sorted(image.timings),
+                                 ['layout', 'raster', 'save'])
+        self.assertEqual(len(os.listdir(self.folder)), 6)
+
+    def test_failures_do_not_stop_the_batch(self):
+        missing = os.path.join(self.folder, 'missing')
+        results = render_farm.render_batch(
+            [missing, EXAMPLE_PATH], [(-1, 10), (20, 10)], self.folder, 2)
+        self.assertTrue(results[0].failed())
+        self.assertIn('FileNotFoundError', results[0].error)
+        self.assertEqual(results[0].images, [])
+        self.assertTrue(results[1].failed())
+        self.assertIsNone(results[1].error)
+        self.assertIsNotNone(results[1].images[0].error)
+        self.assertIsNone(results[1].images[1].error)
+        self.assertTrue(os.path.exists(results[1].images[1].output))
+
+    def test_dead_worker_does_not_stop_the_batch(self):
+        roots = [EXAMPLE_PATH, TESTING_PATH, EXAMPLE_PATH]
+        results = render_farm.render_batch(roots, [(20, 10), (13, 10),
+                                                   (30, 10)],
+                                           self.folder, 2, _crash_at_13)
+        for result in results:
+            self.assertIsNone(result.error)
+            self.assertEqual([image.error is None for image in result.images],
+                             [True, False, True])
+            self.assertIn('BrokenProcessPool', result.images[1].error)
+        self.assertEqual(len(os.listdir(self.folder)), 6)
+
+    def test_render_root(self):
+        output = os.path.join(self.folder, 'x.png')
+        result = render_farm.render_root(EXAMPLE_PATH, [output], [(20, 10)])
+        self.assertFalse(result.failed())
+        self.assertEqual(pygame.image.load(output).get_size(), (20, 10))
+
+    def test_clashing_names(self):
+        self.assertEqual(render_farm._output_names(['a/logs', 'b/logs/',
+                                                    'c/x']),
+                         ['logs-0', 'logs-1', 'x'])
+
+    def test_command_line(self):
+        printed = io.StringIO()
+        with contextlib.redirect_stdout(printed):
+            status = render_farm.main([EXAMPLE_PATH, '--out-dir',
+                                       self.folder, '--size', '30x20',
+                                       '--workers', '1'])
+        self.assertEqual(status, 0)
+        self.assertEqual(os.listdir(self.folder), ['B-30x20.png'])
+        self.assertIn('1 images from 1 roots', printed.getvalue())
+
+
+##############################################################################
+# Helpers
+##############################################################################
+def _crash_at_13(tree, rect):
+    """Kill the worker process running this job if <rect> is 13 pixels
+    wide, or lay out <tree> in <rect> with squarify otherwise.
+
+    @type tree: AbstractTree
+    @type rect: (int, int, int, int)
+    @rtype: list[(AbstractTree, (int, int, int, int))]
+    """
+    if rect[2] == 13:
+        os._exit(1)
+    return squarify(tree, rect)
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
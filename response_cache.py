@@ -0,0 +1,267 @@
+"""Persistent HTTP response cache
+
+=== Module Description ===
+This module contains ResponseCache, an on-disk record of the responses to
+the HTTP GET requests made for the World Bank population data. It is passed
+to PopulationTree so that the data is only downloaded when it may have
+changed, and so that the tree can still be built without a network.
+
+Each response is kept in its own file in the cache folder, named after a
+hash of its url: a first line of JSON with the url, the time it was fetched
+and its ETag and Last-Modified headers, followed by the body exactly as it
+was received. Several responses can therefore be fetched and stored by
+different threads at once.
+
+A response younger than the cache's time to live is used without any
+request. An older one is revalidated with a conditional request
+(If-None-Match / If-Modified-Since): if the server answers 304 Not Modified
+the stored body is used again, without downloading it. If the server
+cannot be reached, or answers with a server error, even after retrying, the
+stored body is used however old it is.
+
+A cache folder can also be replayed as a set of recorded fixtures, with
+offline=True: every response then comes from the folder, and no request is
+ever made.
+"""
+import hashlib
+import http.client
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+# Version number written in each response file; files with any other
+# version are ignored.
+CACHE_VERSION = 1
+
+# How long, in seconds, a stored response is used without revalidating it.
+DEFAULT_TTL = 24 * 60 * 60
+
+# How long, in seconds, to wait for the server to answer each request.
+DEFAULT_TIMEOUT = 10.0
+
+# The number of times a request that failed (no answer, or a server error)
+# is tried again, and the wait before the first retry, in seconds; the wait
+# doubles before each further retry.
+DEFAULT_RETRIES = 2
+RETRY_DELAY = 0.25
+
+
+class ResponseCache:
+    """A cache of HTTP responses, revalidated once they are older than a
+    time to live.
+
+    === Public Attributes ===
+    @type hits: int
+        The number of responses used from the cache without any request.
+    @type revalidated: int
+        The number of stored responses the server said had not changed.
+    @type downloads: int
+        The number of responses downloaded in full.
+    @type stale: int
+        The number of stored responses used after their time to live
+        because the server could not be reached or failed (or the cache is
+        offline).
+
+    === Private Attributes ===
+    @type _folder: str
+        The folder the responses are stored in.
+    @type _ttl: float
+        How long, in seconds, a response is used without revalidating it.
+    @type _offline: bool
+        Whether every response must come from the folder, without any
+        request.
+    @type _timeout: float
+        How long, in seconds, to wait for each request.
+    @type _retries: int
+        How many times a failed request is tried again.
+    @type _lock: threading.Lock
+        Protects the counters when responses are fetched by several threads
+        at once.
+    """
+    def __init__(self, folder, ttl=DEFAULT_TTL, offline=False,
+                 timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES):
+        """Initialize a new ResponseCache stored in <folder>, which is
+        created if it does not exist (unless the cache is <offline>).
+
+        @type self: ResponseCache
+        @type folder: str
+        @type ttl: float
+        @type offline: bool
+        @type timeout: float
+        @type retries: int
+        @rtype: None
+        """
+        self.hits = 0
+        self.revalidated = 0
+        self.downloads = 0
+        self.stale = 0
+        self._folder = folder
+        self._ttl = ttl
+        self._offline = offline
+        self._timeout = timeout
+        self._retries = retries
+        self._lock = threading.Lock()
+        if not offline:
+            os.makedirs(folder, exist_ok=True)
+
+    def fetch(self, url):
+        """Return the body of the response to a GET request for <url>.
+
+        Raise FileNotFoundError if the cache is offline and has no response
+        for <url>. Raise urllib.error.HTTPError for an answer other than a
+        success or 304 Not Modified (a server error only if there is no
+        stored response), and OSError if the server cannot be reached and
+        there is no stored response.
+
+        @type self: ResponseCache
+        @type url: str
+        @rtype: bytes
+        """
+        path = self._path(url)
+        header, body = _read_response(path, url)
+        if header is not None:
+            fresh = time.time() - header['fetched'] < self._ttl
+            if fresh or self._offline:
+                self._count('hits' if fresh else 'stale')
+                return body
+        if self._offline:
+            raise FileNotFoundError(
+                'no recorded response for {!r}'.format(url))
+
+        request = urllib.request.Request(url)
+        if header is not None and header.get('etag') is not None:
+            request.add_header('If-None-Match', header['etag'])
+        if header is not None and header.get('last_modified') is not None:
+            request.add_header('If-Modified-Since', header['last_modified'])
+        try:
+            response_headers, new_body = self._request(request)
+        except urllib.error.HTTPError as error:
+            if header is None or (error.code != 304 and error.code < 500):
+                raise
+            if error.code >= 500:
+                # a server error that outlasted the retries: like no answer
+                self._count('stale')
+                return body
+            # not modified: keep the body, and trust it for another ttl
+            header['fetched'] = time.time()
+            _write_response(path, header, body)
+            self._count('revalidated')
+            return body
+        except (OSError, http.client.HTTPException):
+            if header is None:
+                raise
+            self._count('stale')
+            return body
+
+        _write_response(path, {'version': CACHE_VERSION, 'url': url,
+                               'fetched': time.time(),
+                               'etag': response_headers.get('ETag'),
+                               'last_modified':
+                                   response_headers.get('Last-Modified')},
+                        new_body)
+        self._count('downloads')
+        return new_body
+
+    def _request(self, request):
+        """Return the headers and body of the response to <request>,
+        trying again after a failure to reach the server or a server error.
+
+        @type self: ResponseCache
+        @type request: urllib.request.Request
+        @rtype: (http.client.HTTPMessage, bytes)
+        """
+        delay = RETRY_DELAY
+        last_error = None
+        for attempt in range(self._retries + 1):
+            if attempt > 0:
+                time.sleep(delay)
+                delay *= 2
+            try:
+                with urllib.request.urlopen(request,
+                                            timeout=self._timeout) as response:
+                    return response.headers, response.read()
+            except urllib.error.HTTPError as error:
+                # only a server error may go away by trying again
+                if error.code < 500:
+                    raise
+                last_error = error
+            except (OSError, http.client.HTTPException) as error:
+                last_error = error
+        raise last_error
+
+    def _path(self, url):
+        """Return the file the response to <url> is stored in.
+
+        @type self: ResponseCache
+        @type url: str
+        @rtype: str
+        """
+        name = hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self._folder, name + '.http')
+
+    def _count(self, counter):
+        """Add one to the counter named <counter>.
+
+        @type self: ResponseCache
+        @type counter: str
+        @rtype: None
+        """
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        """Return a one-line summary of where the responses came from.
+
+        @type self: ResponseCache
+        @rtype: str
+        """
+        return '{} responses: {} cached, {} revalidated, {} downloaded, ' \
+               '{} stale'.format(self.hits + self.revalidated +
+                                 self.downloads + self.stale, self.hits,
+                                 self.revalidated, self.downloads, self.stale)
+
+
+def _read_response(path, url):
+    """Return the header and body of the response to <url> stored in the
+    file at <path>, or (None, None) if there is no usable response there.
+
+    @type path: str
+    @type url: str
+    @rtype: (dict | None, bytes | None)
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = json.loads(f.readline().decode('utf-8'))
+            body = f.read()
+    except (OSError, ValueError):
+        return None, None
+    if not isinstance(header, dict) or \
+            header.get('version') != CACHE_VERSION or header.get('url') != url:
+        return None, None
+    return header, body
+
+
+def _write_response(path, header, body):
+    """Store <header> and <body> in the file at <path>, replacing it at
+    once so that a reader never sees half a response.
+
+    @type path: str
+    @type header: dict
+    @type body: bytes
+    @rtype: None
+    """
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                         suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            f.write(json.dumps(header).encode('utf-8') + b'\n')
+            f.write(body)
+        os.replace(temp_path, path)
+    except OSError:
+        os.remove(temp_path)
+        raise
@@ -0,0 +1,177 @@
+"""Persistent folder scan cache
+
+=== Module Description ===
+This module contains ScanCache, an on-disk record of the folders seen by
+the last scan of a file system. It is passed to FileSystemTree.from_path so
+that folders which have not changed since the previous scan are not listed
+again.
+
+A folder's modification time changes whenever an entry is added to,
+removed from or renamed inside it, so an unchanged mtime means the cached
+list of names is still correct. Writing to a file does NOT change the
+mtime of its folder, so the sizes of the files in a cached folder are
+always re-read with os.stat: only the directory listing itself is skipped.
+"""
+import json
+import os
+import threading
+import time
+
+from tree_data import scan_dir
+
+
+# Version number written to the cache file; files with any other version
+# are ignored.
+CACHE_VERSION = 1
+
+# Listings taken less than this many nanoseconds after the folder was last
+# modified are not trusted on the next scan: a second change within the
+# file system's timestamp granularity would leave the mtime unchanged.
+RACY_INTERVAL_NS = 2 * 10 ** 9
+
+
+class ScanCache:
+    """A cache of folder listings, validated by each folder's mtime.
+
+    === Public Attributes ===
+    @type hits: int
+        The number of folders whose listing was taken from the cache.
+    @type misses: int
+        The number of folders that had to be listed with os.scandir.
+    @type resized: int
+        The number of files in cached folders whose size had changed.
+
+    === Private Attributes ===
+    @type _path: str | None
+        The file the cache is loaded from and saved to, or None if the
+        cache only lives in memory.
+    @type _folders: dict[str, (int | None, list[[str, bool, int]])]
+        Maps the absolute path of each folder to its mtime in nanoseconds
+        (None if the listing must not be reused) and its entries, each
+        stored as [name, is_dir, size].
+    @type _seen: set[str]
+        The folders visited since the cache was loaded.
+    @type _lock: threading.Lock
+        Protects the attributes above when folders are listed by several
+        threads at once.
+    """
+    def __init__(self, path=None):
+        """Initialize a new ScanCache, loading <path> if it exists.
+
+        A missing, unreadable or out-of-date cache file is treated as an
+        empty cache.
+
+        @type self: ScanCache
+        @type path: str | None
+        @rtype: None
+        """
+        self.hits = 0
+        self.misses = 0
+        self.resized = 0
+        self._path = path
+        self._folders = {}
+        self._seen = set()
+        self._lock = threading.Lock()
+
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            if data.get('version') == CACHE_VERSION:
+                for folder, (mtime, entries) in data['folders'].items():
+                    self._folders[folder] = (mtime, entries)
+
+    def list_dir(self, path):
+        """Return the listing of the folder at <path>, in the same format
+        as tree_data.scan_dir.
+
+        @type self: ScanCache
+        @type path: str
+        @rtype: list[(str, str, bool, int)]
+        """
+        key = os.path.abspath(path)
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            record = self._folders.get(key)
+            self._seen.add(key)
+
+        result = None
+        if record is not None and record[0] == mtime:
+            result = self._revalidate(path, record[1])
+
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if result is None:
+            result = scan_dir(path)
+
+        if time.time_ns() - mtime < RACY_INTERVAL_NS:
+            mtime = None
+        entries = [[name, is_dir, size]
+                   for _, name, is_dir, size in result]
+        with self._lock:
+            self._folders[key] = (mtime, entries)
+        return result
+
+    def _revalidate(self, path, entries):
+        """Return the cached <entries> of the folder at <path> with fresh
+        file sizes, or None if one of the files has disappeared.
+
+        @type self: ScanCache
+        @type path: str
+        @type entries: list[[str, bool, int]]
+        @rtype: list[(str, str, bool, int)] | None
+        """
+        result = []
+        resized = 0
+        for name, is_dir, size in entries:
+            entry_path = os.path.join(path, name)
+            if is_dir:
+                result.append((entry_path, name, True, 0))
+                continue
+            try:
+                new_size = os.stat(entry_path).st_size
+            except OSError:
+                # removed while the folder was being scanned
+                return None
+            if new_size != size:
+                resized += 1
+            result.append((entry_path, name, False, new_size))
+        with self._lock:
+            self.resized += resized
+        return result
+
+    def save(self):
+        """Write the folders visited since the cache was loaded to the
+        cache file. Folders that were not visited (e.g. because they have
+        been deleted) are dropped.
+
+        @type self: ScanCache
+        @rtype: None
+        """
+        if self._path is None:
+            return
+        with self._lock:
+            folders = {folder: self._folders[folder] for folder in self._seen
+                       if folder in self._folders}
+        temp_path = self._path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': CACHE_VERSION, 'folders': folders}, f)
+        os.replace(temp_path, self._path)
+
+    def stats(self):
+        """Return a one-line summary of the cache hits and misses.
+
+        @type self: ScanCache
+        @rtype: str
+        """
+        total = self.hits + self.misses
+        ratio = self.hits / total if total else 0.0
+        return '{} folders: {} cached, {} listed ({:.1%} listings ' \
+               'avoided), {} resized files'.format(total, self.hits,
+                                                   self.misses, ratio,
+                                                   self.resized)
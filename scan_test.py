@@ -0,0 +1,413 @@
+"""Tests for the alternative FileSystemTree builders.
+
+=== Module Description ===
+These tests check that the builders added next to the FileSystemTree
+constructor produce exactly the same tree (names, sizes, child order and
+parent links) as the constructor itself.
+"""
+import os
+import shutil
+import tempfile
+import time
+
+import unittest
+from unittest import mock
+
+from scan_cache import ScanCache
+from tree_data import AbstractTree, FileSystemTree, PathIndex, diff
+
+
+EXAMPLE_PATH = os.path.join('example-data', 'B')
+TESTING_PATH = 'Testing'
+
+
+class FromPathTest(unittest.TestCase):
+    def test_single_file(self):
+        path = os.path.join(EXAMPLE_PATH, 'f4.txt')
+        tree = FileSystemTree.from_path(path)
+        self.assertEqual(_shape(tree), _shape(FileSystemTree(path)))
+        self.assertIs(tree._parent_tree, None)
+
+    def test_example_data(self):
+        tree = FileSystemTree.from_path(EXAMPLE_PATH)
+        self.assertEqual(_shape(tree), _shape(FileSystemTree(EXAMPLE_PATH)))
+        self.assertEqual(tree.data_size, 40)
+        _check_parents(self, tree)
+
+    def test_testing_folder(self):
+        tree = FileSystemTree.from_path(TESTING_PATH)
+        self.assertEqual(_shape(tree), _shape(FileSystemTree(TESTING_PATH)))
+        _check_parents(self, tree)
+
+    def test_deeper_than_recursion_limit(self):
+        top = tempfile.mkdtemp()
+        folders = [top]
+        try:
+            for _ in range(1200):
+                folders.append(os.path.join(folders[-1], 'd'))
+                os.mkdir(folders[-1])
+            with open(os.path.join(folders[-1], 'leaf.txt'), 'w') as f:
+                f.write('abc')
+            tree = FileSystemTree.from_path(top)
+            self.assertEqual(tree.data_size, 3)
+        finally:
+            # shutil.rmtree is itself recursive, so clean up bottom-up
+            leaf = os.path.join(folders[-1], 'leaf.txt')
+            if os.path.exists(leaf):
+                os.remove(leaf)
+            for folder in reversed(folders):
+                if os.path.isdir(folder):
+                    os.rmdir(folder)
+
+
+class ParallelScanTest(unittest.TestCase):
+    def test_same_tree_as_serial(self):
+        for workers in (2, 8):
+            tree = FileSystemTree.from_path(TESTING_PATH, workers)
+            self.assertEqual(_shape(tree),
+                             _shape(FileSystemTree(TESTING_PATH)))
+            _check_parents(self, tree)
+
+    def test_single_file(self):
+        path = os.path.join(EXAMPLE_PATH, 'f4.txt')
+        tree = FileSystemTree.from_path(path, 4)
+        self.assertEqual(_shape(tree), ('f4.txt', 10, []))
+
+    def test_treemap_independent_of_thread_timing(self):
+        serial = FileSystemTree.from_path(EXAMPLE_PATH)
+        parallel = FileSystemTree.from_path(EXAMPLE_PATH, 4)
+        self.assertEqual(
+            [rect for rect, _ in serial.generate_treemap((0, 0, 800, 600))],
+            [rect for rect, _ in parallel.generate_treemap((0, 0, 800, 600))])
+
+
+class ScanCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.top = tempfile.mkdtemp()
+        self.cache_path = os.path.join(tempfile.mkdtemp(), 'cache.json')
+        os.mkdir(os.path.join(self.top, 'sub'))
+        _write(os.path.join(self.top, 'a.txt'), 3)
+        _write(os.path.join(self.top, 'sub', 'b.txt'), 5)
+        _write(os.path.join(self.top, 'sub', 'c.txt'), 7)
+        _age_folders(self.top)
+
+    def tearDown(self):
+        shutil.rmtree(self.top)
+        shutil.rmtree(os.path.dirname(self.cache_path))
+
+    def _scan(self):
+        cache = ScanCache(self.cache_path)
+        tree = FileSystemTree.from_path(self.top, cache=cache)
+        cache.save()
+        self.assertEqual(_shape(tree), _shape(FileSystemTree(self.top)))
+        return cache
+
+    def test_unchanged_folders_are_hits(self):
+        first = self._scan()
+        self.assertEqual((first.hits, first.misses), (0, 2))
+        second = self._scan()
+        self.assertEqual((second.hits, second.misses), (2, 0))
+
+    def test_added_file(self):
+        self._scan()
+        _write(os.path.join(self.top, 'sub', 'd.txt'), 11)
+        cache = self._scan()
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_removed_file(self):
+        self._scan()
+        os.remove(os.path.join(self.top, 'sub', 'b.txt'))
+        cache = self._scan()
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_resized_file(self):
+        self._scan()
+        _write(os.path.join(self.top, 'sub', 'b.txt'), 50)
+        cache = self._scan()
+        self.assertEqual((cache.hits, cache.misses, cache.resized), (2, 0, 1))
+
+    def test_parallel_scan(self):
+        self._scan()
+        cache = ScanCache(self.cache_path)
+        tree = FileSystemTree.from_path(self.top, 4, cache)
+        self.assertEqual(_shape(tree), _shape(FileSystemTree(self.top)))
+        self.assertEqual((cache.hits, cache.misses), (2, 0))
+
+    def test_recently_modified_folder_is_not_trusted(self):
+        os.utime(self.top)
+        self._scan()
+        cache = self._scan()
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+
+class PathIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tree = FileSystemTree.from_path(TESTING_PATH)
+        self.index = PathIndex(self.tree, TESTING_PATH)
+
+    def test_every_path(self):
+        pairs = _paths(self.tree, TESTING_PATH)
+        self.assertEqual(len(pairs), sum(1 + len(files) for _, _, files
+                                         in os.walk(TESTING_PATH)))
+        for path, node in pairs:
+            self.assertIs(self.index.find(path), node)
+            self.assertEqual(self.index.path_of(node), path)
+        # and again, now that the folders are known
+        for path, node in reversed(pairs):
+            self.assertEqual(self.index.path_of(node), path)
+            self.assertIs(self.index.find(path), node)
+
+    def test_missing_paths(self):
+        for path in ['', 'Testing2', os.path.join('Testing', 'nothing'),
+                     os.path.join('Testing', 'Birds.txt', 'x'),
+                     os.path.dirname(os.path.abspath(TESTING_PATH))]:
+            self.assertIsNone(self.index.find(path))
+
+    def test_delete_leaf(self):
+        path = os.path.join(TESTING_PATH, 'Depth 1-2', 'Stuff', 'Nature.jpg')
+        leaf = self.index.find(path)
+        leaf.delete_leaf()
+        self.assertIsNone(self.index.find(path))
+        self.assertIsNone(self.index.path_of(leaf))
+        sibling = os.path.join(TESTING_PATH, 'Depth 1-2', 'Stuff',
+                               'Squirrel.jpg')
+        self.assertEqual(self.index.path_of(self.index.find(sibling)),
+                         sibling)
+
+    def test_delete_folder(self):
+        folder_path = os.path.join(TESTING_PATH, 'Depth 2', 'Random 1')
+        folder = self.index.find(folder_path)
+        leaf = folder._subtrees[0]
+        for subtree in folder._subtrees:
+            subtree.delete_leaf()
+        folder.delete_leaf()
+        self.assertIsNone(self.index.find(folder_path))
+        self.assertIsNone(self.index.path_of(leaf))
+
+        # a new folder with the same name
+        new_folder = FileSystemTree._new_node(
+            'Random 1', [FileSystemTree._new_node('new.txt', [], 5)])
+        self.index.find(os.path.dirname(folder_path)).add_subtree(new_folder)
+        self.assertIs(self.index.find(folder_path), new_folder)
+        new_path = os.path.join(folder_path, 'new.txt')
+        self.assertIs(self.index.find(new_path), new_folder._subtrees[0])
+        self.assertEqual(self.index.path_of(new_folder._subtrees[0]),
+                         new_path)
+
+    def test_add_subtree(self):
+        folder_path = os.path.join(TESTING_PATH, 'Two files')
+        folder = self.index.find(folder_path)
+        path = os.path.join(folder_path, 'Birds 3.txt')
+        self.assertIsNone(self.index.find(path))
+        leaf = FileSystemTree._new_node('Birds 3.txt', [], 7)
+        folder.add_subtree(leaf)
+        self.assertIs(self.index.find(path), leaf)
+        self.assertEqual(self.index.path_of(leaf), path)
+
+    def test_get_separator(self):
+        for path, node in _paths(self.tree, TESTING_PATH):
+            self.assertEqual(node.get_separator(),
+                             os.path.relpath(path, os.path.dirname(
+                                 TESTING_PATH) or os.curdir))
+
+    def test_delete_subtree(self):
+        folder_path = os.path.join(TESTING_PATH, 'Depth 2')
+        path = os.path.join(folder_path, 'Random 1')
+        leaf = self.index.find(path).get_subtrees()[0]
+        self.index.find(folder_path).delete_subtree()
+        self.assertIsNone(self.index.find(folder_path))
+        self.assertIsNone(self.index.find(path))
+        self.assertIsNone(self.index.path_of(leaf))
+
+    def test_no_walk_once_known(self):
+        pairs = _paths(self.tree, TESTING_PATH)
+        for path, _ in pairs:
+            self.index.find(path)
+        with mock.patch.object(AbstractTree, 'get_parent',
+                               side_effect=AssertionError):
+            for path, node in pairs:
+                self.assertIs(self.index.find(path), node)
+                self.assertEqual(self.index.path_of(node), path)
+                self.assertEqual(node.get_separator(),
+                                 os.path.relpath(path, os.path.dirname(
+                                     TESTING_PATH) or os.curdir))
+
+
+class SignatureTest(unittest.TestCase):
+    def setUp(self):
+        self.top = tempfile.mkdtemp()
+        for folder in ['sub', 'other', os.path.join('other', 'deep')]:
+            os.mkdir(os.path.join(self.top, folder))
+        _write(os.path.join(self.top, 'a.txt'), 3)
+        _write(os.path.join(self.top, 'sub', 'b.txt'), 5)
+        _write(os.path.join(self.top, 'sub', 'c.txt'), 7)
+        _write(os.path.join(self.top, 'other', 'h.txt'), 1)
+        _write(os.path.join(self.top, 'other', 'deep', 'd.txt'), 11)
+        self.name = os.path.basename(self.top)
+
+    def tearDown(self):
+        shutil.rmtree(self.top)
+
+    def _scan(self):
+        return FileSystemTree.from_path(self.top, signatures=True)
+
+    def test_same_as_update_signatures(self):
+        signed = self._scan()
+        unsigned = FileSystemTree.from_path(self.top)
+        self.assertIsNone(unsigned.signature)
+        self.assertEqual(unsigned.update_signatures(), signed.signature)
+        self.assertEqual(_signatures(unsigned), _signatures(signed))
+
+    def test_changes_clear_ancestors(self):
+        tree = self._scan()
+        sub, other = _child(tree, 'sub'), _child(tree, 'other')
+        _child(sub, 'b.txt').update_data_size(2)
+        self.assertIsNone(tree.signature)
+        self.assertIsNone(sub.signature)
+        self.assertIsNone(_child(sub, 'b.txt').signature)
+        self.assertIsNotNone(_child(sub, 'c.txt').signature)
+        self.assertIsNotNone(other.signature)
+
+        _write(os.path.join(self.top, 'sub', 'b.txt'), 7)
+        self.assertEqual(tree.update_signatures(), self._scan().signature)
+
+    def test_diff_unchanged(self):
+        self.assertEqual(diff(self._scan(), self._scan()), [])
+
+    def test_diff(self):
+        old = self._scan()
+        _write(os.path.join(self.top, 'sub', 'b.txt'), 2)
+        os.remove(os.path.join(self.top, 'sub', 'c.txt'))
+        _write(os.path.join(self.top, 'sub', 'e.txt'), 13)
+        shutil.rmtree(os.path.join(self.top, 'other', 'deep'))
+        os.mkdir(os.path.join(self.top, 'new'))
+        _write(os.path.join(self.top, 'new', 'f.txt'), 17)
+        new = self._scan()
+        self.assertEqual(diff(old, new), [
+            (os.path.join(self.name, 'new'), 17),
+            (os.path.join(self.name, 'other', 'deep'), -11),
+            (os.path.join(self.name, 'sub', 'b.txt'), -3),
+            (os.path.join(self.name, 'sub', 'c.txt'), -7),
+            (os.path.join(self.name, 'sub', 'e.txt'), 13)])
+        # the same changes, found without signatures
+        self.assertEqual(diff(FileSystemTree(self.top), new), [])
+        self.assertEqual(diff(_unsigned(old), _unsigned(new)),
+                         diff(old, new))
+
+    def test_diff_skips_unchanged_subtrees(self):
+        old = self._scan()
+        _write(os.path.join(self.top, 'a.txt'), 4)
+        new = self._scan()
+        # diff would fail if it looked inside the unchanged folders
+        for tree in (old, new):
+            for name in ('sub', 'other'):
+                _child(tree, name)._subtrees = None
+        self.assertEqual(diff(old, new),
+                         [(os.path.join(self.name, 'a.txt'), 1)])
+
+    def test_diff_file_replaced_by_folder(self):
+        old = self._scan()
+        os.remove(os.path.join(self.top, 'a.txt'))
+        os.mkdir(os.path.join(self.top, 'a.txt'))
+        _write(os.path.join(self.top, 'a.txt', 'g.txt'), 3)
+        self.assertEqual(diff(old, self._scan()),
+                         [(os.path.join(self.name, 'a.txt'), 0)])
+
+
+##############################################################################
+# Helpers
+##############################################################################
+def _shape(tree):
+    """Return the names, sizes and child order of <tree> as nested tuples.
+
+    @type tree: AbstractTree
+    @rtype: tuple
+    """
+    return (tree._root, tree.data_size,
+            [_shape(subtree) for subtree in tree._subtrees])
+
+
+def _check_parents(test, tree):
+    """Check that every subtree of <tree> points back to its parent.
+
+    @type test: unittest.TestCase
+    @type tree: AbstractTree
+    @rtype: None
+    """
+    for subtree in tree._subtrees:
+        test.assertIs(subtree._parent_tree, tree)
+        _check_parents(test, subtree)
+
+
+def _paths(tree, path):
+    """Return the path and node of every file and folder in <tree>, which
+    was built from <path>, parents first.
+
+    @type tree: FileSystemTree
+    @type path: str
+    @rtype: list[(str, FileSystemTree)]
+    """
+    result = [(path, tree)]
+    for subtree in tree._subtrees:
+        result.extend(_paths(subtree, os.path.join(path, subtree._root)))
+    return result
+
+
+def _child(tree, name):
+    """Return the subtree of <tree> named <name>.
+
+    @type tree: AbstractTree
+    @type name: str
+    @rtype: AbstractTree
+    """
+    return next(subtree for subtree in tree._subtrees
+                if subtree._root == name)
+
+
+def _signatures(tree):
+    """Return the signatures of <tree> and its subtrees as nested tuples.
+
+    @type tree: AbstractTree
+    @rtype: tuple
+    """
+    return (tree.signature,
+            [_signatures(subtree) for subtree in tree._subtrees])
+
+
+def _unsigned(tree):
+    """Clear the signatures of <tree> and its subtrees, and return <tree>.
+
+    @type tree: AbstractTree
+    @rtype: AbstractTree
+    """
+    tree.signature = None
+    for subtree in tree._subtrees:
+        _unsigned(subtree)
+    return tree
+
+
+def _write(path, size):
+    """Write a file of <size> bytes at <path>.
+
+    @type path: str
+    @type size: int
+    @rtype: None
+    """
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+
+
+def _age_folders(top):
+    """Move the modification time of every folder under <top> one minute
+    into the past, so the scan cache will trust their listings.
+
+    @type top: str
+    @rtype: None
+    """
+    past = time.time_ns() - 60 * 10 ** 9
+    for folder, _, _ in os.walk(top):
+        os.utime(folder, ns=(past, past))
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
@@ -0,0 +1,210 @@
+"""Headless treemap snapshots
+
+=== Module Description ===
+This module renders treemaps straight to PNG files, at any resolution and
+without opening a window, so that snapshots can be taken by scheduled jobs
+on machines with no display.
+
+The treemap is drawn on a plain pygame Surface, which does not need the
+display to be initialized. With the default slice-and-dice layout the tree
+is laid out into arrays by vector_layout and drawn by raster.fill_arrays;
+other layout engines go through AbstractTree.generate_treemap and
+raster.draw_treemap. Unlike the interactive visualiser, there is no text
+bar: the whole image is treemap.
+
+The time taken by each phase of a snapshot is measured and returned:
+'scan' builds the tree, 'layout' computes the rectangles, 'raster' draws
+them and 'save' encodes and writes the PNG file.
+
+Run this module to take a snapshot from the command line, e.g.
+
+    python snapshot.py /var/log out.png --size 3840x2160 --engine squarify
+"""
+import argparse
+import sys
+import time
+
+import pygame
+import raster
+import vector_layout
+from tree_data import FileSystemTree, squarify
+from population import PopulationTree
+from scan_cache import ScanCache
+
+
+# The layout engines that can be chosen on the command line.
+ENGINES = {'slice-and-dice': None, 'squarify': squarify}
+
+# The order in which the phases of a snapshot are reported.
+PHASES = ('scan', 'layout', 'raster', 'save')
+
+
+def render_tree(tree, width, height, engine=None, timings=None):
+    """Return a <width> by <height> surface with the treemap of <tree>
+    drawn on it over a black background.
+
+    The times taken to lay out and to draw the treemap are stored in
+    <timings> under 'layout' and 'raster', if it is given.
+
+    @type tree: AbstractTree
+    @type width: int
+    @type height: int
+    @type engine: function | None
+        the layout engine, or None for the default slice-and-dice layout
+    @type timings: dict[str, float] | None
+    @rtype: pygame.Surface
+    """
+    if timings is None:
+        timings = {}
+    surface = pygame.Surface((width, height))
+    surface.fill(pygame.color.THECOLORS['black'])
+    rect = (0, 0, width, height)
+
+    start = time.perf_counter()
+    if tree.data_size <= 0:
+        treemap = None
+    elif engine is None:
+        treemap = vector_layout.treemap_arrays(tree, rect)
+    else:
+        # subtrees smaller than a pixel could not be seen anyway
+        treemap = tree.generate_treemap(rect, engine, 1)
+    timings['layout'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if treemap is not None and engine is None:
+        raster.fill_arrays(surface, *treemap)
+    elif treemap is not None:
+        raster.draw_treemap(surface, treemap)
+    timings['raster'] = time.perf_counter() - start
+    return surface
+
+
+def save_tree(tree, output, width, height, engine=None, timings=None):
+    """Write the treemap of <tree> to the PNG file <output>, at <width> by
+    <height> pixels, and return the time taken by each phase.
+
+    @type tree: AbstractTree
+    @type output: str
+    @type width: int
+    @type height: int
+    @type engine: function | None
+    @type timings: dict[str, float] | None
+        times already measured, e.g. for the scan, to add to
+    @rtype: dict[str, float]
+    """
+    if timings is None:
+        timings = {}
+    surface = render_tree(tree, width, height, engine, timings)
+    start = time.perf_counter()
+    pygame.image.save(surface, output)
+    timings['save'] = time.perf_counter() - start
+    return timings
+
+
+def snapshot_file_system(path, output, width, height, cache_path=None,
+                         engine=None):
+    """Write the treemap of the given path's file structure to the PNG
+    file <output>, and return the time taken by each phase.
+
+    If <cache_path> is given, the scan results are stored in that file, and
+    folders that have not changed since the previous run are not listed
+    again.
+
+    Precondition: <path> is a valid path to a file or folder.
+
+    @type path: str
+    @type output: str
+    @type width: int
+    @type height: int
+    @type cache_path: str | None
+    @type engine: function | None
+    @rtype: dict[str, float]
+    """
+    start = time.perf_counter()
+    if cache_path is None:
+        file_tree = FileSystemTree.from_path(path)
+    else:
+        cache = ScanCache(cache_path)
+        file_tree = FileSystemTree.from_path(path, cache=cache)
+        cache.save()
+    timings = {'scan': time.perf_counter() - start}
+    return save_tree(file_tree, output, width, height, engine, timings)
+
+
+def snapshot_population(output, width, height, engine=None):
+    """Write the treemap of World Bank population data to the PNG file
+    <output>, and return the time taken by each phase.
+
+    @type output: str
+    @type width: int
+    @type height: int
+    @type engine: function | None
+    @rtype: dict[str, float]
+    """
+    start = time.perf_counter()
+    pop_tree = PopulationTree(True)
+    timings = {'scan': time.perf_counter() - start}
+    return save_tree(pop_tree, output, width, height, engine, timings)
+
+
+def format_timings(timings):
+    """Return a one-line summary of the phase times in <timings>.
+
+    @type timings: dict[str, float]
+    @rtype: str
+    """
+    phases = [phase for phase in PHASES if phase in timings]
+    return ', '.join('{} {:.3f} s'.format(phase, timings[phase])
+                     for phase in phases) + \
+        ', total {:.3f} s'.format(sum(timings[phase] for phase in phases))
+
+
+def parse_size(text):
+    """Return the width and height in a size written like '1024x768'.
+
+    @type text: str
+    @rtype: (int, int)
+    """
+    try:
+        width, height = (int(part) for part in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'expected WIDTHxHEIGHT, got {!r}'.format(text))
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError(
+            'the width and height must be positive, got {!r}'.format(text))
+    return width, height
+
+
+def main(argv=None):
+    """Take the snapshot described by the command-line arguments <argv>
+    (by default, those of this process) and print the time of each phase.
+
+    @type argv: list[str] | None
+    @rtype: None
+    """
+    parser = argparse.ArgumentParser(
+        description='Write the treemap of a folder, or of the World Bank '
+                    'population data, to a PNG file.')
+    parser.add_argument('path', help="the folder to scan, or 'population'")
+    parser.add_argument('output', help='the PNG file to write')
+    parser.add_argument('--size', type=parse_size, default=(1024, 768),
+                        help='the image size, e.g. 3840x2160 '
+                             '(default: 1024x768)')
+    parser.add_argument('--engine', choices=sorted(ENGINES),
+                        default='slice-and-dice', help='the layout engine')
+    parser.add_argument('--cache', help='a scan cache file to use')
+    args = parser.parse_args(argv)
+
+    width, height = args.size
+    engine = ENGINES[args.engine]
+    if args.path == 'population':
+        timings = snapshot_population(args.output, width, height, engine)
+    else:
+        timings = snapshot_file_system(args.path, args.output, width, height,
+                                       args.cache, engine)
+    print('{}: {}'.format(args.output, format_timings(timings)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,103 @@
+"""Tests for snapshot.
+
+=== Module Description ===
+These tests check that the PNG files written without a display have the
+requested size and the same pixels as the treemap drawn one rectangle at a
+time with pygame.draw.rect.
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+
+import unittest
+from hypothesis import given, settings
+from hypothesis.strategies import integers, sampled_from
+
+import pygame
+
+import snapshot
+from population import PopulationTree
+from tree_data import FileSystemTree, squarify
+from tree_fixtures import make_tree
+
+
+EXAMPLE_PATH = os.path.join('example-data', 'B')
+
+
+class RenderTreeTest(unittest.TestCase):
+    @settings(max_examples=30)
+    @given(integers(min_value=1, max_value=60), sampled_from([None, squarify]),
+           integers(min_value=1, max_value=400),
+           integers(min_value=1, max_value=300))
+    def test_same_pixels_as_generate_treemap(self, seed, engine, width,
+                                             height):
+        tree = make_tree(seed)
+        expected = pygame.Surface((width, height))
+        for rect, colour in tree.generate_treemap((0, 0, width, height),
+                                                  engine, 1):
+            pygame.draw.rect(expected, colour, rect)
+        timings = {}
+        actual = snapshot.render_tree(tree, width, height, engine, timings)
+        self.assertEqual(pygame.image.tostring(actual, 'RGB'),
+                         pygame.image.tostring(expected, 'RGB'))
+        self.assertEqual(sorted(timings), ['layout', 'raster'])
+
+    def test_empty_tree(self):
+        tree = PopulationTree(False, 'World', [])
+        surface = snapshot.render_tree(tree, 10, 5)
+        self.assertEqual(pygame.image.tostring(surface, 'RGB'),
+                         bytes(10 * 5 * 3))
+
+
+class SnapshotFileSystemTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_png(self):
+        output = os.path.join(self.folder, 'out.png')
+        timings = snapshot.snapshot_file_system(EXAMPLE_PATH, output, 64, 48)
+        self.assertEqual(sorted(timings), sorted(snapshot.PHASES))
+        image = pygame.image.load(output)
+        self.assertEqual(image.get_size(), (64, 48))
+        expected = snapshot.render_tree(FileSystemTree.from_path(
+            EXAMPLE_PATH), 64, 48)
+        # the colours are random, so only compare which pixels are drawn
+        self.assertEqual(_drawn(image), _drawn(expected))
+
+    def test_command_line(self):
+        output = os.path.join(self.folder, 'out.png')
+        printed = io.StringIO()
+        with contextlib.redirect_stdout(printed):
+            snapshot.main([EXAMPLE_PATH, output, '--size', '30x20',
+                           '--engine', 'squarify'])
+        self.assertEqual(pygame.image.load(output).get_size(), (30, 20))
+        self.assertTrue(printed.getvalue().startswith(output + ': scan '))
+
+    def test_parse_size(self):
+        self.assertEqual(snapshot.parse_size('3840X2160'), (3840, 2160))
+        for text in ['', '10', '10x', '0x10', 'axb', '1x2x3']:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                snapshot.parse_size(text)
+
+
+##############################################################################
+# Helpers
+##############################################################################
+def _drawn(surface):
+    """Return, for every pixel of <surface>, whether it is not black.
+
+    @type surface: pygame.Surface
+    @rtype: list[bool]
+    """
+    pixels = pygame.image.tostring(surface, 'RGB')
+    return [pixels[i:i + 3] != b'\0\0\0' for i in range(0, len(pixels), 3)]
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
@@ -13,8 +13,28 @@ computer's file system.
 
 """
 import os
+from bisect import bisect_left
+from hashlib import blake2b
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from random import randint
 import math
+import weakref
+from itertools import islice
+
+
+# The _subtrees of every tree without subtrees. Sharing one list saves an
+# allocation per leaf; it must never be mutated.
+_NO_SUBTREES = []
+
+# apply_changes removes the deleted subtrees of a node once more than this
+# fraction of its subtrees have been deleted.
+COMPACT_RATIO = 0.5
+
+# Weak references to the PathIndex objects that know the path of each
+# folder, by the id of the folder. A tree tells them about every subtree
+# added to or removed from one of those folders, so that they never have to
+# check that a node is still part of the tree.
+_folder_indexes = {}
 
 
 class AbstractTree:
@@ -22,9 +42,15 @@ class AbstractTree:
 
     This is an abstract class that should not be instantiated directly.
 
-    You may NOT add any attributes, public or private, to this class.
-    However, part of this assignment will involve you adding and implementing
-    new public *methods* for this interface.
+    Besides the attributes of the original interface, a tree has its
+    colour packed into an int (_colour), its signature, and the caches that
+    make it quick to draw and search (_hit_index and _layout_cache), all
+    listed below. A new attribute must be added to __slots__ and listed
+    here too.
+
+    The attributes are stored in __slots__, so instances have no __dict__.
+    Subclasses should declare their own (possibly empty) __slots__ to keep
+    it that way; a subclass that does not gets a __dict__ back.
 
     === Public Attributes ===
     @type data_size: int
@@ -32,15 +58,34 @@ class AbstractTree:
     @type colour: (int, int, int)
         The RGB colour value of the root of this tree.
         Note: only the colours of leaves will influence what the user sees.
+    @type signature: bytes | None
+        A hash of the root value and data size of this tree and of the
+        signatures of its subtrees (see update_signatures), so two trees
+        with the same signature have the same contents. None if it has not
+        been computed, or the data size of this tree has changed since.
 
     === Private Attributes ===
     @type _root: obj | None
         The root value of this tree, or None if this tree is empty.
     @type _subtrees: list[AbstractTree]
-        The subtrees of this tree.
+        The subtrees of this tree. All trees without subtrees share the
+        same empty list, so it must never be mutated in place.
+    @type _colour: int
+        The colour, packed as 0xRRGGBB.
     @type _parent_tree: AbstractTree | None
         The parent tree of this tree; i.e., the tree that contains this tree
         as a subtree, or None if this tree is not part of a larger tree.
+    @type _hit_index: LayoutIndex | None
+        The index used by the last call to find_leaf, or None if there was
+        none or the data size of this tree has changed since.
+    @type _layout_cache: ((int, int, int, int) | None, list | weakref.ref,
+                          int, int, (function, int) | None) | None
+        The rectangle this tree was last laid out in, where its records
+        are in the list (or weak reference to the list) made by that
+        layout (from index start up to index end), and the layout engine
+        and minimum area used. None if this tree is a leaf or has not been
+        laid out. The rectangle is None (or the whole cache is None) if one
+        of its data sizes has changed since.
 
     === Representation Invariants ===
     - data_size >= 0
@@ -52,10 +97,13 @@ class AbstractTree:
       data_size is 0.
       This setting of attributes represents an empty tree.
     - _subtrees IS allowed to contain empty subtrees (this makes deletion
-      a bit easier).
+      a bit easier). compact() removes them.
 
     - if _parent_tree is not empty, then self is in _parent_tree._subtrees
     """
+    __slots__ = ('_root', '_subtrees', '_parent_tree', '_colour', 'data_size',
+                 '_hit_index', '_layout_cache', 'signature')
+
     def __init__(self, root, subtrees, data_size=0):
         """Initialize a new AbstractTree.
 
@@ -84,13 +132,16 @@ class AbstractTree:
         @rtype: None
         """
         self._root = root
-        self._subtrees = subtrees
+        self._subtrees = subtrees if subtrees else _NO_SUBTREES
         self._parent_tree = None
+        self._hit_index = None
+        self._layout_cache = None
+        self.signature = None
 
         # 1. Initialize self.colour and self.data_size, according to the
         # docstring.
 
-        self.colour = (randint(0, 255), randint(0, 255), randint(0, 255))
+        self._colour = randint(0, 0xFFFFFF)
         if self._subtrees == []:
             self.data_size = data_size
         else:
@@ -103,6 +154,41 @@ class AbstractTree:
         for st in self._subtrees:
             st._parent_tree = self
 
+    @property
+    def colour(self):
+        """The RGB colour value of the root of this tree.
+
+        @type self: AbstractTree
+        @rtype: (int, int, int)
+        """
+        packed = self._colour
+        return packed >> 16, (packed >> 8) & 0xFF, packed & 0xFF
+
+    @colour.setter
+    def colour(self, rgb):
+        """Set the RGB colour value of the root of this tree.
+
+        @type self: AbstractTree
+        @type rgb: (int, int, int)
+        @rtype: None
+        """
+        r, g, b = rgb
+        self._colour = (r << 16) | (g << 8) | b
+        # the cached layouts of the ancestors hold the old colour
+        ancestor = self._parent_tree
+        while ancestor is not None:
+            ancestor._drop_layout()
+            ancestor = ancestor._parent_tree
+
+    @property
+    def packed_colour(self):
+        """The colour of the root of this tree, packed as 0xRRGGBB.
+
+        @type self: AbstractTree
+        @rtype: int
+        """
+        return self._colour
+
     def is_empty(self):
         """Return True if this tree is empty.
 
@@ -115,7 +201,7 @@ class AbstractTree:
         """
         return self._root is None
 
-    def generate_treemap(self, rect):
+    def generate_treemap(self, rect, engine=None, min_area=0):
         """Run the treemap algorithm on this tree and return the rectangles.
 
         Each returned tuple contains a pygame rectangle and a colour:
@@ -140,55 +226,193 @@ class AbstractTree:
         then make horizontal rectangles instead of vertical
         ones, and do the analogous operations as above.
 
+        This is the slice_and_dice layout engine. Another engine, such as
+        squarify, can be given as <engine>: a function that divides the
+        rectangle of one tree among its non-empty subtrees.
+
+        A subtree whose rectangle covers fewer than <min_area> pixels is
+        not divided any further: it is drawn as a single aggregate
+        rectangle, in the subtree's own colour. If <min_area> is positive,
+        rectangles with no area are left out.
+
         @type self: AbstractTree
         @type rect: (int, int, int, int)
             Input is in the pygame format: (x, y, width, height)
+        @type engine: ((AbstractTree, (int, int, int, int)) ->
+                       list[(AbstractTree, (int, int, int, int))]) | None
+            The layout engine, slice_and_dice if None
+        @type min_area: int
+            The smallest area (in pixels) of a subtree that is divided
         @rtype: list[((int, int, int, int), (int, int, int))]
         """
+        return [(leaf_rect, colour) for leaf_rect, colour, _ in
+                self._layout(rect, engine, min_area)]
 
-        if self.is_empty():
-            return []
-        elif self.data_size == 0:
-            return []
-        elif self._subtrees == [] and self.data_size > 0:
-            return [(rect, self.colour)]
-
-        n_empty = self.get_non_empty_leaves()
-        final_rect_pos = find_last(n_empty)
-        lst = []
-        x, y, width, height = rect
-        if width > height:
-            # divide the rectangle into vertical strips
-            offset1 = 0
-            for i in range(0, len(n_empty)):
-                if n_empty[i].data_size > 0 and i != final_rect_pos:
-                    fraction = n_empty[i].data_size / self.data_size
-                    adj_width = int(math.floor(fraction * width))
-                    lst += [n_empty[i].generate_treemap((x + offset1, y,
-                                                         adj_width, height))]
-                    offset1 += adj_width
-                elif i == final_rect_pos:
-                    # if it is the last one, make it cover the remaining area
-                    adj_width = width - offset1
-                    lst += [n_empty[i].generate_treemap((x + offset1, y,
-                                                         adj_width, height))]
+    def iter_treemap(self, rect, engine=None, min_area=0):
+        """Yield the rectangles and colours of generate_treemap one at a
+        time, in the same order.
+
+        Unlike generate_treemap, no list of all the rectangles is built,
+        so the memory used only grows with the depth of the tree, and the
+        first rectangles are available before the whole tree is laid out.
+
+        @type self: AbstractTree
+        @type rect: (int, int, int, int)
+            Input is in the pygame format: (x, y, width, height)
+        @type engine: ((AbstractTree, (int, int, int, int)) ->
+                       list[(AbstractTree, (int, int, int, int))]) | None
+            The layout engine, slice_and_dice if None
+        @type min_area: int
+            The smallest area (in pixels) of a subtree that is divided
+        @rtype: collections.Iterable[((int, int, int, int), (int, int, int))]
+        """
+        style = (slice_and_dice if engine is None else engine, min_area)
+        for leaf_rect, colour, _ in self._iter_layout(rect, style):
+            yield leaf_rect, colour
+
+    def generate_layout(self, rect, engine=None, min_area=0):
+        """Run the treemap algorithm on this tree and return the rectangles
+        together with the leaves they represent.
+
+        Each returned tuple contains a pygame rectangle, a colour and a leaf:
+        ((x, y, width, height), (r, g, b), leaf).
+
+        The rectangles and colours are those returned by generate_treemap
+        with the same <engine> and <min_area>, in the same order; the tree
+        is only walked once. The "leaf" of an aggregate rectangle is the
+        subtree it stands for.
+
+        @type self: AbstractTree
+        @type rect: (int, int, int, int)
+            Input is in the pygame format: (x, y, width, height)
+        @type engine: ((AbstractTree, (int, int, int, int)) ->
+                       list[(AbstractTree, (int, int, int, int))]) | None
+        @type min_area: int
+        @rtype: list[((int, int, int, int), (int, int, int), AbstractTree)]
+        """
+        return list(self._layout(rect, engine, min_area))
+
+    def _layout(self, rect, engine=None, min_area=0):
+        """Return the records of generate_layout, reusing the layout cached
+        by the previous call for every subtree that has not changed.
+
+        The returned list is referred to by the layout caches, so it must
+        not be modified.
+
+        @type self: AbstractTree
+        @type rect: (int, int, int, int)
+        @type engine: ((AbstractTree, (int, int, int, int)) ->
+                       list[(AbstractTree, (int, int, int, int))]) | None
+        @type min_area: int
+        @rtype: list[((int, int, int, int), (int, int, int), AbstractTree)]
+        """
+        style = (slice_and_dice if engine is None else engine, min_area)
+        result = _LayoutRecords()
+        result.extend(self._iter_layout(rect, style, weakref.ref(result)))
+        if self._layout_cache is not None:
+            # keep this layout alive until the next one has been made
+            self._layout_cache = (self._layout_cache[0], result, 0,
+                                  len(result), style)
+        return result
+
+    def _iter_layout(self, rect, style, result_ref=None):
+        """Yield the (rect, colour, leaf) tuples of generate_layout for this
+        tree, drawn in <rect>, one at a time.
+
+        The tree is walked with an explicit stack instead of recursion, so
+        only O(depth) memory is used besides the records themselves, and
+        trees of any depth can be laid out.
+
+        If a subtree was laid out with the same style in a rectangle of the
+        same size before, and none of its data sizes have changed since,
+        the cached records are produced (and moved, if the rectangle has
+        moved) instead of splitting the subtree again.
+
+        If <result_ref> is given, every record yielded must be appended to
+        the list it refers to, and the layout caches are updated to point
+        into that list.
+
+        @type self: AbstractTree
+        @type rect: (int, int, int, int)
+        @type style: ((AbstractTree, (int, int, int, int)) ->
+                      list[(AbstractTree, (int, int, int, int))], int)
+            the layout engine and the minimum area of a divided subtree
+        @type result_ref: weakref.ref | None
+            a weak reference to the list being filled, if any
+        @rtype: collections.Iterable[((int, int, int, int), (int, int, int),
+                                      AbstractTree)]
+        """
+        engine, min_area = style
+        # the number of records yielded so far
+        count = 0
+        # (node, rect) still to lay out, or (node, rect, first record) once
+        # all of node's subtrees have been pushed
+        stack = [(self, tuple(rect))]
+        while stack:
+            entry = stack.pop()
+            node, rect = entry[0], entry[1]
+            if len(entry) == 3:
+                # every record of node has been yielded
+                if result_ref is not None:
+                    node._layout_cache = (rect, result_ref, entry[2], count,
+                                          style)
+                continue
+            if node._root is None or node.data_size == 0:
+                continue
+            elif rect[2] * rect[3] < min_area:
+                # too small to be divided: draw it as one aggregate, or not
+                # at all if it covers no pixels
+                if rect[2] > 0 and rect[3] > 0 and node.data_size > 0:
+                    yield rect, node.colour, node
+                    count += 1
+                continue
+            elif node._subtrees == []:
+                if node.data_size > 0:
+                    yield rect, node.colour, node
+                    count += 1
+                continue
+
+            records = None
+            cache = node._layout_cache
+            if cache is not None and cache[0] is not None and \
+                    cache[0][2:] == rect[2:] and cache[4] == style:
+                records = cache[1]
+                if not isinstance(records, list):
+                    records = records()
+            if records is None:
+                stack.append((node, rect, count))
+                stack.extend(reversed(engine(node, rect)))
+                continue
+
+            old_rect, _, begin, end, _ = cache
+            dx = rect[0] - old_rect[0]
+            dy = rect[1] - old_rect[1]
+            if dx == 0 and dy == 0:
+                yield from islice(records, begin, end)
+            else:
+                for r, colour, leaf in islice(records, begin, end):
+                    yield (r[0] + dx, r[1] + dy, r[2], r[3]), colour, leaf
+            if result_ref is not None:
+                node._layout_cache = (rect, result_ref, count,
+                                      count + end - begin, style)
+            count += end - begin
+
+    def _drop_layout(self):
+        """Forget the cached layout of this tree, because one of its data
+        sizes or colours has changed.
+
+        If this tree holds the only strong reference to the records of
+        the last layout, they are kept until the next layout, so that the
+        subtrees that have not changed can still be copied from them.
+
+        @type self: AbstractTree
+        @rtype: None
+        """
+        cache = self._layout_cache
+        if cache is not None and isinstance(cache[1], list):
+            self._layout_cache = (None, cache[1], 0, 0, None)
         else:
-            # width <= height
-            # divide the rectangle into horizontal strips
-            offset2 = 0
-            for i in range(0, len(n_empty)):
-                if n_empty[i].data_size > 0 and i != final_rect_pos:
-                    fraction = n_empty[i].data_size / self.data_size
-                    adj_height = int(math.floor(fraction * height))
-                    lst += [n_empty[i].generate_treemap((x, y + offset2,
-                                                         width, adj_height))]
-                    offset2 += adj_height
-                elif i == final_rect_pos:
-                    # if it is the last one, make it cover the remaining area
-                    adj_height = height - offset2
-                    lst += [n_empty[i].generate_treemap((x, y + offset2,
-                                                         width, adj_height))]
-        return extract_nested(lst)
+            self._layout_cache = None
 
     # Helpers used for treemap_visualizer =====================================
     def get_non_empty_leaves(self):
@@ -217,10 +441,43 @@ class AbstractTree:
         """
         self.update_data_size(0 - self.data_size)
         self.data_size = 0
+        self._detach()
+
+    def _detach(self):
+        """
+        Make this tree an empty tree, no longer part of the tree it was in,
+        without changing the data sizes of its ancestors.
+
+        @type self: AbstractTree
+        @rtype: None
+        """
+        _node_removed(self)
         self._parent_tree = None
-        self._subtrees = []
+        self._subtrees = _NO_SUBTREES
         self._root = None
 
+    def delete_subtree(self):
+        """
+        Deletes this tree and everything in it from the tree it is part of
+        (i.e. make it an empty tree), and updates the data_size attributes
+        of all ancestors with a single walk up.
+
+        Unlike delete_leaf, this tree does not have to be a leaf, so a whole
+        folder is removed in O(depth) steps however many files it holds.
+
+        @type self: AbstractTree
+        @rtype: None
+        """
+        if self.is_empty():
+            return
+        if self._parent_tree is not None:
+            self._parent_tree.update_data_size(0 - self.data_size)
+        self.data_size = 0
+        self._detach()
+        self._hit_index = None
+        self._layout_cache = None
+        self.signature = None
+
     def increase_data_size(self):
         """
         Increases the data size of the selected leaf by 1%
@@ -258,17 +515,194 @@ class AbstractTree:
         @type size_increment: int
         @rtype: None
         """
-        if self is None:
-            pass
-        elif self.is_empty():
-            pass
-        elif self._parent_tree is None:
-            self.data_size += size_increment
+        if self.is_empty():
+            return
+        node = self
+        while node is not None:
+            node.data_size += size_increment
+            node._hit_index = None
+            node.signature = None
+            node._drop_layout()
+            node = node._parent_tree
+
+    def apply_changes(self, changes):
+        """
+        Apply many changes to the leaves of this tree at once, and update
+        the data sizes of their ancestors in a single pass from the deepest
+        level up, so that each ancestor is updated once however many of its
+        leaves changed.
+
+        Each change is a pair (leaf, size_increment): the data size of leaf
+        is changed by size_increment, like with update_data_size, or leaf
+        is deleted, like with delete_leaf, if size_increment is None. The
+        changes are applied in order; changes to empty (e.g. deleted)
+        leaves are ignored. Unlike with compact, a subtree whose leaves have
+        all been deleted stays in the tree, with a size of 0.
+
+        === Preconditions: ===
+        every leaf is a leaf of this tree
+
+        @type self: AbstractTree
+        @type changes: list[(AbstractTree, int | None)]
+        @rtype: None
+        """
+        # the total change of each leaf, by id
+        totals = {}
+        leaves = {}
+        deleted = set()
+        for leaf, size_increment in changes:
+            key = id(leaf)
+            if key in deleted or leaf.is_empty():
+                continue
+            leaves[key] = leaf
+            if size_increment is None:
+                totals[key] = -leaf.data_size
+                deleted.add(key)
+            else:
+                totals[key] = totals.get(key, 0) + size_increment
+
+        # the leaves and all of their ancestors, by depth; the walk up from
+        # each leaf stops at the first ancestor already seen
+        levels = []
+        depths = {}
+        for leaf in leaves.values():
+            path = []
+            node = leaf
+            while node is not None and id(node) not in depths:
+                path.append(node)
+                node = node._parent_tree
+            depth = -1 if node is None else depths[id(node)]
+            for node in reversed(path):
+                depth += 1
+                depths[id(node)] = depth
+                if depth == len(levels):
+                    levels.append([])
+                levels[depth].append(node)
+
+        for level in reversed(levels):
+            for node in level:
+                size_increment = totals.get(id(node), 0)
+                node.data_size += size_increment
+                node._hit_index = None
+                node.signature = None
+                node._drop_layout()
+                parent = node._parent_tree
+                if parent is not None:
+                    key = id(parent)
+                    totals[key] = totals.get(key, 0) + size_increment
+
+        # the parents of the deleted leaves, by depth, to be compacted
+        parents = [{} for _ in levels]
+        for key in deleted:
+            leaf = leaves[key]
+            parent = leaf._parent_tree
+            if parent is not None:
+                parents[depths[id(parent)]][id(parent)] = parent
+            leaf._detach()
+        # folders left without files are kept, so that a file created in
+        # one later (e.g. found by a PollingWatcher) still has a place
+        _remove_dead(parents, COMPACT_RATIO, True)
+
+    def compact(self):
+        """
+        Remove the deleted leaves left in the subtrees of this tree (and of
+        its subtrees) by delete_leaf, as well as the subtrees whose leaves
+        have all been deleted, so that their memory can be freed.
+
+        Deleted leaves and subtrees of size 0 are never drawn, so the
+        layout of the tree does not change.
+
+        Return the number of subtrees removed from the lists of subtrees.
+
+        @type self: AbstractTree
+        @rtype: int
+        """
+        levels = []
+        level = {id(self): self}
+        while level:
+            levels.append(level)
+            level = {id(subtree): subtree for node in level.values()
+                     for subtree in node.get_subtrees()
+                     if subtree.get_subtrees()}
+        return _remove_dead(levels, 0)
+
+    def remove_deleted_subtrees(self, ratio=0, detach=True):
+        """
+        Remove the empty (deleted) subtrees from the subtrees of this tree,
+        if more than <ratio> of them are empty.
+
+        If this tree is then left with no subtrees and a size of 0, it is
+        emptied too, unless <detach> is False, so that its parent can remove
+        it in turn. Its parent is not changed otherwise.
+
+        Return the number of subtrees removed.
+
+        @type self: AbstractTree
+        @type ratio: float
+        @type detach: bool
+        @rtype: int
+        """
+        live = [subtree for subtree in self._subtrees
+                if not subtree.is_empty()]
+        dead = len(self._subtrees) - len(live)
+        if dead == 0 or dead <= ratio * len(self._subtrees):
+            return 0
+        self._subtrees = live if live else _NO_SUBTREES
+        if not live and self.data_size == 0 and detach:
+            self._detach()
+        return dead
+
+    def update_signatures(self):
+        """
+        Compute the signature of this tree and of each of its subtrees that
+        has none, and return the signature of this tree (None if it is
+        empty).
+
+        Every change to a data size clears the signatures of the tree
+        changed and all of its ancestors, so a subtree that has a signature
+        is up to date and is skipped, along with everything in it. The work
+        done is proportional to the number of trees changed since the
+        signatures were last computed.
+
+        @type self: AbstractTree
+        @rtype: bytes | None
+        """
+        if self.is_empty():
+            return None
+        stack = [(self, False)]
+        while stack:
+            node, children_signed = stack.pop()
+            if children_signed:
+                node.signature = _sign(node)
+            elif node.signature is None:
+                stack.append((node, True))
+                stack.extend((subtree, False)
+                             for subtree in node.get_subtrees()
+                             if not subtree.is_empty())
+        return self.signature
+
+    def add_subtree(self, subtree):
+        """
+        Adds <subtree> as the last subtree of self and adds its data size to
+        self and all of its ancestors
+
+        === Preconditions: ===
+        self is not empty
+        subtree is not empty and is not part of a larger tree
+
+        @type self: AbstractTree
+        @type subtree: AbstractTree
+        @rtype: None
+        """
+        if self._subtrees is _NO_SUBTREES:
+            self._subtrees = [subtree]
         else:
-            self.data_size += size_increment
-            self._parent_tree.update_data_size(size_increment)
+            self._subtrees.append(subtree)
+        subtree._parent_tree = self
+        _node_added(subtree)
+        self.update_data_size(subtree.data_size)
 
-    def generate_leafmap(self, rect):
+    def generate_leafmap(self, rect, engine=None, min_area=0):
         """Run the treemap algorithm on this tree and return the leaves.
         Note: The leaves are in the exact same order as the rectangles.
 
@@ -276,68 +710,53 @@ class AbstractTree:
         @type rect: (int, int, int, int)
             Input is in the pygame format: (x, y, width, height)
             Rectangle which to draw the leaves onto
+        @type engine: ((AbstractTree, (int, int, int, int)) ->
+                       list[(AbstractTree, (int, int, int, int))]) | None
+            The layout engine, slice_and_dice if None
+        @type min_area: int
+            The smallest area (in pixels) of a subtree that is divided;
+            smaller subtrees are returned instead of their leaves
         @rtype: list[AbstractTree]
             List of leaves (in the same order as generate_treemap rectangles)
         """
-        if self.is_empty():
-            return []
-        elif self.data_size == 0:
-            return []
-        elif self._subtrees == [] and self.data_size > 0:
-            return [self]
+        return [leaf for _, _, leaf in self._layout(rect, engine, min_area)]
 
-        n_empty = self.get_non_empty_leaves()
-        lst = []
-        x, y, width, height = rect
-        if width > height:
-            offset1 = 0
-            for i in range(0, len(n_empty)):
-                if i < len(n_empty) - 1:
-                    fraction = n_empty[i].data_size / self.data_size
-                    adj_width = math.floor(fraction * width)
-                    lst += [n_empty[i].generate_leafmap((x + offset1, y,
-                                                         adj_width, height))]
-                    offset1 += adj_width
-                else:
-                    adj_width = width - offset1
-                    lst += [n_empty[i].generate_leafmap((x + offset1, y,
-                                                         adj_width, height))]
-        else:
-            offset2 = 0
-            for i in range(0, len(n_empty)):
-                if i < len(n_empty) - 1:
-                    fraction = self._subtrees[i].data_size / self.data_size
-                    adj_height = math.floor(fraction * height)
-                    lst += [n_empty[i].generate_leafmap((x, y + offset2,
-                                                         width, adj_height))]
-                    offset2 += adj_height
-                else:
-                    adj_height = height - offset2
-                    lst += [n_empty[i].generate_leafmap((x, y + offset2,
-                                                         width, adj_height))]
-        return extract_nested(lst)
-
-    def find_leaf(self, coordinates, width, height):
+    def find_leaf(self, coordinates, width, height, engine=None,
+                  min_area=0):
         """
         Finds the leaf containing the coordinates (specified by a tuple)
 
+        If the leaf is inside a subtree drawn as an aggregate because it is
+        smaller than <min_area> pixels (see generate_treemap), that subtree
+        is returned instead.
+
+        If several rectangles contain the coordinates (i.e. they are on a
+        shared edge), the leaf that comes first in generate_layout is
+        returned.
+
+        The LayoutIndex built by the previous call is reused as long as the
+        display size, layout engine and minimum area are the same and no
+        data size below self has changed, so a click only lays out the
+        nodes between the root and the leaf.
+
         @type self: AbstractTree
         @type coordinates: tuple(int, int)
         @type width: int
         @type height: int
+        @type engine: ((AbstractTree, (int, int, int, int)) ->
+                       list[(AbstractTree, (int, int, int, int))]) | None
+            The layout engine, slice_and_dice if None
+        @type min_area: int
         @rtype: AbstractTree
         """
-        map_ = self.generate_treemap((0, 0, width, height))
-        leaves_map = self.generate_leafmap((0, 0, width, height))
-        x, y = coordinates
-        for i in range(0, len(map_)):
-            if map_[i][0][0] <= x and (map_[i][0][0] + map_[i][0][2]) >= x and \
-                            map_[i][0][1] <= y and \
-                            (map_[i][0][1] + map_[i][0][3]) >= y:
-                # check if x and y coordinates are both inside the rectangle
-                # find the fraction of the total area that this represents, and
-                # based on that, find the corresponding file/folder
-                return leaves_map[i]
+        rect = (0, 0, width, height)
+        if engine is None:
+            engine = slice_and_dice
+        index = self._hit_index
+        if index is None or index.rect != rect or \
+                index.engine is not engine or index.min_area != min_area:
+            self._hit_index = LayoutIndex(self, rect, engine, min_area)
+        return self._hit_index.find(coordinates)
 
     def __eq__(self, other):
         """
@@ -365,6 +784,25 @@ class AbstractTree:
         """
         return self._root
 
+    def get_parent(self):
+        """
+        Gets the parent tree of a tree without having to explicitly access
+        the private attribute
+        @type self: AbstractTree
+        @rtype: AbstractTree | None
+        """
+        return self._parent_tree
+
+    def get_subtrees(self):
+        """
+        Gets the subtrees of a tree without having to explicitly access the
+        private attribute. The list returned is the tree's own, and must not
+        be modified.
+        @type self: AbstractTree
+        @rtype: list[AbstractTree]
+        """
+        return self._subtrees
+
     # ========================================================================
 
     # To be implemented in subclasses, do nothing here
@@ -384,6 +822,151 @@ class AbstractTree:
         raise NotImplementedError
 
 
+class _LayoutRecords(list):
+    """A list of generate_layout records that the layout caches can refer to
+    with a weak reference, so that a layout is freed once it has been
+    replaced by a newer one.
+    """
+    __slots__ = ('__weakref__',)
+
+
+class LayoutIndex:
+    """A spatial index of the treemap layout of a tree, used to find the
+    leaf drawn at a given point.
+
+    The index is built lazily: a node is only laid out (with the layout
+    engine) the first time a point inside it is looked up, and the
+    rectangles of its subtrees are kept for later lookups. When a node's
+    subtrees are laid out side by side in strips, as by slice_and_dice,
+    the subtree containing a point is found with a binary search, so each
+    lookup costs O(depth * log(subtrees per node)) once the path has been
+    laid out. Otherwise the subtrees' rectangles are checked in order.
+
+    The index does not notice changes to the tree; AbstractTree.find_leaf
+    discards it whenever a data size changes.
+
+    === Public Attributes ===
+    @type rect: (int, int, int, int)
+        The display area the tree is laid out in.
+    @type engine: (AbstractTree, (int, int, int, int)) ->
+                  list[(AbstractTree, (int, int, int, int))]
+        The layout engine.
+    @type min_area: int
+        Subtrees with a smaller area are not divided, and are found as a
+        whole.
+
+    === Private Attributes ===
+    @type _tree: AbstractTree
+        The tree being indexed.
+    @type _splits: dict[int, (list[AbstractTree], list[(int, int, int, int)],
+                             list[int] | None, int)]
+        Maps the id of every node laid out so far to its non-empty
+        subtrees, their rectangles, the far edge of each rectangle along
+        the split direction (None if the strips are not in order, e.g.
+        because a data size is inconsistent) and the split direction
+        (0 for vertical strips, 1 for horizontal ones).
+    """
+    def __init__(self, tree, rect, engine=None, min_area=0):
+        """Initialize an empty index of <tree> laid out in <rect> by
+        <engine> (slice_and_dice if None), without dividing subtrees
+        smaller than <min_area>.
+
+        @type self: LayoutIndex
+        @type tree: AbstractTree
+        @type rect: (int, int, int, int)
+        @type engine: ((AbstractTree, (int, int, int, int)) ->
+                       list[(AbstractTree, (int, int, int, int))]) | None
+        @type min_area: int
+        @rtype: None
+        """
+        self.rect = rect
+        self.engine = slice_and_dice if engine is None else engine
+        self.min_area = min_area
+        self._tree = tree
+        self._splits = {}
+
+    def find(self, coordinates):
+        """Return the leaf whose rectangle contains <coordinates>, or None.
+
+        The result is the same as scanning the rectangles returned by
+        generate_layout in order and returning the first one that
+        contains the point.
+
+        @type self: LayoutIndex
+        @type coordinates: (int, int)
+        @rtype: AbstractTree | None
+        """
+        x, y = coordinates
+        node, rect = self._tree, self.rect
+        if node.is_empty() or node.data_size == 0 or \
+                not _contains(rect, x, y) or \
+                (self.min_area > 0 and rect[2] * rect[3] == 0):
+            return None
+        while node._subtrees != [] and rect[2] * rect[3] >= self.min_area:
+            split = self._splits.get(id(node))
+            if split is None:
+                split = self._split(node, rect)
+            subtrees, rects, ends, axis = split
+            if ends is not None:
+                k = bisect_left(ends, x if axis == 0 else y)
+            else:
+                k = 0
+                while k < len(rects) and not _contains(rects[k], x, y):
+                    k += 1
+            if k == len(rects) or not _contains(rects[k], x, y):
+                return self._scan(x, y)
+            node, rect = subtrees[k], rects[k]
+        if node.data_size <= 0:
+            return self._scan(x, y)
+        return node
+
+    def _split(self, node, rect):
+        """Lay out the subtrees of <node> in <rect> and remember the result.
+
+        @type self: LayoutIndex
+        @type node: AbstractTree
+        @type rect: (int, int, int, int)
+        @rtype: (list[AbstractTree], list[(int, int, int, int)],
+                 list[int] | None, int)
+        """
+        pairs = self.engine(node, rect)
+        if self.min_area > 0:
+            # like in the layout, subtrees without pixels are left out
+            pairs = [(subtree, subtree_rect)
+                     for subtree, subtree_rect in pairs
+                     if subtree_rect[2] > 0 and subtree_rect[3] > 0]
+        subtrees = [subtree for subtree, _ in pairs]
+        rects = [subtree_rect for _, subtree_rect in pairs]
+        axis = 0 if rect[2] > rect[3] else 1
+        ends = [r[axis] + r[axis + 2] for r in rects]
+        start = rect[axis]
+        for k in range(len(rects)):
+            if rects[k][axis] != start or ends[k] < start:
+                ends = None
+                break
+            start = ends[k]
+        split = (subtrees, rects, ends, axis)
+        self._splits[id(node)] = split
+        return split
+
+    def _scan(self, x, y):
+        """Return the leaf containing (x, y) by checking every rectangle.
+
+        This is only needed when the data sizes are inconsistent, so that
+        the subtrees of a node do not exactly cover its rectangle.
+
+        @type self: LayoutIndex
+        @type x: int
+        @type y: int
+        @rtype: AbstractTree | None
+        """
+        style = (self.engine, self.min_area)
+        for rect, _, leaf in self._tree._iter_layout(self.rect, style):
+            if _contains(rect, x, y):
+                return leaf
+        return None
+
+
 class FileSystemTree(AbstractTree):
     """A tree representation of files and folders in a file system.
 
@@ -406,6 +989,8 @@ class FileSystemTree(AbstractTree):
     @type _parent_tree: FileSystemTree
         The parent FileSystemTree, aka the parent directory (automatically set)
     """
+    __slots__ = ()
+
     def __init__(self, path):
         """Store the file tree structure contained in the given file or folder.
 
@@ -431,6 +1016,108 @@ class FileSystemTree(AbstractTree):
                 subtrees += [FileSystemTree(os.path.join(path, d))]
             AbstractTree.__init__(self, os.path.basename(path), subtrees)
 
+    @classmethod
+    def from_path(cls, path, workers=1, cache=None, signatures=False):
+        """Return the file tree structure contained in the given file or
+        folder, built without recursion.
+
+        Produces the same tree as FileSystemTree(path), but each folder is
+        listed once with os.scandir and the file sizes come from the stat
+        results cached on its DirEntry objects. An explicit stack is used
+        instead of recursion, so deep trees cannot hit the recursion limit.
+
+        If <workers> is greater than 1, the folders are listed concurrently
+        by a pool of that many threads before the tree is put together.
+        The order of the subtrees does not depend on which thread finished
+        first: it is always the order reported by the operating system.
+
+        If a ScanCache is given as <cache>, folders that have not changed
+        since they were last recorded in it are not listed again.
+
+        If <signatures> is True, the signature of every node is computed as
+        the node is made, so the tree can be compared with another scan
+        with diff.
+
+        Precondition: <path> is a valid path for this computer.
+        workers >= 1
+
+        @type cls: type
+        @type path: str
+        @type workers: int
+        @type cache: scan_cache.ScanCache | None
+        @type signatures: bool
+        @rtype: FileSystemTree
+        """
+        if not os.path.isdir(path):
+            node = cls._new_node(os.path.basename(path), [],
+                                 os.path.getsize(path))
+            if signatures:
+                node.signature = _sign(node)
+            return node
+
+        list_dir = scan_dir if cache is None else cache.list_dir
+        if workers > 1:
+            # every folder is listed exactly once, so each listing can be
+            # handed over (and released) as soon as it is used
+            list_dir = _scan_parallel(path, workers, list_dir).pop
+
+        # Each frame is [name, entries of the folder, next entry, subtrees]
+        stack = [[os.path.basename(path), list_dir(path), 0, []]]
+        root = None
+        while root is None:
+            root = cls._scan_step(stack, list_dir, signatures)
+        return root
+
+    @classmethod
+    def _scan_step(cls, stack, list_dir, signatures):
+        """Take one step of the scan of from_path: make the node of the next
+        entry of the folder at the top of <stack>, or start listing it if it
+        is a folder, or, once all of its entries are done, make the node of
+        the folder itself.
+
+        Return the root of the tree once it is complete, otherwise None.
+
+        @type cls: type
+        @type stack: list[list]
+        @type list_dir: (str) -> list[(str, str, bool, int)]
+        @type signatures: bool
+        @rtype: FileSystemTree | None
+        """
+        frame = stack[-1]
+        entries = frame[1]
+        if frame[2] < len(entries):
+            entry_path, name, is_dir, size = entries[frame[2]]
+            frame[2] += 1
+            if is_dir:
+                stack.append([name, list_dir(entry_path), 0, []])
+                return None
+            node = cls._new_node(name, [], size)
+        else:
+            stack.pop()
+            node = cls._new_node(frame[0], frame[3])
+        if signatures:
+            node.signature = _sign(node)
+        if not stack:
+            return node
+        stack[-1][3].append(node)
+        return None
+
+    @classmethod
+    def _new_node(cls, root, subtrees, data_size=0):
+        """Return a new node of this class without touching the file system.
+
+        The arguments are the same as those of AbstractTree.__init__.
+
+        @type cls: type
+        @type root: str
+        @type subtrees: list[FileSystemTree]
+        @type data_size: int
+        @rtype: FileSystemTree
+        """
+        node = cls.__new__(cls)
+        AbstractTree.__init__(node, root, subtrees, data_size)
+        return node
+
     def get_separator(self):
         """Return the string used to separate nodes in the string
         representation of a path from the tree root to a leaf.
@@ -438,6 +1125,9 @@ class FileSystemTree(AbstractTree):
         Used by the treemap visualiser to generate a string displaying
         the items from the root of the tree to the currently selected leaf.
 
+        If the tree has a PathIndex, the path is read from it: only the
+        first path asked for in each folder walks up the tree.
+
         === Preconditions: ===
         self is a leaf, self._subtrees = []
 
@@ -446,17 +1136,530 @@ class FileSystemTree(AbstractTree):
         @rtype: str
             The path of the leaf
         """
-        if self is None:
-            return ''
-        elif self._parent_tree is None:
+        parent = self._parent_tree
+        if parent is None:
             return self._root
-        else:
-            p = os.path.join(self._parent_tree.get_separator(), self._root)
-            return p
+        indexes = _indexes_of(parent)
+        if not indexes and _folder_indexes:
+            # a folder not looked at yet: find the index of the whole tree
+            while parent._parent_tree is not None:
+                parent = parent._parent_tree
+            indexes = _indexes_of(parent)
+        for index in indexes:
+            separator = index.separator_of(self)
+            if separator is not None:
+                return separator
+        names = []
+        node = self
+        while node is not None:
+            names.append(node.get_root())
+            node = node._parent_tree
+        return os.path.join(*reversed(names))
+
+
+class PathIndex:
+    """Maps the paths of the files and folders in a FileSystemTree to their
+    nodes, and back.
+
+    The path of every folder is stored once, the first time it is needed,
+    and the paths of files are made from the path of their folder, so the
+    common part of the paths under a folder is never stored twice. Each
+    folder's subtrees are indexed by name the first time a path through it
+    is looked up.
+
+    The tree tells the index about every subtree added to or deleted from
+    the folders it knows (see delete_leaf, delete_subtree, add_subtree and
+    apply_changes), so a deleted node is no longer found, a new one is, and
+    every folder known is part of the tree. Once the folders on the way
+    have been seen, a lookup in either direction is a dictionary lookup and
+    at most one os.path.join, whatever the depth of the tree.
+
+    === Public Attributes ===
+    @type tree: FileSystemTree
+        The tree being indexed.
+    @type path: str
+        The path the tree was built from.
+
+    === Private Attributes ===
+    @type _paths: dict[str, FileSystemTree]
+        Maps the path of every folder known to its node.
+    @type _folders: dict[int, [FileSystemTree, str,
+                               dict[str, FileSystemTree] | None,
+                               dict[int, FileSystemTree]]]
+        Maps the id of every folder known to its node, its path, its
+        non-empty subtrees by name (None until one is looked up), and the
+        folders known among its subtrees, by id.
+    @type _prefix: int
+        The length of the part of every path before the name of the root
+        of the tree.
+    @type _ref: weakref.ref
+        The weak reference to this index stored in _folder_indexes.
+    """
+    def __init__(self, tree, path):
+        """Initialize an index of <tree>, which was built from the file or
+        folder at <path>.
+
+        @type self: PathIndex
+        @type tree: FileSystemTree
+        @type path: str
+        @rtype: None
+        """
+        self.tree = tree
+        self.path = path
+        self._paths = {}
+        self._folders = {}
+        self._prefix = len(path) - len(tree.get_root())
+        self._ref = weakref.ref(self, _drop_index)
+        self._add_folder(tree, path, None)
+
+    def find(self, path):
+        """Return the node of the file or folder at <path>, or None if it
+        is not in the tree.
+
+        <path> must be written the same way as the paths of the index, i.e.
+        be made by joining names to the path the tree was built from.
+
+        @type self: PathIndex
+        @type path: str
+        @rtype: FileSystemTree | None
+        """
+        names = []
+        node = self._paths.get(path)
+        while node is None:
+            parent_path, name = os.path.split(path)
+            if not name or parent_path == path:
+                # above the root of the tree
+                return None
+            names.append(name)
+            path = parent_path
+            node = self._paths.get(path)
+        while names:
+            name = names.pop()
+            child = self._child(node, name)
+            if child is None:
+                return None
+            path = os.path.join(path, name)
+            if names:
+                self._add_folder(child, path, node)
+            node = child
+        return node
+
+    def path_of(self, node):
+        """Return the path of the file or folder represented by <node>, or
+        None if it is not in the tree.
+
+        @type self: PathIndex
+        @type node: FileSystemTree
+        @rtype: str | None
+        """
+        if node.is_empty():
+            return None
+        entry = self._folders.get(id(node))
+        if entry is not None:
+            return entry[1]
+        if node._parent_tree is None:
+            # the root of another tree
+            return None
+        folder_path = self._folder_path(node._parent_tree)
+        if folder_path is None:
+            return None
+        return os.path.join(folder_path, node.get_root())
+
+    def separator_of(self, node):
+        """Return the names from the root of the tree down to <node>, like
+        FileSystemTree.get_separator, or None if it is not in the tree.
+
+        @type self: PathIndex
+        @type node: FileSystemTree
+        @rtype: str | None
+        """
+        path = self.path_of(node)
+        return None if path is None else path[self._prefix:]
+
+    def node_added(self, node):
+        """Record that <node> has just been added to the subtrees of its
+        parent. Called by the tree.
+
+        @type self: PathIndex
+        @type node: FileSystemTree
+        @rtype: None
+        """
+        entry = self._folders.get(id(node._parent_tree))
+        if entry is not None and entry[2] is not None and \
+                not node.is_empty():
+            entry[2][node.get_root()] = node
+
+    def node_removed(self, node):
+        """Record that <node>, and everything in it, is about to be deleted
+        from the tree. Called by the tree.
+
+        @type self: PathIndex
+        @type node: FileSystemTree
+        @rtype: None
+        """
+        entry = self._folders.get(id(node._parent_tree))
+        if entry is not None:
+            if entry[2] is not None and \
+                    entry[2].get(node.get_root()) is node:
+                del entry[2][node.get_root()]
+            entry[3].pop(id(node), None)
+        self._remove_folder(node)
+
+    def _child(self, folder, name):
+        """Return the non-empty subtree called <name> of <folder>, which is
+        known, or None.
+
+        @type self: PathIndex
+        @type folder: FileSystemTree
+        @type name: str
+        @rtype: FileSystemTree | None
+        """
+        entry = self._folders[id(folder)]
+        if entry[2] is None:
+            entry[2] = {subtree.get_root(): subtree
+                        for subtree in folder.get_subtrees()
+                        if not subtree.is_empty()}
+        return entry[2].get(name)
+
+    def _folder_path(self, folder):
+        """Return the path of <folder>, or None if it is not in the tree, and
+        remember the paths of the folders above it that were not known.
+
+        @type self: PathIndex
+        @type folder: FileSystemTree
+        @rtype: str | None
+        """
+        unknown = []
+        while id(folder) not in self._folders:
+            unknown.append(folder)
+            folder = folder.get_parent()
+            if folder is None:
+                # under a deleted folder, or in another tree
+                return None
+        path = self._folders[id(folder)][1]
+        for child in reversed(unknown):
+            path = os.path.join(path, child.get_root())
+            self._add_folder(child, path, folder)
+            folder = child
+        return path
+
+    def _add_folder(self, folder, path, parent):
+        """Remember that <folder>, a subtree of <parent> (None for the root
+        of the tree), is at <path>.
+
+        @type self: PathIndex
+        @type folder: FileSystemTree
+        @type path: str
+        @type parent: FileSystemTree | None
+        @rtype: None
+        """
+        if id(folder) in self._folders:
+            return
+        self._folders[id(folder)] = [folder, path, None, {}]
+        self._paths[path] = folder
+        if parent is not None:
+            self._folders[id(parent)][3][id(folder)] = folder
+        _folder_indexes.setdefault(id(folder), []).append(self._ref)
+
+    def _remove_folder(self, folder):
+        """Forget the path of <folder>, if it is known, and of every folder
+        known in it.
+
+        @type self: PathIndex
+        @type folder: FileSystemTree
+        @rtype: None
+        """
+        stack = [folder]
+        while stack:
+            folder = stack.pop()
+            entry = self._folders.pop(id(folder), None)
+            if entry is None:
+                continue
+            if self._paths.get(entry[1]) is folder:
+                del self._paths[entry[1]]
+            _unregister(id(folder), self._ref)
+            stack.extend(entry[3].values())
+
+
+# Helpers for PathIndex ======================================================
+
+def _indexes_of(folder):
+    """
+    Return the PathIndex objects that know the path of <folder>.
+
+    @type folder: AbstractTree | None
+    @rtype: list[PathIndex]
+    """
+    if not _folder_indexes:
+        return []
+    refs = _folder_indexes.get(id(folder), [])
+    return [index for index in (ref() for ref in refs) if index is not None]
+
+
+def _node_added(node):
+    """
+    Tell the PathIndex objects of the tree that <node> has just been added
+    to its parent.
+
+    @type node: AbstractTree
+    @rtype: None
+    """
+    for index in _indexes_of(node.get_parent()):
+        index.node_added(node)
+
+
+def _node_removed(node):
+    """
+    Tell the PathIndex objects of the tree that <node> is about to be
+    deleted from it.
+
+    @type node: AbstractTree
+    @rtype: None
+    """
+    parent = node.get_parent()
+    for index in _indexes_of(node if parent is None else parent):
+        index.node_removed(node)
+
+
+def _unregister(key, ref):
+    """
+    Remove <ref> from the weak references stored in _folder_indexes for the
+    folder whose id is <key>.
+
+    @type key: int
+    @type ref: weakref.ref
+    @rtype: None
+    """
+    refs = _folder_indexes.get(key)
+    if refs is not None and ref in refs:
+        refs.remove(ref)
+        if not refs:
+            del _folder_indexes[key]
+
+
+def _drop_index(ref):
+    """
+    Remove <ref>, the weak reference to a PathIndex that no longer exists,
+    from _folder_indexes.
+
+    @type ref: weakref.ref
+    @rtype: None
+    """
+    for key in [key for key, refs in _folder_indexes.items() if ref in refs]:
+        _unregister(key, ref)
+
+
+# Helpers for FileSystemTree =================================================
+
+def scan_dir(path):
+    """
+    List the folder at <path> with a single os.scandir call.
+
+    Returns one (path, name, is_dir, size) tuple per entry, in the order the
+    entries are reported by the operating system (the same order as
+    os.listdir). Folders are given a size of 0. Like os.path.isdir and
+    os.path.getsize, symbolic links are followed.
+
+    @type path: str
+    @rtype: list[(str, str, bool, int)]
+    """
+    result = []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir():
+                result.append((entry.path, entry.name, True, 0))
+            else:
+                result.append((entry.path, entry.name, False,
+                               entry.stat().st_size))
+    return result
+
+
+def _scan_parallel(path, workers, list_dir):
+    """
+    List the folder at <path> and every folder below it using a pool of
+    <workers> threads, calling <list_dir> once per folder.
+
+    Returns a dictionary mapping the path of each folder to its listing,
+    in the format returned by scan_dir. An error raised while listing any
+    folder is re-raised here.
+
+    @type path: str
+    @type workers: int
+    @type list_dir: (str) -> list[(str, str, bool, int)]
+    @rtype: dict[str, list[(str, str, bool, int)]]
+    """
+    listings = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(list_dir, path): path}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                entries = future.result()
+                listings[pending.pop(future)] = entries
+                _submit_folders(pool, pending, entries, list_dir)
+    return listings
+
+
+def _submit_folders(pool, pending, entries, list_dir):
+    """
+    Submit a call to <list_dir> to <pool> for each folder in <entries>, and
+    record the path of each one in <pending> under its future.
+
+    @type pool: ThreadPoolExecutor
+    @type pending: dict[concurrent.futures.Future, str]
+    @type entries: list[(str, str, bool, int)]
+    @type list_dir: (str) -> list[(str, str, bool, int)]
+    @rtype: None
+    """
+    for entry_path, _, is_dir, _ in entries:
+        if is_dir:
+            pending[pool.submit(list_dir, entry_path)] = entry_path
 
 
 # Helpers for AbstractTree ===================================================
 
+def slice_and_dice(tree, rect):
+    """
+    Divide <rect> among the non-empty subtrees of <tree> in proportion to
+    their sizes, as described in AbstractTree.generate_treemap, and return
+    each subtree with its rectangle.
+
+    If rect is wider than it is tall it is cut into vertical strips,
+    otherwise into horizontal strips. The widths (or heights) are rounded
+    down, and the last subtree covers the remaining area.
+
+    @type tree: AbstractTree
+    @type rect: (int, int, int, int)
+    @rtype: list[(AbstractTree, (int, int, int, int))]
+    """
+    n_empty = tree.get_non_empty_leaves()
+    final_rect_pos = find_last(n_empty)
+    result = []
+    x, y, width, height = rect
+    offset = 0
+    for i in range(0, len(n_empty)):
+        if n_empty[i].data_size > 0 and i != final_rect_pos:
+            fraction = n_empty[i].data_size / tree.data_size
+            if width > height:
+                # divide the rectangle into vertical strips
+                adj_width = int(math.floor(fraction * width))
+                result.append((n_empty[i], (x + offset, y, adj_width,
+                                            height)))
+                offset += adj_width
+            else:
+                # divide the rectangle into horizontal strips
+                adj_height = int(math.floor(fraction * height))
+                result.append((n_empty[i], (x, y + offset, width,
+                                            adj_height)))
+                offset += adj_height
+        elif i == final_rect_pos:
+            # if it is the last one, make it cover the remaining area
+            if width > height:
+                result.append((n_empty[i], (x + offset, y, width - offset,
+                                            height)))
+            else:
+                result.append((n_empty[i], (x, y + offset, width,
+                                            height - offset)))
+    return result
+
+
+def squarify(tree, rect):
+    """
+    Divide <rect> among the non-empty subtrees of <tree> in proportion to
+    their sizes, keeping the rectangles as close to squares as possible,
+    and return each subtree with its rectangle.
+
+    This is the squarified treemap algorithm of Bruls, Huizing and van
+    Wijk. The subtrees are taken from largest to smallest and laid out in
+    rows along the shorter side of the remaining area; a subtree starts a
+    new row when adding it to the current one would make the row's worst
+    aspect ratio worse. Like in slice_and_dice, sizes are rounded down,
+    and the last row (and the last subtree of each row) covers the
+    remaining area, so the rectangles fill <rect> exactly.
+
+    Sorting the subtrees takes O(n log n) time and laying them out O(n).
+
+    @type tree: AbstractTree
+    @type rect: (int, int, int, int)
+    @rtype: list[(AbstractTree, (int, int, int, int))]
+    """
+    subtrees = sorted(tree.get_non_empty_leaves(),
+                      key=lambda subtree: subtree.data_size, reverse=True)
+    result = []
+    x, y, width, height = rect
+    remaining = sum(subtree.data_size for subtree in subtrees)
+    start = 0
+    while start < len(subtrees):
+        # area per unit of data size in what is left of the rectangle
+        scale = width * height / remaining if remaining > 0 else 0
+        side = min(width, height)
+        end = start + 1
+        row_size = subtrees[start].data_size
+        worst = _worst_ratio(row_size, row_size, row_size, scale, side)
+        while end < len(subtrees):
+            size = subtrees[end].data_size
+            ratio = _worst_ratio(subtrees[start].data_size, size,
+                                 row_size + size, scale, side)
+            if ratio > worst:
+                break
+            worst = ratio
+            row_size += size
+            end += 1
+
+        # the thickness of the row, across the longer side
+        if end == len(subtrees):
+            thickness = max(width, height)
+        else:
+            thickness = int(math.floor(row_size / remaining *
+                                       max(width, height)))
+        offset = 0
+        for k in range(start, end):
+            if k == end - 1:
+                length = side - offset
+            else:
+                length = int(math.floor(subtrees[k].data_size / row_size *
+                                        side))
+            if width > height:
+                # a column on the left of the remaining area
+                result.append((subtrees[k], (x, y + offset, thickness,
+                                             length)))
+            else:
+                # a row on top of the remaining area
+                result.append((subtrees[k], (x + offset, y, length,
+                                             thickness)))
+            offset += length
+        if width > height:
+            x += thickness
+            width -= thickness
+        else:
+            y += thickness
+            height -= thickness
+        remaining -= row_size
+        start = end
+    return result
+
+
+def _worst_ratio(largest, smallest, row_size, scale, side):
+    """Return the worst aspect ratio (at least 1) of the rectangles in a row
+    of total data size <row_size> laid along a side of length <side>, whose
+    largest and smallest data sizes are <largest> and <smallest>, where
+    each unit of data size covers an area of <scale>.
+
+    @type largest: int
+    @type smallest: int
+    @type row_size: int
+    @type scale: float
+    @type side: int
+    @rtype: float
+    """
+    area = row_size * scale
+    if area == 0 or smallest == 0 or side == 0:
+        return float('inf')
+    side_squared = side * side
+    return max(side_squared * largest * scale / (area * area),
+               area * area / (side_squared * smallest * scale))
+
+
 def extract_nested(nested_lst):
     """
     Extract a list from a nested list. Does not mutate the original list
@@ -475,6 +1678,130 @@ def extract_nested(nested_lst):
         return lst
 
 
+def diff(old_tree, new_tree):
+    """
+    Return the paths that differ between <old_tree> and <new_tree>, e.g.
+    two scans of the same folder, with the change in data size of each,
+    sorted by path.
+
+    Subtrees are matched by their root values. A subtree found in only one
+    of the trees is reported as a whole, with all of its data size as the
+    change (negative if it is only in <old_tree>), without listing what is
+    inside it. A leaf in one tree that is not a leaf in the other is
+    reported as a whole too.
+
+    Two subtrees with the same signature are skipped without looking
+    inside them. With signatures (see FileSystemTree.from_path and
+    AbstractTree.update_signatures), the time taken depends on the amount
+    of change rather than on the size of the trees; subtrees without
+    signatures are compared node by node.
+
+    The paths are joined with os.path.join from the root value of
+    <new_tree> down, like those of FileSystemTree.get_separator.
+
+    === Preconditions: ===
+    neither tree is empty
+
+    @type old_tree: AbstractTree
+    @type new_tree: AbstractTree
+    @rtype: list[(str, int)]
+    """
+    result = []
+    stack = [(old_tree, new_tree, str(new_tree.get_root()))]
+    while stack:
+        old, new, path = stack.pop()
+        if old.signature is not None and old.signature == new.signature:
+            continue
+        old_is_leaf = old.get_subtrees() == []
+        if old_is_leaf or new.get_subtrees() == []:
+            if old.data_size != new.data_size or \
+                    old_is_leaf != (new.get_subtrees() == []):
+                result.append((path, new.data_size - old.data_size))
+            continue
+        old_subtrees = {subtree.get_root(): subtree
+                        for subtree in old.get_subtrees()
+                        if not subtree.is_empty()}
+        for subtree in new.get_subtrees():
+            if subtree.is_empty():
+                continue
+            subtree_path = os.path.join(path, str(subtree.get_root()))
+            match = old_subtrees.pop(subtree.get_root(), None)
+            if match is None:
+                result.append((subtree_path, subtree.data_size))
+            else:
+                stack.append((match, subtree, subtree_path))
+        for root, subtree in old_subtrees.items():
+            result.append((os.path.join(path, str(root)),
+                           -subtree.data_size))
+    result.sort()
+    return result
+
+
+def _sign(tree):
+    """
+    Return the signature of <tree>: a hash of its root value, its data size
+    and the signatures of its non-empty subtrees, which must be computed.
+
+    The signatures of the subtrees are sorted first, so the order of the
+    subtrees (e.g. the order in which a folder was listed) does not matter.
+
+    @type tree: AbstractTree
+    @rtype: bytes
+    """
+    digest = blake2b(digest_size=16)
+    digest.update(str(tree.get_root()).encode('utf-8', 'surrogateescape'))
+    digest.update(b'\0%d\0' % tree.data_size)
+    for signature in sorted(subtree.signature
+                            for subtree in tree.get_subtrees()
+                            if not subtree.is_empty()):
+        digest.update(signature)
+    return digest.digest()
+
+
+def _remove_dead(levels, ratio, keep_folders=False):
+    """
+    Remove the empty (deleted) subtrees from the subtrees of each node in
+    <levels>, which holds the nodes of a tree by depth, for the nodes in
+    which more than <ratio> of the subtrees are empty.
+
+    The nodes are visited from the deepest level up. A node left with no
+    subtrees and a size of 0 (unless it is at depth 0) is then emptied too,
+    and its parent is added to the level above. If <keep_folders> is True,
+    the nodes whose subtrees are all empty are left as they are instead.
+
+    Return the number of subtrees removed.
+
+    @type levels: list[dict[int, AbstractTree]]
+    @type ratio: float
+    @type keep_folders: bool
+    @rtype: int
+    """
+    removed = 0
+    for depth in range(len(levels) - 1, -1, -1):
+        for node in levels[depth].values():
+            if keep_folders and all(subtree.is_empty()
+                                    for subtree in node.get_subtrees()):
+                continue
+            parent = node.get_parent()
+            removed += node.remove_deleted_subtrees(ratio, depth > 0)
+            if node.is_empty() and parent is not None:
+                levels[depth - 1][id(parent)] = parent
+    return removed
+
+
+def _contains(rect, x, y):
+    """
+    Return whether the point (x, y) is inside <rect>, including its edges.
+
+    @type rect: (int, int, int, int)
+    @type x: int
+    @type y: int
+    @rtype: bool
+    """
+    return rect[0] <= x <= rect[0] + rect[2] and \
+        rect[1] <= y <= rect[1] + rect[3]
+
+
 def find_last(lst):
     """
     Find the last non-zero sized leaf in a list of subtrees and
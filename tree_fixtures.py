@@ -0,0 +1,22 @@
+"""Trees shared by the tests
+
+=== Module Description ===
+This module contains the trees that several test modules build, so that
+each one is defined in a single place.
+"""
+from population import PopulationTree
+
+
+def make_tree(seed):
+    """Return a three-level PopulationTree whose shape depends on <seed>.
+
+    @type seed: int
+    @rtype: PopulationTree
+    """
+    regions = []
+    for r in range(1 + seed % 7):
+        countries = [PopulationTree(False, 'c{}'.format(c), None,
+                                    (seed * 31 + r * 17 + c * 7) % 50)
+                     for c in range(1 + (seed + r) % 9)]
+        regions.append(PopulationTree(False, 'r{}'.format(r), countries))
+    return PopulationTree(False, 'World', regions)
@@ -12,9 +12,15 @@ concrete subclass, of course), rendering it to the user using pygame,
 and detecting user events like mouse clicks and key presses and responding
 to them.
 """
+import time
+
 import pygame
-from tree_data import FileSystemTree
+import raster
+import vector_layout
+from tree_data import FileSystemTree, PathIndex
 from population import PopulationTree
+from fs_watcher import PollingWatcher
+from scan_cache import ScanCache
 
 
 # Screen dimensions and coordinates
@@ -27,65 +33,199 @@ TREEMAP_HEIGHT = HEIGHT - FONT_HEIGHT  # The height of the treemap display.
 # Font to use for the treemap program.
 FONT_FAMILY = 'Consolas'
 
+# Subtrees covering fewer pixels than this (a 4 by 4 square) are drawn, and
+# selected, as one aggregate rectangle in their own colour, so the cost of a
+# frame depends on the display size rather than on the size of the tree.
+MIN_AREA = 16
+
+# How often (in milliseconds) a watched file system is checked for changes,
+# and the event type used to trigger the check.
+WATCH_INTERVAL = 1000
+WATCH_EVENT = pygame.USEREVENT + 1
+
+# The most frames drawn per second. Events arriving faster than this are
+# handled together, with one update of the display.
+FRAME_RATE = 60
+
 
-def run_visualisation(tree):
+def run_visualisation(tree, watcher=None, engine=None):
     """Display an interactive graphical display of the given tree's treemap.
 
+    If <watcher> is given, it is polled every WATCH_INTERVAL milliseconds
+    and the changes it finds are applied to the tree.
+
     @type tree: AbstractTree
         the tree to visualize
+    @type watcher: fs_watcher.PollingWatcher | None
+        the watcher keeping the tree up to date
+    @type engine: function | None
+        the layout engine (e.g. tree_data.squarify), or None for the
+        default slice-and-dice layout
     @rtype: None
     """
     # Setup pygame
     pygame.init()
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    canvas = TreemapCanvas()
 
     # print(tree._root, tree.data_size)
     # Render the initial display of the static treemap.
-    render_display(screen, tree, '')
+    render_display(screen, tree, '', engine, canvas)
 
     # Start an event loop to respond to events.
-    event_loop(screen, tree)
+    event_loop(screen, tree, watcher, engine, canvas)
+
+
+class TreemapCanvas:
+    """The treemap, drawn on an offscreen surface that is kept between
+    frames.
+
+    When the tree changes, only the rectangles whose position, size or
+    colour changed since the previous frame are drawn again.
 
+    === Public Attributes ===
+    @type surface: pygame.Surface
+        The treemap drawn so far, WIDTH by TREEMAP_HEIGHT pixels.
 
-def render_display(screen, tree, text):
+    === Private Attributes ===
+    @type _drawn: set[((int, int, int, int), (int, int, int))]
+        The rectangles and colours on the surface.
+    """
+    def __init__(self):
+        """Initialize a black canvas.
+
+        @type self: TreemapCanvas
+        @rtype: None
+        """
+        self.surface = pygame.Surface((WIDTH, TREEMAP_HEIGHT))
+        self.surface.fill(pygame.color.THECOLORS['black'])
+        self._drawn = set()
+
+    def update(self, tree, engine=None):
+        """Bring the surface up to date with the treemap of <tree>, and
+        return the part of it that changed, or None if nothing did.
+
+        The rectangles of a treemap do not overlap, so every pixel of a
+        rectangle that is no longer drawn is either covered by a new
+        rectangle or left black.
+
+        @type self: TreemapCanvas
+        @type tree: AbstractTree
+        @type engine: function | None
+        @rtype: pygame.Rect | None
+        """
+        if tree.data_size > 0:
+            # the list API, so that the layout cache is used
+            rects = set(tree.generate_treemap(
+                (0, 0, WIDTH, TREEMAP_HEIGHT), engine, MIN_AREA))
+        else:
+            rects = set()
+        removed = self._drawn - rects
+        added = rects - self._drawn
+        if not removed and not added:
+            return None
+        black = pygame.color.THECOLORS['black']
+        for rect, _ in removed:
+            self.surface.fill(black, rect)
+        for rect, colour in added:
+            pygame.draw.rect(self.surface, colour, rect)
+        self._drawn = rects
+        changed = [pygame.Rect(rect) for rect, _ in removed | added]
+        return changed[0].unionall(changed[1:])
+
+
+def render_display(screen, tree, text, engine=None, canvas=None):
     """Render a treemap and text display to the given screen.
 
     Use the constants TREEMAP_HEIGHT and FONT_HEIGHT to divide the
     screen vertically into the treemap and text comments.
 
+    If a <canvas> holding the previous frame is given, only the part of the
+    treemap that changed is drawn and updated on the screen. Otherwise the
+    whole treemap is drawn with draw_treemap.
+
     @type screen: pygame.Surface
         The display window
     @type tree: AbstractTree
         The tree to render
     @type text: str
         The text to render.
+    @type engine: function | None
+        The layout engine, or None for the default one
+    @type canvas: TreemapCanvas | None
+        The treemap drawn by the previous call
     @rtype: None
     """
-    # First, clear the screen
-    pygame.draw.rect(screen, pygame.color.THECOLORS['black'],
-                     (0, 0, WIDTH, HEIGHT))
-
-    rectangle_list = tree.generate_treemap((0, 0, WIDTH, TREEMAP_HEIGHT))
-    if tree.data_size > 0:
-        # if the data size is less than 0, the screen is black
-        # draw each rectangle returned by generate_treemap
-        for i in rectangle_list:
-            pygame.draw.rect(screen, i[1], i[0])
-        _render_text(screen, text)
+    if canvas is None:
+        surface = pygame.Surface((WIDTH, TREEMAP_HEIGHT))
+        draw_treemap(surface, tree, engine)
+        dirty = [pygame.Rect(0, 0, WIDTH, TREEMAP_HEIGHT)]
+    else:
+        surface = canvas.surface
+        changed = canvas.update(tree, engine)
+        dirty = [] if changed is None else [changed]
+    for rect in dirty:
+        screen.blit(surface, rect, rect)
+    dirty.append(_render_text(screen, text if tree.data_size > 0 else ''))
 
     # This must be called *after* all other pygame functions have run.
-    pygame.display.flip()
+    pygame.display.update(dirty)
+
+
+def draw_treemap(surface, tree, engine=None):
+    """Draw the whole treemap of <tree> on <surface>, which is WIDTH by
+    TREEMAP_HEIGHT pixels, over a black background.
+
+    With the default layout engine, the tree is laid out into arrays by
+    vector_layout and all of the rectangles are written in one pass by
+    raster, so no Python object or pygame call is needed per rectangle.
+    Other engines are drawn one rectangle at a time.
+
+    @type surface: pygame.Surface
+    @type tree: AbstractTree
+    @type engine: function | None
+    @rtype: None
+    """
+    surface.fill(pygame.color.THECOLORS['black'])
+    if tree.data_size <= 0:
+        return
+    rect = (0, 0, WIDTH, TREEMAP_HEIGHT)
+    if engine is None:
+        raster.fill_arrays(surface, *vector_layout.treemap_arrays(
+            tree, rect, MIN_AREA))
+    else:
+        for leaf_rect, colour in tree.iter_treemap(rect, engine, MIN_AREA):
+            pygame.draw.rect(surface, colour, leaf_rect)
+
+
+def render_text(screen, tree, text):
+    """Render only the text display, for when the tree has not changed.
+
+    @type screen: pygame.Surface
+        The display window
+    @type tree: AbstractTree
+        The tree shown
+    @type text: str
+        The text to render.
+    @rtype: None
+    """
+    pygame.display.update(
+        _render_text(screen, text if tree.data_size > 0 else ''))
 
 
 def _render_text(screen, text):
-    """Render text at the bottom of the display.
+    """Render text at the bottom of the display, replacing the text that
+    was there, and return the area of the screen that was drawn.
 
     @type screen: pygame.Surface
         the display window
     @type text: str
         the text to render
-    @rtype: None
+    @rtype: pygame.Rect
     """
+    text_bar = pygame.Rect(0, TREEMAP_HEIGHT, WIDTH, FONT_HEIGHT)
+    screen.fill(pygame.color.THECOLORS['black'], text_bar)
+
     # The font we want to use
     font = pygame.font.SysFont(FONT_FAMILY, FONT_HEIGHT - 8)
     text_surface = font.render(text, 1, pygame.color.THECOLORS['white'])
@@ -93,111 +233,312 @@ def _render_text(screen, text):
     # Where to render the text_surface
     text_pos = (0, HEIGHT - FONT_HEIGHT + 4)
     screen.blit(text_surface, text_pos)
+    return text_bar
 
 
-def event_loop(screen, tree):
+def event_loop(screen, tree, watcher=None, engine=None, canvas=None,
+               counters=None):
     """Respond to events (mouse clicks, key presses) and update the display.
 
-    Note that the event loop is an *infinite loop*: it continually waits for
-    the next event, determines the event's type, and then updates the state
-    of the visualisation or the tree itself, updating the display if necessary.
-    This loop ends when the user closes the window.
+    Note that the event loop is an *infinite loop*: it waits for the next
+    event, then handles it together with every other event that is already
+    waiting, updating the state of the visualisation or the tree itself.
+    The display is updated once for all of them, so several size changes
+    made in a row cost a single relayout. Frames are drawn at most
+    FRAME_RATE times per second, and no time is spent while there is
+    nothing to do. This loop ends when the user closes the window.
+
+    A right click deletes the leaf clicked, and a right click with shift
+    held down deletes the whole folder (subtree) containing it, or the
+    aggregate clicked.
+
+    Selecting a leaf only redraws the text display; changes to the tree
+    redraw the rectangles that changed.
 
     @type screen: pygame.Surface
         the display window
     @type tree: AbstractTree
         the tree which to render
-    @rtype: None
+    @type watcher: fs_watcher.PollingWatcher | None
+        the watcher keeping the tree up to date
+    @type engine: function | None
+        the layout engine, or None for the default one
+    @type canvas: TreemapCanvas | None
+        the treemap currently on the screen, or None to draw it again
+    @type counters: FrameCounters | None
+        the counters to record each frame in, or None for new ones
+    @rtype: FrameCounters
     """
 
     selected_leaf = None
+    if counters is None:
+        counters = FrameCounters()
+    if canvas is None:
+        canvas = TreemapCanvas()
+        render_display(screen, tree, '', engine, canvas)
+    if watcher is not None:
+        pygame.time.set_timer(WATCH_EVENT, WATCH_INTERVAL)
+    clock = pygame.time.Clock()
 
     while True:
-        # Wait for an event
-        event = pygame.event.poll()
-        if event.type == pygame.QUIT:
-            return
-
-        # render_display is called as data_sizes change, and
-        # treemap and rectangles are updated
-        if event.type == pygame.MOUSEBUTTONUP and event.button == 1:
-            # if user clicks left mouse button, select or deselect a leaf
-            previous_leaf = selected_leaf
-            selected_leaf = tree.find_leaf(event.pos, WIDTH, TREEMAP_HEIGHT)
-            if selected_leaf is not None and previous_leaf is None:
-                # selecting new leaf
-                render_display(screen, tree,
-                               selected_leaf.get_separator() + ' (' +
-                               str(selected_leaf.data_size) + ')')
-            elif selected_leaf is not None and previous_leaf != selected_leaf:
-                # selecting new leaf
-                render_display(screen, tree,
-                               selected_leaf.get_separator() + ' (' +
-                               str(selected_leaf.data_size) + ')')
-            elif selected_leaf is not None and previous_leaf == selected_leaf:
-                # deselecting leaf
-                render_display(screen, tree, '')
-                selected_leaf = None
-
-        elif event.type == pygame.MOUSEBUTTONUP and event.button == 3:
-            # if user clicks right mouse button, delete the leaf
-            to_be_deleted = tree.find_leaf(event.pos, WIDTH, TREEMAP_HEIGHT)
-            if to_be_deleted is not None:
-                # delete the leaf
-                to_be_deleted.delete_leaf()
-            if selected_leaf is None:
-                # no selected leaf, don't display path
-                render_display(screen, tree, '')
-            elif selected_leaf.is_empty():
-                # selected is an empty leaf, don't display path
-                render_display(screen, tree, '')
-            elif to_be_deleted == selected_leaf:
-                # deleted the selected leaf, don't display path
-                render_display(screen, tree, '')
-            else:
-                # selected leaf is not deleted, continue to display its path
-                render_display(screen, tree,
-                               selected_leaf.get_separator() + ' (' +
-                               str(selected_leaf.data_size) + ')')
-
-        if event.type == pygame.KEYUP and event.key == pygame.K_UP:
-            # if up arrow key is pressed, selected leaf's size increases
-            if selected_leaf is None:
-                render_display(screen, tree, '')
-            else:
-                selected_leaf.increase_data_size()
-                render_display(screen, tree, selected_leaf.get_separator() +
-                               ' (' + str(selected_leaf.data_size) + ')')
-        elif event.type == pygame.KEYUP and event.key == pygame.K_DOWN:
-            # if down arrow key is pressed, selected leaf's size decreases
-            if selected_leaf is None:
-                render_display(screen, tree, '')
+        # Sleep until there is an event, then take all of the waiting ones
+        events = [pygame.event.wait()] + pygame.event.get()
+        start = time.perf_counter()
+        tree_changed = False
+        text_changed = False
+
+        for event in events:
+            if event.type == pygame.QUIT:
+                _stop_watching(watcher)
+                return counters
+
+            if event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+                selected_leaf = _select(tree, event.pos, engine,
+                                        selected_leaf)
+                changes = (False, True)
+            elif event.type == pygame.MOUSEBUTTONUP and event.button == 3:
+                changes = _delete(tree, event.pos, engine)
+            elif event.type == WATCH_EVENT:
+                # the file system changed, if the watcher found anything
+                changes = (watcher.update() != [], False)
+            elif event.type == pygame.KEYUP and \
+                    event.key in (pygame.K_UP, pygame.K_DOWN):
+                changes = _resize(selected_leaf, event.key)
             else:
-                selected_leaf.decrease_data_size()
-                render_display(screen, tree, selected_leaf.get_separator() +
-                               ' (' + str(selected_leaf.data_size) + ')')
+                continue
+            tree_changed = tree_changed or changes[0]
+            text_changed = text_changed or changes[1]
+
+        if selected_leaf is not None and not _in_tree(selected_leaf, tree):
+            # the selected leaf was deleted, don't display its path
+            selected_leaf = None
+        if selected_leaf is None:
+            text = ''
+        else:
+            text = selected_leaf.get_separator() + ' (' + \
+                str(selected_leaf.data_size) + ')'
+        if tree_changed:
+            render_display(screen, tree, text, engine, canvas)
+        elif text_changed:
+            render_text(screen, tree, text)
+
+        counters.record(len(events), time.perf_counter() - start)
+        clock.tick(FRAME_RATE)
+
+
+def _stop_watching(watcher):
+    """Stop the timer that polls <watcher>, if there is one.
+
+    @type watcher: fs_watcher.PollingWatcher | None
+    @rtype: None
+    """
+    if watcher is not None:
+        pygame.time.set_timer(WATCH_EVENT, 0)
+
+
+def _select(tree, pos, engine, selected_leaf):
+    """Return the leaf to select after a left click at <pos>: the leaf
+    clicked, or None to deselect it if it is already <selected_leaf>.
 
+    @type tree: AbstractTree
+    @type pos: (int, int)
+    @type engine: function | None
+    @type selected_leaf: AbstractTree | None
+    @rtype: AbstractTree | None
+    """
+    leaf = tree.find_leaf(pos, WIDTH, TREEMAP_HEIGHT, engine, MIN_AREA)
+    if leaf is not None and selected_leaf is not None and \
+            leaf == selected_leaf:
+        return None
+    return leaf
+
+
+def _delete(tree, pos, engine):
+    """Handle a right click at <pos>: delete the leaf clicked, or with shift
+    held down, the folder (subtree) containing it.
 
-def run_treemap_file_system(path):
+    Return whether the tree and the text display changed.
+
+    @type tree: AbstractTree
+    @type pos: (int, int)
+    @type engine: function | None
+    @rtype: (bool, bool)
+    """
+    to_be_deleted = tree.find_leaf(pos, WIDTH, TREEMAP_HEIGHT, engine,
+                                   MIN_AREA)
+    if to_be_deleted is None:
+        return False, False
+    if pygame.key.get_mods() & pygame.KMOD_SHIFT:
+        return _delete_subtree(to_be_deleted)
+    if to_be_deleted.get_non_empty_leaves() != []:
+        # aggregates of several leaves are left alone
+        return False, False
+    to_be_deleted.delete_leaf()
+    return True, False
+
+
+def _delete_subtree(node):
+    """Handle a right click with shift held down on <node>: delete the
+    folder (subtree) containing it if it is a leaf, or <node> itself if it
+    is an aggregate of several leaves, which is a folder already. The whole
+    tree is never deleted.
+
+    Return whether the tree and the text display changed.
+
+    @type node: AbstractTree
+    @rtype: (bool, bool)
+    """
+    if node.get_non_empty_leaves() == []:
+        folder = node.get_parent()
+    else:
+        folder = node
+    if folder is None or folder.get_parent() is None:
+        return False, False
+    folder.delete_subtree()
+    return True, False
+
+
+def _resize(selected_leaf, key):
+    """Handle the up or down arrow <key>: increase or decrease the size of
+    <selected_leaf>. Aggregates are not resized.
+
+    Return whether the tree and the text display changed.
+
+    @type selected_leaf: AbstractTree | None
+    @type key: int
+    @rtype: (bool, bool)
+    """
+    if selected_leaf is None or selected_leaf.is_empty() or \
+            selected_leaf.get_non_empty_leaves() != []:
+        return False, True
+    if key == pygame.K_UP:
+        selected_leaf.increase_data_size()
+    else:
+        selected_leaf.decrease_data_size()
+    return True, True
+
+
+def _in_tree(node, tree):
+    """Return whether <node> is part of <tree>, i.e. neither it nor a tree
+    containing it has been deleted.
+
+    @type node: AbstractTree
+    @type tree: AbstractTree
+    @rtype: bool
+    """
+    if node.is_empty():
+        return False
+    while node.get_parent() is not None:
+        node = node.get_parent()
+    # a CompactTree makes a new view of a node each time it is asked for
+    return node == tree
+
+
+class FrameCounters:
+    """The number of frames drawn by event_loop, the number of events
+    handled in them, and the time they took.
+
+    A frame handles every event waiting when it starts, and updates the
+    display at most once. The time of a frame does not include the time
+    spent waiting for events, or for the frame rate limit.
+
+    === Public Attributes ===
+    @type frames: int
+        The number of frames.
+    @type events: int
+        The number of events handled in all frames.
+    @type most_events: int
+        The largest number of events handled in one frame.
+    @type frame_time: float
+        The time taken by all frames, in seconds.
+    @type longest: float
+        The time taken by the slowest frame, in seconds.
+    """
+    def __init__(self):
+        """Initialize counters with no frames.
+
+        @type self: FrameCounters
+        @rtype: None
+        """
+        self.frames = 0
+        self.events = 0
+        self.most_events = 0
+        self.frame_time = 0.0
+        self.longest = 0.0
+
+    def record(self, events, seconds):
+        """Count a frame which handled <events> events in <seconds>.
+
+        @type self: FrameCounters
+        @type events: int
+        @type seconds: float
+        @rtype: None
+        """
+        self.frames += 1
+        self.events += events
+        self.most_events = max(self.most_events, events)
+        self.frame_time += seconds
+        self.longest = max(self.longest, seconds)
+
+    def stats(self):
+        """Return a one-line summary of the frames and events.
+
+        @type self: FrameCounters
+        @rtype: str
+        """
+        if self.frames == 0:
+            return '0 frames'
+        return '{} frames, {:.2f} events per frame (at most {}), ' \
+               '{:.2f} ms per frame (at most {:.2f} ms)'.format(
+                   self.frames, self.events / self.frames, self.most_events,
+                   1000 * self.frame_time / self.frames, 1000 * self.longest)
+
+
+def run_treemap_file_system(path, cache_path=None, watch=False, engine=None):
     """Run a treemap visualisation for the given path's file structure.
 
+    If <cache_path> is given, the scan results are stored in that file, and
+    folders that have not changed since the previous run are not listed
+    again.
+
+    If <watch> is True, files created, deleted or resized while the
+    visualisation is running are shown as they happen.
+
     Precondition: <path> is a valid path to a file or folder.
 
     @type path: str
         the system path
+    @type cache_path: str | None
+        the scan cache file
+    @type watch: bool
+        whether to follow changes to the file system
+    @type engine: function | None
+        the layout engine (e.g. tree_data.squarify), or None for the
+        default slice-and-dice layout
     @rtype: None
     """
-    file_tree = FileSystemTree(path)
-    run_visualisation(file_tree)
-
-
-def run_treemap_population():
+    if cache_path is None:
+        file_tree = FileSystemTree.from_path(path)
+    else:
+        cache = ScanCache(cache_path)
+        file_tree = FileSystemTree.from_path(path, cache=cache)
+        cache.save()
+    # kept alive while the visualisation runs, so that get_separator reads
+    # the paths shown in the status text from it
+    paths = PathIndex(file_tree, path)
+    watcher = PollingWatcher(file_tree, path, paths) if watch else None
+    run_visualisation(file_tree, watcher, engine)
+
+
+def run_treemap_population(engine=None):
     """Run a treemap visualisation for World Bank population data.
 
+    @type engine: function | None
+        the layout engine, or None for the default one
     @rtype: None
     """
     pop_tree = PopulationTree(True)
-    run_visualisation(pop_tree)
+    run_visualisation(pop_tree, engine=engine)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,190 @@
+"""Vectorized treemap layout
+
+=== Module Description ===
+This module contains a slice-and-dice layout engine that uses NumPy to lay
+out a tree one level at a time, instead of one node at a time.
+
+The nodes are visited in breadth-first order, so the children of each
+node are next to each other. For each level, the rectangles of all of its
+nodes are computed from the rectangles of their parents with a few array
+operations: the strip widths (or heights) are rounded down fractions of
+the parent, their running sum within each parent gives the offsets, and
+the last child of each parent covers the remainder. Subtrees smaller than
+a minimum area are not divided, so the levels below them are never
+visited.
+
+The rectangles are exactly those of AbstractTree.generate_layout, as long
+as every data size is below 2 ** 53 (so that it converts to a float
+without rounding, as it does in Python's int / int).
+"""
+import numpy as np
+
+
+def generate_layout(tree, rect, min_area=0):
+    """Run the treemap algorithm on <tree> and return the same records as
+    tree.generate_layout(rect, None, min_area): (rect, colour, leaf) for
+    every leaf (or aggregate) drawn, in the same order.
+
+    @type tree: AbstractTree
+    @type rect: (int, int, int, int)
+    @type min_area: int
+    @rtype: list[((int, int, int, int), (int, int, int), AbstractTree)]
+    """
+    if tree.is_empty() or tree.data_size == 0:
+        return []
+    nodes, order, x, y, width, height = _place(tree, rect, min_area)
+    leaf_nodes = [nodes[i] for i in order.tolist()]
+    packed = np.array([leaf.packed_colour for leaf in leaf_nodes],
+                      dtype=np.int64)
+    rects = zip(x.tolist(), y.tolist(), width.tolist(), height.tolist())
+    colours = zip((packed >> 16).tolist(), ((packed >> 8) & 0xFF).tolist(),
+                  (packed & 0xFF).tolist())
+    return list(zip(rects, colours, leaf_nodes))
+
+
+def treemap_arrays(tree, rect, min_area=0):
+    """Run the treemap algorithm on <tree> and return the rectangles of
+    tree.generate_treemap(rect, None, min_area) as arrays, in the same
+    order: their x, y, width, height and colour (packed as 0xRRGGBB).
+
+    No Python object is made per rectangle, so the result can be drawn
+    with raster.fill_arrays without any conversion.
+
+    @type tree: AbstractTree
+    @type rect: (int, int, int, int)
+    @type min_area: int
+    @rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray,
+             numpy.ndarray)
+    """
+    if tree.is_empty() or tree.data_size <= 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, empty, empty
+    nodes, order, x, y, width, height = _place(tree, rect, min_area)
+    colour = np.fromiter((nodes[i].packed_colour for i in order.tolist()),
+                         dtype=np.int64, count=len(order))
+    return x, y, width, height, colour
+
+
+def generate_treemap(tree, rect, min_area=0):
+    """Return the same rectangles and colours as
+    tree.generate_treemap(rect, None, min_area).
+
+    @type tree: AbstractTree
+    @type rect: (int, int, int, int)
+    @type min_area: int
+    @rtype: list[((int, int, int, int), (int, int, int))]
+    """
+    return [(leaf_rect, colour)
+            for leaf_rect, colour, _ in generate_layout(tree, rect, min_area)]
+
+
+def _place(tree, rect, min_area):
+    """Lay out <tree> in <rect>, and return the nodes reached, with the
+    indices of those drawn in drawing order and the x, y, width and height
+    of each of them.
+
+    The tree is laid out one level at a time. Only the subtrees of nodes
+    covering at least <min_area> pixels are put in the next level, so
+    smaller nodes are drawn as aggregates (or not at all if they cover no
+    pixels and <min_area> is positive) and nothing below them is visited.
+
+    @type tree: AbstractTree
+    @type rect: (int, int, int, int)
+    @type min_area: int
+    @rtype: (list[AbstractTree], numpy.ndarray, numpy.ndarray,
+             numpy.ndarray, numpy.ndarray, numpy.ndarray)
+    """
+    nodes = [tree]
+    levels = [(0, 1)]
+    parents = [np.array([-1], dtype=np.int64)]
+    sizes = [np.array([tree.data_size], dtype=np.float64)]
+    xs, ys, widths, heights = ([np.array([value], dtype=np.int64)]
+                               for value in rect)
+    while True:
+        start, end = levels[-1]
+        if min_area > 0:
+            divided = np.flatnonzero(widths[-1] * heights[-1] >= min_area)
+        else:
+            divided = np.arange(end - start)
+        parent = []
+        for i in divided.tolist():
+            children = [subtree for subtree in nodes[start + i].get_subtrees()
+                        if not subtree.is_empty() and
+                        subtree.data_size != 0]
+            nodes.extend(children)
+            parent.extend([i] * len(children))
+        if not parent:
+            break
+        levels.append((end, len(nodes)))
+
+        # the rectangles of the new level, from those of their parents
+        p = np.array(parent, dtype=np.int64)
+        first, last = _group_bounds(p)
+        vertical = widths[-1][p] > heights[-1][p]
+        extent = np.where(vertical, widths[-1][p], heights[-1][p])
+        size = np.array([node.data_size for node in nodes[end:]],
+                        dtype=np.float64)
+        strip = np.floor(size / sizes[-1][p] * extent).astype(np.int64)
+        offset = _exclusive_cumsum(strip, first)
+        strip[last] = extent[last] - offset[last]
+        xs.append(xs[-1][p] + np.where(vertical, offset, 0))
+        ys.append(ys[-1][p] + np.where(vertical, 0, offset))
+        widths.append(np.where(vertical, strip, widths[-1][p]))
+        heights.append(np.where(vertical, heights[-1][p], strip))
+        parents.append(p + start)
+        sizes.append(size)
+
+    parent = np.concatenate(parents)
+    x, y, width, height = (np.concatenate(values)
+                           for values in (xs, ys, widths, heights))
+    n = len(nodes)
+    drawn = np.bincount(parent[1:], minlength=n) == 0
+    if min_area > 0:
+        drawn &= (width > 0) & (height > 0)
+
+    # the number of rectangles drawn for each node, from the bottom level up
+    drawn_count = drawn.astype(np.int64)
+    for start, end in reversed(levels[1:]):
+        drawn_count += np.bincount(parent[start:end],
+                                   weights=drawn_count[start:end],
+                                   minlength=n).astype(np.int64)
+    # where the first rectangle of each node goes in the result
+    position = np.zeros(n, dtype=np.int64)
+    for start, end in levels[1:]:
+        p = parent[start:end]
+        first, _ = _group_bounds(p)
+        position[start:end] = position[p] + \
+            _exclusive_cumsum(drawn_count[start:end], first)
+
+    leaves = np.flatnonzero(drawn)
+    order = np.empty(len(leaves), dtype=np.int64)
+    order[position[leaves]] = leaves
+    return nodes, order, x[order], y[order], width[order], height[order]
+
+
+def _group_bounds(parent):
+    """Return boolean masks of the first and last child of each parent in
+    <parent>, whose equal values are next to each other.
+
+    @type parent: numpy.ndarray
+    @rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    change = parent[1:] != parent[:-1]
+    first = np.concatenate(([True], change))
+    last = np.concatenate((change, [True]))
+    return first, last
+
+
+def _exclusive_cumsum(values, first):
+    """Return, for each element of <values>, the sum of the elements before
+    it in the same group. A group starts wherever <first> is True.
+
+    @type values: numpy.ndarray
+    @type first: numpy.ndarray
+    @rtype: numpy.ndarray
+    """
+    total = np.cumsum(values)
+    before = total - values
+    starts = np.flatnonzero(first)
+    lengths = np.diff(np.append(starts, len(values)))
+    return before - np.repeat(before[starts], lengths)
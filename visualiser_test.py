@@ -0,0 +1,247 @@
+"""Tests for treemap_visualiser.
+
+=== Module Description ===
+These tests draw into an offscreen display (SDL's dummy video driver), and
+check that the treemap redrawn incrementally by a TreemapCanvas has the same
+pixels as one drawn from scratch.
+"""
+import math
+import os
+
+import unittest
+from hypothesis import given, settings
+from hypothesis.strategies import integers, lists
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+import pygame
+
+from compact_tree import CompactTree
+from population import PopulationTree
+from tree_fixtures import make_tree
+from treemap_visualiser import FrameCounters, TreemapCanvas, draw_treemap, \
+    event_loop, render_display, HEIGHT, MIN_AREA, TREEMAP_HEIGHT, WIDTH
+
+
+class TreemapCanvasTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pygame.init()
+
+    @settings(max_examples=30)
+    @given(integers(min_value=1, max_value=60),
+           lists(integers(min_value=0, max_value=1000), max_size=8))
+    def test_same_pixels_as_full_redraw(self, seed, edits):
+        tree = make_tree(seed)
+        canvas = TreemapCanvas()
+        canvas.update(tree)
+        for edit in edits:
+            leaves = tree.generate_leafmap((0, 0, WIDTH, TREEMAP_HEIGHT))
+            if not leaves:
+                break
+            leaf = leaves[edit % len(leaves)]
+            if edit % 3 == 0:
+                leaf.delete_leaf()
+            else:
+                for _ in range(edit % 40):
+                    leaf.increase_data_size()
+            canvas.update(tree)
+        fresh = TreemapCanvas()
+        fresh.update(tree)
+        self.assertEqual(pygame.image.tostring(canvas.surface, 'RGB'),
+                         pygame.image.tostring(fresh.surface, 'RGB'))
+
+    def test_unchanged_tree(self):
+        tree = make_tree(8)
+        canvas = TreemapCanvas()
+        self.assertEqual(canvas.update(tree), (0, 0, WIDTH, TREEMAP_HEIGHT))
+        self.assertIsNone(canvas.update(tree))
+
+    def test_change_is_local(self):
+        tree = make_tree(30)
+        canvas = TreemapCanvas()
+        canvas.update(tree)
+        rect, _, leaf = tree.generate_layout((0, 0, WIDTH,
+                                              TREEMAP_HEIGHT))[3]
+        leaf.colour = (1, 2, 3)
+        self.assertEqual(canvas.update(tree), rect)
+
+    @given(integers(min_value=1, max_value=60))
+    def test_bulk_draw_same_as_canvas(self, seed):
+        tree = make_tree(seed)
+        canvas = TreemapCanvas()
+        canvas.update(tree)
+        surface = pygame.Surface((WIDTH, TREEMAP_HEIGHT))
+        draw_treemap(surface, tree)
+        self.assertEqual(pygame.image.tostring(surface, 'RGB'),
+                         pygame.image.tostring(canvas.surface, 'RGB'))
+
+    def test_compact_tree_drawn_the_same(self):
+        tree = make_tree(12)
+        expected = pygame.Surface((WIDTH, TREEMAP_HEIGHT))
+        draw_treemap(expected, tree)
+        surface = pygame.Surface((WIDTH, TREEMAP_HEIGHT))
+        draw_treemap(surface, CompactTree.from_tree(tree))
+        self.assertEqual(pygame.image.tostring(surface, 'RGB'),
+                         pygame.image.tostring(expected, 'RGB'))
+
+    def test_render_display(self):
+        screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        tree = make_tree(12)
+        canvas = TreemapCanvas()
+        render_display(screen, tree, 'text', None, canvas)
+        on_screen = screen.subsurface((0, 0, WIDTH, TREEMAP_HEIGHT))
+        self.assertEqual(pygame.image.tostring(on_screen, 'RGB'),
+                         pygame.image.tostring(canvas.surface, 'RGB'))
+
+
+class EventLoopTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pygame.init()
+
+    def setUp(self):
+        self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        pygame.event.clear()
+
+    def test_waiting_events_share_one_frame(self):
+        tree = make_tree(12)
+        canvas = _CountingCanvas()
+        render_display(self.screen, tree, '', None, canvas)
+        leaf = tree.find_leaf((1, 1), WIDTH, TREEMAP_HEIGHT)
+        size = leaf.data_size
+        for _ in range(5):
+            size += math.ceil(size * 0.01)
+        pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONUP,
+                                             button=1, pos=(1, 1)))
+        for _ in range(5):
+            pygame.event.post(pygame.event.Event(pygame.KEYUP,
+                                                 key=pygame.K_UP))
+        # the window is closed once the first frame is drawn
+        pygame.time.set_timer(pygame.QUIT, 50, 1)
+        counters = event_loop(self.screen, tree, canvas=canvas)
+        self.assertEqual(leaf.data_size, size)
+        self.assertEqual(canvas.updates, 2)
+        self.assertEqual(counters.frames, 1)
+        self.assertEqual(counters.events, 6)
+        self.assertEqual(counters.most_events, 6)
+
+    def test_shift_right_click_deletes_folder(self):
+        tree = make_tree(12)
+        pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONUP,
+                                             button=1, pos=(1, 1)))
+        pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONUP,
+                                             button=3, pos=(1, 1)))
+        leaf = tree.find_leaf((1, 1), WIDTH, TREEMAP_HEIGHT)
+        region = leaf.get_parent()
+        size = tree.data_size - region.data_size
+        pygame.time.set_timer(pygame.QUIT, 50, 1)
+        pygame.key.set_mods(pygame.KMOD_SHIFT)
+        try:
+            event_loop(self.screen, tree)
+        finally:
+            pygame.key.set_mods(pygame.KMOD_NONE)
+        self.assertTrue(region.is_empty())
+        self.assertFalse(leaf.is_empty())
+        self.assertEqual(tree.data_size, size)
+
+    def test_aggregate_is_selected_but_not_changed(self):
+        tree, aggregate = _tree_with_aggregate()
+        corner = (WIDTH - 1, TREEMAP_HEIGHT - 1)
+        self.assertIs(tree.find_leaf(corner, WIDTH, TREEMAP_HEIGHT, None,
+                                     MIN_AREA), aggregate)
+        pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONUP,
+                                             button=1, pos=corner))
+        pygame.event.post(pygame.event.Event(pygame.KEYUP,
+                                             key=pygame.K_UP))
+        pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONUP,
+                                             button=3, pos=corner))
+        size = tree.data_size
+        pygame.time.set_timer(pygame.QUIT, 50, 1)
+        event_loop(self.screen, tree)
+        self.assertFalse(aggregate.is_empty())
+        self.assertEqual(tree.data_size, size)
+        self.assertEqual([leaf.data_size for leaf
+                          in aggregate.get_non_empty_leaves()], [1, 1])
+
+    def test_shift_right_click_deletes_aggregate(self):
+        tree, aggregate = _tree_with_aggregate()
+        column = aggregate.get_parent()
+        corner = (WIDTH - 1, TREEMAP_HEIGHT - 1)
+        pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONUP,
+                                             button=3, pos=corner))
+        size = tree.data_size - aggregate.data_size
+        pygame.time.set_timer(pygame.QUIT, 50, 1)
+        pygame.key.set_mods(pygame.KMOD_SHIFT)
+        try:
+            event_loop(self.screen, tree)
+        finally:
+            pygame.key.set_mods(pygame.KMOD_NONE)
+        self.assertTrue(aggregate.is_empty())
+        self.assertFalse(column.is_empty())
+        self.assertEqual(tree.data_size, size)
+
+    def test_compact_tree(self):
+        tree = CompactTree.from_tree(make_tree(12))
+        pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONUP,
+                                             button=1, pos=(1, 1)))
+        pygame.event.post(pygame.event.Event(pygame.KEYUP,
+                                             key=pygame.K_UP))
+        pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONUP,
+                                             button=3, pos=(1, 1)))
+        leaf = tree.find_leaf((1, 1), WIDTH, TREEMAP_HEIGHT, None, MIN_AREA)
+        size = tree.data_size - leaf.data_size
+        pygame.time.set_timer(pygame.QUIT, 50, 1)
+        event_loop(self.screen, tree)
+        self.assertTrue(leaf.is_empty())
+        self.assertEqual(tree.data_size, size)
+
+    def test_quit(self):
+        pygame.event.post(pygame.event.Event(pygame.QUIT))
+        counters = event_loop(self.screen, make_tree(3))
+        self.assertEqual(counters.frames, 0)
+        self.assertEqual(counters.stats(), '0 frames')
+
+    def test_counters(self):
+        counters = FrameCounters()
+        counters.record(3, 0.002)
+        counters.record(1, 0.004)
+        self.assertEqual((counters.frames, counters.events,
+                          counters.most_events), (2, 4, 3))
+        self.assertEqual(counters.longest, 0.004)
+        self.assertEqual(counters.stats(),
+                         '2 frames, 2.00 events per frame (at most 3), '
+                         '3.00 ms per frame (at most 4.00 ms)')
+
+
+##############################################################################
+# Helpers
+##############################################################################
+class _CountingCanvas(TreemapCanvas):
+    """A TreemapCanvas that counts its updates."""
+    def __init__(self):
+        TreemapCanvas.__init__(self)
+        self.updates = 0
+
+    def update(self, tree, engine=None):
+        self.updates += 1
+        return TreemapCanvas.update(self, tree, engine)
+
+
+def _tree_with_aggregate():
+    """Return a tree, and the subtree of it that is drawn as an aggregate in
+    the bottom right corner of the treemap.
+
+    @rtype: (PopulationTree, PopulationTree)
+    """
+    aggregate = PopulationTree(False, 'tiny', [
+        PopulationTree(False, 't1', None, 1),
+        PopulationTree(False, 't2', None, 1)])
+    column = PopulationTree(False, 'column', [
+        PopulationTree(False, 'c', None, 1000), aggregate])
+    tree = PopulationTree(False, 'World', [
+        PopulationTree(False, 'big', None, 1000 * 1002), column])
+    return tree, aggregate
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
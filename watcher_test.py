@@ -0,0 +1,155 @@
+"""Tests for fs_watcher.
+
+=== Module Description ===
+These tests change files in a temporary folder and check that
+PollingWatcher reports the changes and patches them into the tree, so that
+it matches a fresh scan.
+"""
+import os
+import shutil
+import tempfile
+
+import unittest
+
+from fs_watcher import PollingWatcher, CREATED, DELETED, RESIZED
+from tree_data import FileSystemTree
+
+
+class PollingWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.top = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.top, 'sub'))
+        _write(os.path.join(self.top, 'a.txt'), 3)
+        _write(os.path.join(self.top, 'sub', 'b.txt'), 5)
+        self.tree = FileSystemTree.from_path(self.top)
+        self.watcher = PollingWatcher(self.tree, self.top)
+
+    def tearDown(self):
+        shutil.rmtree(self.top)
+
+    def _check_matches_disk(self):
+        self.assertEqual(_live_shape(self.tree),
+                         _live_shape(FileSystemTree(self.top)))
+
+    def test_no_changes(self):
+        self.assertEqual(self.watcher.update(), [])
+
+    def test_created_file(self):
+        path = os.path.join(self.top, 'sub', 'c.txt')
+        _write(path, 7)
+        self.assertEqual(self.watcher.update(), [(CREATED, path, 7)])
+        self.assertEqual(self.tree.data_size, 15)
+        self._check_matches_disk()
+        self.assertEqual(self.watcher.update(), [])
+
+    def test_created_folder(self):
+        os.mkdir(os.path.join(self.top, 'new'))
+        _write(os.path.join(self.top, 'new', 'd.txt'), 11)
+        self.watcher.update()
+        self.assertEqual(self.tree.data_size, 19)
+        self._check_matches_disk()
+
+        # files in the new folder are tracked too
+        _write(os.path.join(self.top, 'new', 'd.txt'), 1)
+        self.watcher.update()
+        self.assertEqual(self.tree.data_size, 9)
+
+    def test_deleted_file(self):
+        path = os.path.join(self.top, 'a.txt')
+        os.remove(path)
+        self.assertEqual(self.watcher.update(), [(DELETED, path, None)])
+        self.assertEqual(self.tree.data_size, 5)
+        self._check_matches_disk()
+
+    def test_deleted_folder(self):
+        shutil.rmtree(os.path.join(self.top, 'sub'))
+        self.watcher.update()
+        self.assertEqual(self.tree.data_size, 3)
+        self._check_matches_disk()
+
+    def test_emptied_folder_refilled(self):
+        os.remove(os.path.join(self.top, 'sub', 'b.txt'))
+        self.watcher.update()
+        self.assertEqual(self.tree.data_size, 3)
+        _write(os.path.join(self.top, 'sub', 'c.txt'), 7)
+        self.watcher.update()
+        self.assertEqual(self.tree.data_size, 10)
+        self._check_matches_disk()
+
+    def test_resized_file(self):
+        path = os.path.join(self.top, 'sub', 'b.txt')
+        _write(path, 50)
+        self.assertEqual(self.watcher.update(), [(RESIZED, path, 50)])
+        self.assertEqual(self.tree.data_size, 53)
+        self.assertEqual(self.tree._subtrees[0].data_size +
+                         self.tree._subtrees[1].data_size, 53)
+
+    def test_folder_replaced_by_file(self):
+        folder = os.path.join(self.top, 'sub')
+        shutil.rmtree(folder)
+        _write(folder, 7)
+        self.assertEqual(self.watcher.update(), [(DELETED, folder, None),
+                                                 (CREATED, folder, 7)])
+        self.assertEqual(self.tree.data_size, 10)
+        self._check_matches_disk()
+        _write(folder, 8)
+        self.assertEqual(self.watcher.update(), [(RESIZED, folder, 8)])
+
+    def test_file_replaced_by_folder(self):
+        path = os.path.join(self.top, 'a.txt')
+        os.remove(path)
+        os.mkdir(path)
+        _write(os.path.join(path, 'c.txt'), 7)
+        self.assertEqual(self.watcher.update(), [(DELETED, path, None),
+                                                 (CREATED, path, None)])
+        self.assertEqual(self.tree.data_size, 12)
+        self._check_matches_disk()
+        _write(os.path.join(path, 'c.txt'), 1)
+        self.watcher.update()
+        self.assertEqual(self.tree.data_size, 6)
+
+    def test_folder_gone_before_listing(self):
+        folder = os.path.join(self.top, 'sub')
+        # changed since the last poll, then replaced by a file
+        self.watcher._folders[folder] = (0, self.watcher._folders[folder][1])
+        shutil.rmtree(folder)
+        _write(folder, 7)
+        self.watcher.update()
+        self._check_matches_disk()
+
+    def test_poll_does_not_modify_tree(self):
+        _write(os.path.join(self.top, 'e.txt'), 13)
+        events = self.watcher.poll()
+        self.assertEqual(self.tree.data_size, 8)
+        self.watcher.apply(events)
+        self.assertEqual(self.tree.data_size, 21)
+
+
+##############################################################################
+# Helpers
+##############################################################################
+def _write(path, size):
+    """Write a file of <size> bytes at <path>.
+
+    @type path: str
+    @type size: int
+    @rtype: None
+    """
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+
+
+def _live_shape(tree):
+    """Return the names and sizes of the non-empty nodes of <tree> as
+    nested tuples, with subtrees sorted by name.
+
+    @type tree: AbstractTree
+    @rtype: tuple
+    """
+    return (tree.get_root(), tree.data_size,
+            sorted(_live_shape(subtree) for subtree in tree._subtrees
+                   if not subtree.is_empty()))
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)